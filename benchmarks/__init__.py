@@ -0,0 +1 @@
+"""Benchmarks of zdeploy's hot paths; run with ``python -m benchmarks.run``."""
@@ -0,0 +1,43 @@
+"""Compare two benchmark result files.
+
+Usage: ``python -m benchmarks.compare baseline.json candidate.json``.
+"""
+
+from argparse import ArgumentParser
+from json import loads
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+def _medians(path: str) -> Dict[str, float]:
+    """Return the median time of every benchmark in the result file at ``path``."""
+
+    report: Dict[str, Any] = loads(Path(path).read_text(encoding="utf-8"))
+    return {
+        name: result["median"]
+        for name, result in report["results"].items()
+        if "median" in result
+    }
+
+
+def main(argv: List[str] | None = None) -> None:
+    """Print the median time of each benchmark in both files and their ratio."""
+
+    parser = ArgumentParser(prog="python -m benchmarks.compare")
+    parser.add_argument("baseline", help="Result file of the reference run")
+    parser.add_argument("candidate", help="Result file of the run to compare")
+    args = parser.parse_args(argv)
+
+    baseline = _medians(args.baseline)
+    candidate = _medians(args.candidate)
+    names = [name for name in baseline if name in candidate]
+    width = max((len(name) for name in names), default=0)
+    print(f"{'benchmark':<{width}}  {'baseline':>10}  {'candidate':>10}  {'ratio':>7}")
+    for name in names:
+        before, after = baseline[name], candidate[name]
+        ratio = f"{after / before:.2f}x" if before else "-"
+        print(f"{name:<{width}}  {before:>10.4f}  {after:>10.4f}  {ratio:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""In-process SSH server stand-in accepting exec and SCP uploads."""
+# pylint: disable=too-many-instance-attributes
+
+from threading import Event, Lock, Thread
+from typing import Dict, List, Set
+import re
+import socket
+import time
+
+from paramiko import RSAKey, ServerInterface, Transport
+from paramiko.channel import Channel
+from paramiko.common import AUTH_SUCCESSFUL, OPEN_SUCCEEDED
+
+
+class _Interface(ServerInterface):
+    """Accept any password and hand exec requests to the server."""
+
+    def __init__(self, server: "FakeSSHServer") -> None:
+        self.server = server
+
+    def get_allowed_auths(self, username: str) -> str:
+        return "password"
+
+    def check_auth_password(self, username: str, password: str) -> int:
+        return AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        return OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel: Channel, command: bytes) -> bool:
+        Thread(
+            target=self.server.handle, args=(channel, command.decode()), daemon=True
+        ).start()
+        return True
+
+
+class FakeSSHServer:
+    """SSH server on localhost that pretends to run whatever it is asked to.
+
+    Every command succeeds without output after ``latency`` seconds, the
+    simulated round trip time, except those containing one of the strings
+    in ``failing``, which exit with status 1. Commands reading stdin (``tar -x``,
+    ``xargs``, ``cat >``) consume it, files written with ``cat > path``
+    (delta-sync manifests, deployment markers) are served back by
+    ``cat path`` and ``grep -sH`` until removed by ``rm -f``, and ``scp -t`` speaks
+    the sink side of the SCP protocol, paying ``latency`` for every
+    acknowledgement. Received data is counted and discarded.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        """Create a server simulating ``latency`` seconds per round trip."""
+
+        self.latency = latency
+        self.host_key = RSAKey.generate(1024)
+        self.commands: List[str] = []
+        self.failing: Set[str] = set()
+        self.bytes_received = 0
+        self.files_received = 0
+        self._files: Dict[str, bytes] = {}
+        self._lock = Lock()
+        self._stopped = Event()
+        self._transports: List[Transport] = []
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self.port: int = self._socket.getsockname()[1]
+        self._thread = Thread(target=self._accept, daemon=True)
+
+    def __enter__(self) -> "FakeSSHServer":
+        """Start serving and return the server."""
+
+        self._socket.listen(64)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Stop serving and close every connection."""
+
+        self._stopped.set()
+        self._socket.close()
+        with self._lock:
+            transports = list(self._transports)
+        for transport in transports:
+            transport.close()
+
+    def _accept(self) -> None:
+        """Accept connections until stopped."""
+
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            transport = Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=_Interface(self))
+            with self._lock:
+                self._transports.append(transport)
+            Thread(target=self._serve, args=(transport,), daemon=True).start()
+
+    @staticmethod
+    def _serve(transport: Transport) -> None:
+        """Accept the channels of ``transport``; exec requests do the rest."""
+
+        # Channels close when garbage collected: hold on to them.
+        channels = []
+        while transport.is_active():
+            channel = transport.accept(timeout=1)
+            if channel is not None:
+                channels.append(channel)
+            channels = [channel for channel in channels if not channel.closed]
+
+    def stored(self, path: str) -> bytes | None:
+        """Return the data written to ``path`` with ``cat >``, if it is still there."""
+
+        with self._lock:
+            return self._files.get(path)
+
+    def handle(self, channel: Channel, command: str) -> None:
+        """Pretend to run ``command`` on ``channel``."""
+
+        with self._lock:
+            self.commands.append(command)
+        time.sleep(self.latency)
+        rc = 0
+        try:
+            if any(pattern in command for pattern in self.failing):
+                rc = 1
+            elif re.match(r"scp( -\w+)* -t", command):
+                self._scp_sink(channel)
+            elif "tar -x" in command or "xargs" in command or "cat >" in command:
+                data = self._read_stdin(channel)
+                target = re.search(r"cat > (\S+)", command)
+                if target is not None:
+                    with self._lock:
+                        self._files[target.group(1).strip("'")] = data
+            elif command.startswith("rm -f "):
+                with self._lock:
+                    for path in command.split()[2:]:
+                        self._files.pop(path.strip("'"), None)
+            elif "grep -sH" in command:
+                channel.sendall(self._grep(command))
+            elif "&& cat " in command:
+                path = command.rsplit("cat ", 1)[1].strip().strip("'")
+                with self._lock:
+                    data = self._files.get(path)
+                if data is None:
+                    rc = 1
+                else:
+                    channel.sendall(data)
+        finally:
+            channel.send_exit_status(rc)
+            channel.close()
+
+    def _grep(self, command: str) -> bytes:
+        """Answer ``cd <dir> && grep -sH '' -- <names>`` from the stored files."""
+
+        directory = command.split("cd ", 1)[1].split()[0].strip("'")
+        names = [name.strip("'") for name in command.split(" -- ", 1)[1].split()]
+        with self._lock:
+            found = [(name, self._files.get(f"{directory}/{name}")) for name in names]
+        return b"".join(name.encode() + b":" + data for name, data in found if data is not None)
+
+    def _read_stdin(self, channel: Channel) -> bytes:
+        """Return everything sent to ``channel`` until end of file."""
+
+        chunks = []
+        while True:
+            chunk = channel.recv(1 << 16)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        data = b"".join(chunks)
+        with self._lock:
+            self.bytes_received += len(data)
+        return data
+
+    def _ack(self, channel: Channel) -> None:
+        """Acknowledge an SCP message after one simulated round trip."""
+
+        time.sleep(self.latency)
+        channel.sendall(b"\0")
+
+    def _scp_sink(self, channel: Channel) -> None:
+        """Receive files over the SCP protocol and discard them."""
+
+        reader = channel.makefile("rb")
+        self._ack(channel)
+        while True:
+            header = reader.readline()
+            if not header:
+                return
+            kind = header[:1]
+            if kind == b"C":
+                size = int(header.split(b" ", 2)[1])
+                self._ack(channel)
+                remaining = size
+                while remaining > 0:
+                    chunk = reader.read(min(remaining, 1 << 16))
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+                reader.read(1)  # Trailing status byte.
+                with self._lock:
+                    self.bytes_received += size
+                    self.files_received += 1
+            self._ack(channel)
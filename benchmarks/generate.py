@@ -0,0 +1,143 @@
+"""Generator of synthetic recipe trees and configs."""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+
+@dataclass
+class Scale:
+    """Sizes of the generated workloads."""
+
+    chain_depth: int = 50
+    fan_out: int = 100
+    diamond_layers: int = 6
+    diamond_width: int = 8
+    small_files: int = 2000
+    large_files: int = 2
+    large_file_size: int = 64 << 20
+
+
+SCALES = {
+    "tiny": Scale(5, 5, 2, 2, 20, 1, 1 << 20),
+    "small": Scale(20, 25, 4, 4, 500, 1, 16 << 20),
+    "medium": Scale(),
+    "large": Scale(200, 500, 10, 16, 20000, 4, 256 << 20),
+}
+
+
+@dataclass
+class Workspace:
+    """A generated recipes directory and one config per workload."""
+
+    root: Path
+    recipes: Path
+    configs: Path
+    # Config name -> name of the recipe listed in its RECIPES.
+    workloads: Dict[str, str] = field(default_factory=dict)
+
+
+def _recipe(recipes: Path, name: str, requires: List[str] | None = None) -> Path:
+    """Create recipe ``name`` requiring ``requires`` and return its directory."""
+
+    path = recipes / name
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "run").write_text(f"#!/bin/sh\necho {name}\n")
+    (path / "run").chmod(0o755)
+    if requires:
+        (path / "require").write_text("".join(f"{req}\n" for req in requires))
+    return path
+
+
+def _config(
+    workspace: Workspace, workload: str, recipe: str, host: str, port: int
+) -> None:
+    """Write the config deploying ``recipe`` for ``workload``."""
+
+    variable = recipe.upper()
+    (workspace.configs / workload).write_text(
+        f"RECIPES=({variable})\n{variable}={host}\n{variable}_PORT={port}\n"
+    )
+    workspace.workloads[workload] = recipe
+
+
+def generate(root: Path, scale: Scale, host: str = "127.0.0.1", port: int = 22) -> Workspace:
+    """Generate every workload under ``root`` targeting ``host:port``.
+
+    * ``chain``: recipes each requiring the next, ``chain_depth`` deep.
+    * ``fan-out``: one recipe requiring ``fan_out`` independent recipes.
+    * ``diamond``: ``diamond_layers`` layers of ``diamond_width`` recipes,
+      each requiring every recipe of the layer below.
+    * ``small-files``: one recipe holding ``small_files`` small files
+      spread over nested directories.
+    * ``large-files``: one recipe holding ``large_files`` files of
+      ``large_file_size`` bytes.
+    """
+
+    workspace = Workspace(root, root / "recipes", root / "configs")
+    workspace.recipes.mkdir(parents=True, exist_ok=True)
+    workspace.configs.mkdir(parents=True, exist_ok=True)
+    _config(workspace, "chain", _chain(workspace.recipes, scale), host, port)
+    _config(workspace, "fan-out", _fan_out(workspace.recipes, scale), host, port)
+    _config(workspace, "diamond", _diamond(workspace.recipes, scale), host, port)
+    _config(workspace, "small-files", _small_files(workspace.recipes, scale), host, port)
+    _config(workspace, "large-files", _large_files(workspace.recipes, scale), host, port)
+    return workspace
+
+
+def _chain(recipes: Path, scale: Scale) -> str:
+    """Create the ``chain`` workload and return its root recipe."""
+
+    for depth in range(scale.chain_depth):
+        requires = [f"chain{depth + 1}"] if depth + 1 < scale.chain_depth else []
+        _recipe(recipes, f"chain{depth}", requires)
+    return "chain0"
+
+
+def _fan_out(recipes: Path, scale: Scale) -> str:
+    """Create the ``fan-out`` workload and return its root recipe."""
+
+    leaves = [f"leaf{i}" for i in range(scale.fan_out)]
+    for leaf in leaves:
+        _recipe(recipes, leaf)
+    _recipe(recipes, "fanout", leaves)
+    return "fanout"
+
+
+def _diamond(recipes: Path, scale: Scale) -> str:
+    """Create the ``diamond`` workload and return its root recipe."""
+
+    below: List[str] = []
+    for layer in range(scale.diamond_layers):
+        names = [f"diamond{layer}x{i}" for i in range(scale.diamond_width)]
+        for name in names:
+            _recipe(recipes, name, below)
+        below = names
+    _recipe(recipes, "diamond", below)
+    return "diamond"
+
+
+def _small_files(recipes: Path, scale: Scale) -> str:
+    """Create the ``small-files`` workload and return its root recipe."""
+
+    small = _recipe(recipes, "smallfiles")
+    for i in range(scale.small_files):
+        directory = small / f"d{i % 16}" / f"d{i % 7}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"f{i}.txt").write_text(f"file {i}\n" * 8)
+    return "smallfiles"
+
+
+def _large_files(recipes: Path, scale: Scale) -> str:
+    """Create the ``large-files`` workload and return its root recipe."""
+
+    large = _recipe(recipes, "largefiles")
+    block = bytes(range(256)) * 4096
+    for i in range(scale.large_files):
+        with open(large / f"blob{i}.bin", "wb") as fp:
+            remaining = scale.large_file_size
+            while remaining > 0:
+                fp.write(block[: min(remaining, len(block))])
+                remaining -= len(block)
+            fp.write(str(i).encode())
+    return "largefiles"
@@ -0,0 +1,186 @@
+"""Time zdeploy's hot paths on synthetic workloads and write the results as JSON.
+
+Usage: ``python -m benchmarks.run --scale small --output results.json``.
+Compare two result files with ``python -m benchmarks.compare``.
+"""
+
+from argparse import ArgumentParser, Namespace
+from dataclasses import asdict, replace
+from datetime import datetime, timezone
+from functools import partial
+from json import dumps
+from pathlib import Path
+from statistics import mean, median
+from subprocess import CalledProcessError, run as run_process
+from tempfile import TemporaryDirectory
+from typing import Any, Callable, Dict, List
+import logging
+import platform
+import time
+
+from benchmarks.fake_server import FakeSSHServer
+from benchmarks.generate import SCALES, Workspace, generate
+from zdeploy.app import _load_recipes, deploy
+from zdeploy.config import Config
+from zdeploy.hashing import HashCache
+from zdeploy.recipe import Recipe
+
+Results = Dict[str, Dict[str, Any]]
+
+
+def _time(function: Callable[[], object], repeat: int) -> Dict[str, Any]:
+    """Return timing statistics, in seconds, of ``repeat`` calls of ``function``."""
+
+    runs: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return {"min": min(runs), "median": median(runs), "mean": mean(runs), "runs": runs}
+
+
+def _root(workspace: Workspace, workload: str, cfg: Config, log: logging.Logger) -> Recipe:
+    """Return the recipe listed in ``workload``'s config."""
+
+    recipes = _load_recipes(workspace.configs / workload, log, cfg, HashCache())
+    name = workspace.workloads[workload]
+    return next(recipe for recipe in recipes if recipe.name == name)
+
+
+def bench_local(workspace: Workspace, cfg: Config, repeat: int, log: logging.Logger) -> Results:
+    """Time loading, requirement resolution and deep hashing of every workload."""
+
+    results: Results = {}
+    hashes = Path(cfg.cache) / "bench-hashes.json"
+    for workload in workspace.workloads:
+        config_path = workspace.configs / workload
+        results[f"load_recipes[{workload}]"] = _time(
+            partial(_load_recipes, config_path, log, cfg, HashCache()), repeat
+        )
+        root = _root(workspace, workload, cfg, log)
+        results[f"load_requirements[{workload}]"] = _time(root.load_requirements, repeat)
+        # Cold: every file is read. Warm: digests persisted by a previous run
+        # are reused for files whose metadata did not change.
+        results[f"deep_hash_cold[{workload}]"] = _time(
+            partial(_cold_hash, workspace, workload, cfg, log), repeat
+        )
+        _warm_hash(workspace, workload, cfg, log, hashes)
+        results[f"deep_hash_warm[{workload}]"] = _time(
+            partial(_warm_hash, workspace, workload, cfg, log, hashes), repeat
+        )
+    return results
+
+
+def _cold_hash(workspace: Workspace, workload: str, cfg: Config, log: logging.Logger) -> None:
+    """Deep hash ``workload`` without any cached file digest."""
+
+    _root(workspace, workload, cfg, log).deep_hash()
+
+
+def _warm_hash(
+    workspace: Workspace, workload: str, cfg: Config, log: logging.Logger, hashes: Path
+) -> None:
+    """Deep hash ``workload`` with file digests persisted at ``hashes``."""
+
+    cache = HashCache(hashes, cfg.hash_algorithm, cfg.hash_threads)
+    recipes = _load_recipes(workspace.configs / workload, log, cfg, cache)
+    for recipe in recipes:
+        recipe.deep_hash()
+    cache.save()
+
+
+def bench_deploy(
+    workspace: Workspace, cfg: Config, args: Namespace, log: logging.Logger, server: FakeSSHServer
+) -> Results:
+    """Time full deployments of every workload against ``server``."""
+
+    results: Results = {}
+    for upload in args.upload:
+        upload_cfg = replace(cfg, upload=upload)
+        for workload in workspace.workloads:
+            options = Namespace(force=True, jobs=args.jobs)
+            results[f"deploy[{workload},{upload}]"] = _time(
+                partial(deploy, workload, log, options, upload_cfg), args.repeat
+            )
+    # Nothing changed since the last deployment: everything is cached.
+    cached = Namespace(force=False, jobs=args.jobs)
+    for workload in workspace.workloads:
+        results[f"deploy_cached[{workload}]"] = _time(
+            partial(deploy, workload, log, cached, cfg), args.repeat
+        )
+    results["server"] = {
+        "commands": len(server.commands),
+        "files_received": server.files_received,
+        "bytes_received": server.bytes_received,
+    }
+    return results
+
+
+def _commit() -> str | None:
+    """Return the current git commit, if any."""
+
+    try:
+        process = run_process(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        )
+    except (OSError, CalledProcessError):
+        return None
+    return process.stdout.strip() or None
+
+
+def main(argv: List[str] | None = None) -> None:
+    """Run the benchmarks."""
+
+    parser = ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark")
+    parser.add_argument(
+        "--latency", type=float, default=0.002, help="Simulated round trip, in seconds"
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Recipes deployed concurrently")
+    parser.add_argument(
+        "--upload", nargs="+", default=["scp", "tar"], choices=["scp", "tar", "delta"]
+    )
+    parser.add_argument("--skip-deploy", action="store_true", help="Only run local benchmarks")
+    parser.add_argument("-o", "--output", help="JSON result file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    log = logging.getLogger("zdeploy-benchmarks")
+    log.addHandler(logging.NullHandler())
+    log.propagate = False
+
+    scale = SCALES[args.scale]
+    with TemporaryDirectory(prefix="zdeploy-bench-") as tmp, FakeSSHServer(args.latency) as server:
+        workspace = generate(Path(tmp), scale, port=server.port)
+        cfg = Config(
+            configs=str(workspace.configs),
+            recipes=str(workspace.recipes),
+            cache=str(Path(tmp) / "cache"),
+            logs=str(Path(tmp) / "logs"),
+            password="benchmark",
+            jobs=args.jobs,
+        )
+        results = bench_local(workspace, cfg, args.repeat, log)
+        if not args.skip_deploy:
+            results.update(bench_deploy(workspace, cfg, args, log, server))
+
+    report = {
+        "commit": _commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": {"name": args.scale, **asdict(scale)},
+        "latency": args.latency,
+        "jobs": args.jobs,
+        "repeat": args.repeat,
+        "results": results,
+    }
+    text = dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,44 @@
 import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from dataclasses import dataclass
+from pathlib import Path
+import pytest
+from benchmarks.fake_server import FakeSSHServer
+from benchmarks.generate import Scale, Workspace, generate
+from zdeploy.config import Config
+
+
+@dataclass
+class FakeSite:
+    """Generated workloads deployed to a fake SSH server."""
+
+    root: Path
+    server: FakeSSHServer
+    workspace: Workspace
+
+    def config(self, machine="", **overrides):
+        """Return a config deploying from ``machine``, each with its own cache and logs."""
+
+        base = self.root / machine
+        return Config(
+            configs=str(self.workspace.configs),
+            recipes=str(self.workspace.recipes),
+            cache=str(base / "cache"),
+            logs=str(base / "logs"),
+            password="test",
+            **overrides,
+        )
+
+
+@pytest.fixture
+def fake_site(tmp_path, request):
+    """Serve the benchmark workloads, by default tiny ones, from a fake SSH server.
+
+    Pass another ``Scale`` with ``@pytest.mark.parametrize(..., indirect=True)``.
+    """
+
+    scale = getattr(request, "param", Scale(3, 1, 1, 1, 1, 1, 1))
+    with FakeSSHServer() as server:
+        yield FakeSite(tmp_path, server, generate(tmp_path, scale, port=server.port))
@@ -1,8 +1,15 @@
+from argparse import Namespace
 import os
 from pathlib import Path
 import logging
-from zdeploy.app import _load_recipes
+import subprocess
+import sys
+import pytest
+from zdeploy.app import _load_recipes, _parse_hosts, _run_hash_scripts, deploy, show_plan
 from zdeploy.config import Config
+from zdeploy.hashing import HashCache
+from zdeploy.scheduler import Status
+from zdeploy.store import STORE_NAME, DeploymentStore, Record
 
 
 def test_load_recipes_override(tmp_path):
@@ -21,9 +28,151 @@ def test_load_recipes_override(tmp_path):
     log = logging.getLogger("test_override")
 
     recipes1 = _load_recipes(config1, log, cfg)
-    assert os.environ["RECIPES"] == "r1"
+    assert "RECIPES" not in os.environ
     assert [r.name for r in recipes1] == ["r1"]
 
     recipes2 = _load_recipes(config2, log, cfg)
-    assert os.environ["RECIPES"] == "r2"
+    assert "RECIPES" not in os.environ and "r1" not in os.environ
     assert [r.name for r in recipes2] == ["r2"]
+
+
+def _hash_script_config(tmp_path, script, **kwargs):
+    cfg = Config(
+        configs=str(tmp_path / "configs"), recipes=str(tmp_path / "recipes"), **kwargs
+    )
+    for name in ("r1", "r2", "base"):
+        (Path(cfg.recipes) / name).mkdir(parents=True)
+    for name in ("r1", "r2"):
+        (Path(cfg.recipes) / name / "require").write_text("base\n")
+    (Path(cfg.recipes) / "base" / "hash").write_text(script)
+    Path(cfg.configs).mkdir()
+    config = Path(cfg.configs) / "c1"
+    config.write_text("RECIPES=(r1 r2)\nr1=1.1.1.1\nr2=2.2.2.2\n")
+    return cfg, config
+
+
+def test_hash_scripts_run_once(tmp_path):
+    runs = tmp_path / "runs"
+    cfg, config = _hash_script_config(tmp_path, f"echo run >> {runs}\necho v1\n")
+    recipes = _load_recipes(config, logging.getLogger("test_hash"), cfg, HashCache())
+    # base is required on two hosts but its script runs only once.
+    _run_hash_scripts(recipes, cfg)
+    for recipe in recipes:
+        recipe.deep_hash()
+    assert runs.read_text() == "run\n"
+
+
+def test_hash_script_timeout(tmp_path):
+    cfg, config = _hash_script_config(tmp_path, "sleep 5\n", hash_timeout=1)
+    recipes = _load_recipes(config, logging.getLogger("test_hash"), cfg)
+    with pytest.raises(RuntimeError, match="hash script of base timed out"):
+        _run_hash_scripts(recipes, cfg)
+
+
+def test_load_recipes_fans_out_to_hosts(tmp_path):
+    cfg = Config(configs=str(tmp_path / "configs"), recipes=str(tmp_path / "recipes"))
+    Path(cfg.recipes).mkdir(parents=True)
+    (Path(cfg.recipes) / "agent").mkdir()
+    cfg_dir = Path(cfg.configs)
+    (cfg_dir / "hosts").mkdir(parents=True)
+    (cfg_dir / "hosts" / "fleet").write_text("h3  # rack 2\nh1\n\nh4\n")
+    config = cfg_dir / "c1"
+    config.write_text("RECIPES=(agent)\nagent=h1,h2 @hosts/fleet\n")
+
+    recipes = _load_recipes(config, logging.getLogger("test_fan_out"), cfg)
+    assert [(r.name, r.hostname) for r in recipes] == [
+        ("agent", "h1"), ("agent", "h2"), ("agent", "h3"), ("agent", "h4")
+    ]
+
+
+def test_hosts_files_including_each_other_fail(tmp_path):
+    (tmp_path / "a").write_text("h1\n@b\n")
+    (tmp_path / "b").write_text("h2\n@a\n")
+    (tmp_path / "shared").write_text("h3\n")
+    (tmp_path / "c").write_text("@shared\n@shared\n")
+    assert _parse_hosts(["@c", "@shared"], tmp_path) == ["h3"]
+    with pytest.raises(ValueError, match="include each other"):
+        _parse_hosts(["@a"], tmp_path)
+
+
+def test_empty_hosts_files_are_allowed(tmp_path):
+    (tmp_path / "fleet").write_text("# nothing yet\n")
+    assert _parse_hosts(["h1,@fleet"], tmp_path) == ["h1"]
+    with pytest.raises(RuntimeError, match="undefined host"):
+        _parse_hosts(["@fleet"], tmp_path)
+
+
+def test_show_plan_without_connecting(tmp_path, caplog):
+    cfg = Config(
+        configs=str(tmp_path / "configs"),
+        recipes=str(tmp_path / "recipes"),
+        cache=str(tmp_path / "cache"),
+    )
+    for name in ("r1", "r2"):
+        (Path(cfg.recipes) / name).mkdir(parents=True)
+    Path(cfg.configs).mkdir()
+    config = Path(cfg.configs) / "c1"
+    config.write_text("RECIPES=(r1 r2)\nr1=h1\nr2=h1\n")
+    log = logging.getLogger("test_plan")
+
+    r1 = next(r for r in _load_recipes(config, log, cfg, HashCache()) if r.name == "r1")
+    with DeploymentStore(Path(cfg.cache) / STORE_NAME) as store:
+        store.record(Record("c1", "d", "h1", "r1", r1.deep_hash(), Status.SUCCEEDED, 0, 90))
+        store.record(Record("c1", "d", "h1", "r2", "old", Status.SUCCEEDED, 0, 30))
+
+    with caplog.at_level(logging.INFO, logger="test_plan"):
+        show_plan("c1", log, Namespace(force=False), cfg)
+    assert "  cached  r1 on h1" in caplog.text
+    assert "  deploy  r2 on h1 (0h, 0m, and 30s)" in caplog.text
+    assert "1 task(s) to deploy, 1 cached" in caplog.text
+    assert "Predicted critical path: 0h, 0m, and 30s" in caplog.text
+
+
+CACHED_DEPLOY = """
+import logging, sys
+from argparse import Namespace
+import zdeploy
+assert "paramiko" not in sys.modules
+from zdeploy.app import deploy
+from zdeploy.config import Config
+cfg = Config(configs=sys.argv[1], recipes=sys.argv[2], cache=sys.argv[3], logs=sys.argv[4])
+deploy("chain", logging.getLogger("cached"), Namespace(force=False, jobs=2), cfg)
+assert "paramiko" not in sys.modules, "SSH stack imported"
+"""
+
+
+def test_cached_deploy_skips_ssh_stack(fake_site):
+    cfg = fake_site.config()
+    deploy("chain", logging.getLogger("test_app"), Namespace(force=False, jobs=2), cfg)
+    subprocess.run(
+        [sys.executable, "-c", CACHED_DEPLOY, cfg.configs, cfg.recipes, cfg.cache, cfg.logs],
+        cwd=Path(__file__).resolve().parent.parent,
+        check=True,
+    )
+
+
+def test_failed_recipe_skips_dependents_and_resumes(fake_site):
+    log = logging.getLogger("test_app")
+    server = fake_site.server
+    cfg = fake_site.config()
+    server.failing.add("/opt/chain1 && chmod +x ./run")
+    with pytest.raises(RuntimeError, match="1 recipe"):
+        deploy("chain", log, Namespace(force=False, jobs=2), cfg)
+    assert not any("/opt/chain0" in command for command in server.commands)
+    with DeploymentStore(Path(cfg.cache) / STORE_NAME) as store:
+        statuses = {
+            name: store.latest("127.0.0.1", name)[1] for name in ("chain0", "chain1", "chain2")
+        }
+    assert statuses == {
+        "chain0": Status.SKIPPED,
+        "chain1": Status.FAILED,
+        "chain2": Status.SUCCEEDED,
+    }
+
+    server.failing.clear()
+    commands = len(server.commands)
+    deploy("chain", log, Namespace(force=False, jobs=2), cfg)
+    new = server.commands[commands:]
+    assert any("/opt/chain0" in command for command in new)
+    assert any("/opt/chain1" in command for command in new)
+    assert not any("/opt/chain2" in command for command in new)
@@ -0,0 +1,25 @@
+import json
+import logging
+from argparse import Namespace
+import pytest
+from benchmarks.generate import Scale
+from zdeploy.app import deploy
+
+
+@pytest.mark.parametrize("fake_site", [Scale(3, 3, 2, 2, 10, 1, 1 << 16)], indirect=True)
+def test_deploy_against_fake_server(fake_site):
+    log = logging.getLogger("test-benchmarks")
+    server = fake_site.server
+    cfg = fake_site.config()
+    deploy("chain", log, Namespace(force=False, jobs=2), cfg)
+    commands = len(server.commands)
+    assert server.files_received > 0
+    assert any("chain2" in command for command in server.commands)
+    traces = list((fake_site.root / "logs" / "chain").glob("*.trace.json"))
+    assert len(traces) == 1
+    events = json.loads(traces[0].read_text())["traceEvents"]
+    names = {event["name"] for event in events}
+    assert {"load_config", "resolve", "connect", "upload", "run", "record"} <= names
+    # Deploying again changes nothing, so no command is sent.
+    deploy("chain", log, Namespace(force=False, jobs=2), cfg)
+    assert len(server.commands) == commands
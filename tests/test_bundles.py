@@ -0,0 +1,87 @@
+import io
+import os
+import tarfile
+from pathlib import Path
+from zdeploy.bundles import BundleCache
+from zdeploy.config import Config
+from zdeploy.hashing import HashCache
+from zdeploy.transfer import upload_tar
+from test_transfer import FakeSSH
+
+
+def _recipe(tmp_path):
+    src = tmp_path / "recipes" / "redis"
+    (src / "conf").mkdir(parents=True)
+    (src / "run").write_text("echo hi\n")
+    (src / "conf" / "redis.conf").write_text("port 6379\n")
+    config = tmp_path / "config"
+    config.write_text("A=1\n")
+    return src, config
+
+
+def _get(bundles, src, compression, hash_cache):
+    with bundles.get(src, compression, hash_cache) as archive:
+        return Path(archive.name)
+
+
+def test_bundle_is_packed_once_and_reused(tmp_path, monkeypatch):
+    src, config = _recipe(tmp_path)
+    bundles = BundleCache(tmp_path / "bundles", 1 << 20)
+    packed = []
+    pack = bundles._pack
+    monkeypatch.setattr(bundles, "_pack", lambda *args: (packed.append(args), pack(*args)))
+
+    hash_cache = HashCache()
+    paths = {_get(bundles, src, "gz", hash_cache) for _ in range(5)}
+    # A later run with a fresh hash cache finds the same archive.
+    paths.add(_get(bundles, src, "gz", HashCache()))
+    assert len(paths) == 1 and len(packed) == 1
+    with tarfile.open(paths.pop(), "r:gz") as archive:
+        names = set(archive.getnames())
+    assert {"./run", "./conf/redis.conf"} <= names and "config" not in names
+
+    (src / "run").write_text("echo changed\n")
+    changed = _get(bundles, src, "gz", HashCache())
+    assert len(packed) == 2 and changed.is_file()
+
+
+def test_least_recently_used_bundles_are_evicted(tmp_path):
+    src, config = _recipe(tmp_path)
+    (src / "blob").write_bytes(os.urandom(4096))
+    bundles = BundleCache(tmp_path / "bundles", 6000)
+    first = _get(bundles, src, "none", HashCache())
+    # Configs are not packed, so every config shares the archive.
+    config.write_text("A=2\n")
+    assert _get(bundles, src, "none", HashCache()) == first
+    os.utime(first, (1, 1))
+    (src / "run").write_text("echo changed\n")
+    second = _get(bundles, src, "none", HashCache())
+    assert second.is_file() and not first.is_file()
+
+
+def test_upload_tar_sends_bundle(tmp_path):
+    src, config = _recipe(tmp_path)
+    cfg = Config(cache=str(tmp_path / "cache"))
+    bundles = BundleCache.for_config(cfg)
+    assert bundles is BundleCache.for_config(cfg)
+    assert BundleCache.for_config(Config(bundle_cache_size=0)) is None
+
+    ssh = FakeSSH()
+    upload_tar(ssh, src, config, "/opt/redis", "gz", bundles, HashCache())
+    assert "tar -xzf - --no-same-owner -C /opt/redis" in ssh.channel.command
+    assert ssh.channel.command.endswith("&& printf %s 'A=1\n' > /opt/redis/config")
+    with tarfile.open(fileobj=io.BytesIO(ssh.channel.stream.data), mode="r:gz") as archive:
+        assert "./conf/redis.conf" in archive.getnames()
+
+
+def test_open_bundle_survives_eviction(tmp_path):
+    src, _ = _recipe(tmp_path)
+    (src / "blob").write_bytes(os.urandom(4096))
+    bundles = BundleCache(tmp_path / "bundles", 6000)
+    with bundles.get(src, "none", HashCache()) as first:
+        # Another upload packs a newer archive, evicting the one in use.
+        (src / "run").write_text("echo changed\n")
+        _get(bundles, src, "none", HashCache())
+        assert not Path(first.name).exists()
+        with tarfile.open(fileobj=first, mode="r:") as archive:
+            assert "./blob" in archive.getnames()
@@ -0,0 +1,38 @@
+import logging
+import zdeploy.clients as clients
+
+
+class FakeSSH:
+    connections = 0
+
+    def __init__(self, **kwargs):
+        FakeSSH.connections += 1
+        self.alive = True
+        self.closed = False
+
+    def get_transport(self):
+        return None
+
+    def is_alive(self):
+        return self.alive
+
+    def close(self):
+        self.closed = True
+
+
+def test_pool_reuses_and_reconnects(monkeypatch):
+    monkeypatch.setattr(clients, "SSH", FakeSSH)
+    FakeSSH.connections = 0
+    pool = clients.ConnectionPool(logging.getLogger("test_clients"))
+
+    first = pool.get("r1", "host", "root", None, 22)
+    assert pool.get("r2", "host", "root", None, 22) is first
+    assert pool.get("r3", "other", "root", None, 22) is not first
+    assert FakeSSH.connections == 2
+
+    first.alive = False
+    replacement = pool.get("r4", "host", "root", None, 22)
+    assert replacement is not first and first.closed
+
+    pool.close()
+    assert replacement.closed
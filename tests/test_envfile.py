@@ -0,0 +1,59 @@
+import pytest
+from zdeploy.envfile import EnvFile
+
+
+def test_parse_values_and_arrays():
+    env = EnvFile.parse(
+        "# comment\n"
+        "export RECIPES=(\n"
+        "  REDIS  # cache\n"
+        "  NODE NODE_EXPORTER\n"
+        ")\n"
+        "export REDIS=track.zgps.live\n"
+        "REDIS_PORT='2222'\n"
+        'REDIS_URL="redis://${REDIS}:\\$PORT" # trailing\n'
+        "NODE=${REDIS}\n"
+    )
+    assert env.array("RECIPES") == ("REDIS", "NODE", "NODE_EXPORTER")
+    assert env["RECIPES"] == "REDIS NODE NODE_EXPORTER"
+    assert env["REDIS_PORT"] == "2222"
+    assert env["REDIS_URL"] == "redis://track.zgps.live:$PORT"
+    assert env["NODE"] == "track.zgps.live"
+    with pytest.raises(TypeError):
+        env["NEW"] = "value"  # type: ignore[index]
+
+
+def test_prefix_index_uses_longest_recipe_name():
+    env = EnvFile.parse(
+        "REDIS=a\nREDIS_USER=u\nREDIS_CLUSTER=c\nREDISX=x\n"
+        "NODE=b\nNODE_PORT=1\nNODE_EXPORTER=c\nNODE_EXPORTER_PORT=2\n"
+    )
+    index = env.prefix_index(["REDIS", "REDIS_CLUSTER", "NODE", "NODE_EXPORTER"])
+    assert index["REDIS"] == {"REDIS_USER": "u"}
+    assert index["NODE"] == {"NODE_PORT": "1"}
+    assert index["NODE_EXPORTER"] == {"NODE_EXPORTER_PORT": "2"}
+
+
+def test_legacy_string_array():
+    env = EnvFile.parse('RECIPES="(A B)"\n')
+    assert env.array("RECIPES") == ("A", "B")
+
+
+def test_unparseable_lines_are_skipped_with_a_warning(caplog):
+    env = EnvFile.parse("A=1\nnot an assignment\nB='open\nC=3\n", "cfg")
+    assert dict(env) == {"A": "1", "C": "3"}
+    assert "cfg:2" in caplog.text
+    assert "cfg:3: unterminated single quote" in caplog.text
+
+
+def test_reference_defaults(monkeypatch):
+    monkeypatch.delenv("ZDEPLOY_UNSET", raising=False)
+    env = EnvFile.parse(
+        "EMPTY=\nHOST=a.example\n"
+        "A=${ZDEPLOY_UNSET:-fallback}\n"
+        "B=${EMPTY:-empty}\n"
+        'C="${HOST:-unused}:${ZDEPLOY_UNSET:-22}"\n'
+    )
+    assert env["A"] == "fallback"
+    assert env["B"] == "empty"
+    assert env["C"] == "a.example:22"
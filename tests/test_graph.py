@@ -0,0 +1,47 @@
+from pathlib import Path
+import logging
+import pytest
+from zdeploy.config import Config
+from zdeploy.graph import CycleError, DependencyGraph
+from zdeploy.recipe import Recipe
+
+
+def _make_recipes(tmp_path, requires):
+    cfg = Config(recipes=str(tmp_path / "recipes"))
+    for name, reqs in requires.items():
+        recipe_dir = Path(cfg.recipes) / name
+        recipe_dir.mkdir(parents=True)
+        (recipe_dir / "require").write_text("\n".join(reqs) + "\n")
+    return cfg
+
+
+def _recipe(name, cfg, graph):
+    log = logging.getLogger("test_graph")
+    return Recipe(name, None, Path("cfg"), "host", "user", None, 22, log, cfg, graph=graph)
+
+
+def test_diamond_is_deduplicated(tmp_path):
+    cfg = _make_recipes(
+        tmp_path, {"app": ["left", "right"], "left": ["base"], "right": ["base"], "base": ["curl"]}
+    )
+    graph = DependencyGraph(logging.getLogger("test_graph"))
+    app = graph.add(_recipe("app", cfg, graph))
+    order = [r.name for r in graph.topological_order()]
+    assert order == ["curl", "base", "left", "right", "app"]
+    assert [r.name for r in app.load_requirements()] == order[:-1]
+    base = next(r for r in graph if r.name == "base")
+    assert sorted(r.name for r in graph.dependents(base)) == ["left", "right"]
+
+
+def test_cycle_reports_path(tmp_path):
+    cfg = _make_recipes(tmp_path, {"a": ["b"], "b": ["c"], "c": ["a"]})
+    graph = DependencyGraph(logging.getLogger("test_graph"))
+    with pytest.raises(CycleError, match="a -> b -> c -> a"):
+        graph.add(_recipe("a", cfg, graph))
+
+
+def test_self_reference(tmp_path):
+    cfg = _make_recipes(tmp_path, {"a": ["a"]})
+    graph = DependencyGraph(logging.getLogger("test_graph"))
+    with pytest.raises(CycleError, match="a -> a"):
+        graph.add(_recipe("a", cfg, graph))
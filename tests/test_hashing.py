@@ -0,0 +1,74 @@
+from hashlib import md5, sha256
+from pathlib import Path
+import logging
+import pytest
+from zdeploy.config import Config
+from zdeploy.hashing import HashCache
+from zdeploy.recipe import Recipe
+
+
+def test_file_hash_persisted(tmp_path):
+    data = tmp_path / "data"
+    data.write_bytes(b"hello")
+    cache_path = tmp_path / "cache" / "hashes.json"
+
+    cache = HashCache(cache_path)
+    assert cache.file_hash(data) == md5(b"hello").hexdigest()
+    cache.save()
+    assert cache_path.is_file()
+
+    reloaded = HashCache(cache_path)
+    assert str(data) in reloaded._files
+    assert reloaded.file_hash(data) == md5(b"hello").hexdigest()
+
+
+def test_file_hash_detects_changes(tmp_path):
+    data = tmp_path / "data"
+    data.write_bytes(b"hello")
+    cache = HashCache()
+    cache.file_hash(data)
+    data.write_bytes(b"hello, world")
+    assert cache.file_hash(data) == md5(b"hello, world").hexdigest()
+
+
+def test_chunked_parallel_hashing(tmp_path):
+    files = []
+    for i in range(4):
+        path = tmp_path / f"file{i}"
+        path.write_bytes(bytes([i]) * (HashCache.CHUNK_SIZE * 2 + 7))
+        files.append(path)
+    cache = HashCache(algorithm="sha256", workers=4)
+    assert cache.file_hashes(files) == [sha256(p.read_bytes()).hexdigest() for p in files]
+
+
+def test_algorithm_change_discards_persisted_digests(tmp_path):
+    data = tmp_path / "data"
+    data.write_bytes(b"hello")
+    cache_path = tmp_path / "hashes.json"
+    cache = HashCache(cache_path)
+    cache.file_hash(data)
+    cache.save()
+    assert HashCache(cache_path)._files
+    assert not HashCache(cache_path, algorithm="blake2b")._files
+    with pytest.raises(ValueError):
+        HashCache(algorithm="nope")
+
+
+def _deep_hash(root, names):
+    cfg = Config(recipes=str(root))
+    recipe_dir = root / "app"
+    for name in names:
+        path = recipe_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("data\n")
+    log = logging.getLogger("test_hashing")
+    return Recipe("app", None, Path("cfg"), "host", "user", None, 22, log, cfg).deep_hash()
+
+
+def test_deep_hash_ignores_creation_order(tmp_path):
+    names = ["run", "b/x", "a", "b/y", "c"]
+    first = _deep_hash(tmp_path / "first", names)
+    assert first == _deep_hash(tmp_path / "second", list(reversed(names)))
+    # File names are hashed along with their contents.
+    renamed = ["run", "b/x", "d", "b/y", "c"]
+    assert first != _deep_hash(tmp_path / "renamed", renamed)
@@ -0,0 +1,50 @@
+import gzip
+import json
+import logging
+import os
+import time
+from zdeploy.config import Config
+from zdeploy.logs import DeploymentLog, apply_retention, log_context
+
+
+def test_deployment_log_files(tmp_path):
+    logger = logging.getLogger("test-logs")
+    logger.setLevel(logging.INFO)
+    cfg = Config(log_json=True, log_split="recipe")
+    for run in ("first", "second"):
+        directory = tmp_path / run
+        with DeploymentLog(logger, cfg, directory) as log:
+            logger.info("starting")
+            with log_context(host="10.0.0.1", recipe="redis"):
+                logger.info("redis: installed")
+        # The handlers never outlive the deployment.
+        assert logger.handlers == []
+
+    # Nothing is logged twice, although the logger was used before.
+    assert log.path.read_text().splitlines() == ["starting", "redis: installed"]
+    entries = [json.loads(line) for line in (directory / f"{log.stamp}.jsonl").open()]
+    assert entries[0] == {
+        "time": entries[0]["time"],
+        "level": "INFO",
+        "config": "test-logs",
+        "message": "starting",
+    }
+    assert entries[1]["host"] == "10.0.0.1" and entries[1]["recipe"] == "redis"
+    split = directory / log.stamp / "redis@10.0.0.1.log"
+    assert split.read_text() == "redis: installed\n"
+
+
+def test_apply_retention(tmp_path):
+    now = time.time()
+    old, older, current = tmp_path / "old.log", tmp_path / "older.log", tmp_path / "current.log"
+    for path, age in ((old, 2), (older, 40), (current, 0)):
+        path.write_text(path.name)
+        os.utime(path, (now - age * 86400, now - age * 86400))
+    (tmp_path / "empty").mkdir()
+
+    apply_retention(tmp_path, compress=True, max_age=30, before=now - 60)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["current.log", "old.log.gz"]
+    with gzip.open(tmp_path / "old.log.gz", "rt") as fp:
+        assert fp.read() == "old.log"
+    assert (tmp_path / "old.log.gz").stat().st_mtime < now - 86400
@@ -0,0 +1,38 @@
+import logging
+from argparse import Namespace
+import pytest
+from zdeploy.app import deploy
+
+
+def test_remote_markers_skip_recipes_deployed_elsewhere(fake_site):
+    log = logging.getLogger("test-markers")
+    server = fake_site.server
+
+    def config(machine):
+        return fake_site.config(machine, remote_markers="/var/lib/zdeploy")
+
+    deploy("chain", log, Namespace(force=False, jobs=2), config("laptop"))
+    assert any("/var/lib/zdeploy/chain0.hash" in c for c in server.commands)
+    commands = len(server.commands)
+    # A machine with an empty cache reads the markers and deploys nothing.
+    deploy("chain", log, Namespace(force=False, jobs=2), config("ci"))
+    new = server.commands[commands:]
+    assert len(new) == 1 and "grep -sH" in new[0]
+    # Its local cache now knows, so the next run needs no connection.
+    deploy("chain", log, Namespace(force=False, jobs=2), config("ci"))
+    assert len(server.commands) == commands + 1
+
+    # A new version failing halfway leaves no marker of the old one.
+    run = fake_site.workspace.recipes / "chain2" / "run"
+    original = run.read_text()
+    run.write_text("#!/bin/sh\necho upgraded\n")
+    server.failing.add("/opt/chain2 && chmod +x ./run")
+    with pytest.raises(RuntimeError):
+        deploy("chain", log, Namespace(force=False, jobs=2), config("laptop"))
+    assert server.stored("/var/lib/zdeploy/chain2.hash") is None
+    # Reverting does not skip the half-upgraded host.
+    server.failing.clear()
+    run.write_text(original)
+    commands = len(server.commands)
+    deploy("chain", log, Namespace(force=False, jobs=2), config("fresh"))
+    assert any("/opt/chain2" in command for command in server.commands[commands:])
@@ -0,0 +1,25 @@
+from pathlib import Path
+import logging
+from zdeploy.app import _load_recipes
+from zdeploy.config import Config
+from zdeploy.plan import PackageBatch, Plan
+
+
+def test_virtual_recipes_are_batched_per_level(tmp_path):
+    cfg = Config(configs=str(tmp_path / "configs"), recipes=str(tmp_path / "recipes"))
+    for name, reqs in {"app": ["base", "curl", "jq"], "base": ["curl", "gnupg"]}.items():
+        (Path(cfg.recipes) / name).mkdir(parents=True)
+        (Path(cfg.recipes) / name / "require").write_text("\n".join(reqs))
+    Path(cfg.configs).mkdir()
+    config = Path(cfg.configs) / "c1"
+    config.write_text("RECIPES=app\napp=1.1.1.1\n")
+
+    plan = Plan(_load_recipes(config, logging.getLogger("test_plan"), cfg))
+
+    names = [task.name for task in plan.tasks]
+    assert names == ["packages[curl, gnupg]", "base", "jq", "app"]
+    batch, base, jq, app = plan.tasks
+    assert isinstance(batch, PackageBatch)
+    assert plan.requirements(base) == [batch]
+    assert plan.requirements(jq) == []
+    assert [t.name for t in plan.requirements(app)] == ["base", "packages[curl, gnupg]", "jq"]
@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+import os
+import time
+import pytest
+from zdeploy.pump import STDERR, STDOUT, CommandTimeout, OutputPump
+
+
+class FakeChannel:
+    """Minimal paramiko channel fed by a background writer."""
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        self._lock = Lock()
+        self._out = b""
+        self._err = b""
+        self.eof_received = False
+        self.closed = False
+        self.status_event = Event()
+        self.status = None
+
+    def fileno(self):
+        return self._read_fd
+
+    def _signal(self):
+        os.write(self._write_fd, b"x")
+
+    def feed(self, out=b"", err=b""):
+        with self._lock:
+            self._out += out
+            self._err += err
+        self._signal()
+
+    def exit(self, status):
+        self.eof_received = True
+        self.status = status
+        self.status_event.set()
+        self._signal()
+
+    def _take(self, attr, size):
+        with self._lock:
+            data = getattr(self, attr)[:size]
+            setattr(self, attr, getattr(self, attr)[size:])
+            if not self._out and not self._err and not self.eof_received:
+                os.read(self._read_fd, 4096)
+        return data
+
+    def recv_ready(self):
+        return bool(self._out)
+
+    def recv_stderr_ready(self):
+        return bool(self._err)
+
+    def recv(self, size):
+        return self._take("_out", size)
+
+    def recv_stderr(self, size):
+        return self._take("_err", size)
+
+    def recv_exit_status(self):
+        return self.status
+
+    def close(self):
+        self.closed = True
+
+
+def _run(pump, channel, **kwargs):
+    lines = []
+    rc = pump.run(channel, lambda stream, line: lines.append((stream, line)), **kwargs)
+    return rc, lines
+
+
+def test_streams_are_separate_and_lines_complete():
+    channel = FakeChannel()
+
+    def remote():
+        channel.feed(out=b"hel")
+        channel.feed(out=b"lo\nwor", err=b"oops\n")
+        channel.feed(out=b"ld\n" + b"x\n" * 5000 + b"tail")
+        channel.exit(3)
+
+    Thread(target=remote).start()
+    rc, lines = _run(OutputPump(), channel)
+    assert rc == 3
+    assert (STDERR, "oops") in lines
+    stdout = [line for stream, line in lines if stream == STDOUT]
+    assert stdout[:2] == ["hello", "world"] and stdout[-1] == "tail"
+    assert len(stdout) == 5003
+
+
+def test_idle_timeout_closes_channel():
+    channel = FakeChannel()
+    channel.feed(out=b"started\n")
+    start = time.monotonic()
+    with pytest.raises(CommandTimeout, match="no output"):
+        _run(OutputPump(), channel, idle_timeout=0.2)
+    assert channel.closed and time.monotonic() - start < 2
+
+
+def test_one_pump_multiplexes_many_channels():
+    pump = OutputPump()
+    channels = [FakeChannel() for _ in range(20)]
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        futures = [executor.submit(_run, pump, channel, timeout=5) for channel in channels]
+        for i, channel in enumerate(reversed(channels)):
+            channel.feed(out=f"{i}\n".encode())
+            channel.exit(0)
+        results = [future.result() for future in futures]
+    assert all(rc == 0 and len(lines) == 1 for rc, lines in results)
+
+
+def test_slow_consumer_pauses_channel():
+    channel = FakeChannel()
+    pump = OutputPump()
+
+    def remote():
+        for i in range(300):
+            channel.feed(out=f"{i}\n".encode())
+            time.sleep(0.0001)
+        channel.exit(0)
+
+    Thread(target=remote).start()
+    lines = []
+
+    def slow(stream, line):
+        time.sleep(0.001)
+        lines.append(line)
+
+    assert pump.run(channel, slow, idle_timeout=1) == 0
+    assert lines == [str(i) for i in range(300)]
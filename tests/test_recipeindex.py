@@ -0,0 +1,33 @@
+import os
+from zdeploy.recipeindex import RecipeIndex
+
+
+def test_lookup_is_case_insensitive_and_cached(tmp_path):
+    (tmp_path / "Docker").mkdir()
+    (tmp_path / "Docker" / "run").write_text("")
+    (tmp_path / "Docker" / "require").write_text("curl\n")
+    (tmp_path / "notes.txt").write_text("")
+    index = RecipeIndex(tmp_path)
+
+    entry = index.lookup("docker")
+    assert entry is not None and entry.name == "Docker"
+    assert entry.has_run and entry.has_require and not entry.has_hash
+    assert index.lookup("notes.txt") is None
+    assert index.lookup("redis") is None
+    assert index.lookup("DOCKER") is entry
+
+
+def test_lookup_is_invalidated_by_mtime(tmp_path):
+    index = RecipeIndex(tmp_path)
+    assert index.lookup("redis") is None
+    (tmp_path / "redis").mkdir()
+    os.utime(tmp_path, ns=(0, 10**18))
+    entry = index.lookup("redis")
+    assert entry is not None and not entry.has_hash
+    (entry.path / "hash").write_text("echo 1\n")
+    os.utime(entry.path, ns=(0, 10**18))
+    assert index.lookup("redis").has_hash
+
+
+def test_for_path_is_shared(tmp_path):
+    assert RecipeIndex.for_path(tmp_path) is RecipeIndex.for_path(str(tmp_path))
@@ -23,3 +23,27 @@ def test_recipeset_iterable(tmp_path):
     for item in rs:
         assert item is r
     assert len(list(rs)) == 1
+
+
+def test_recipeset_order_survives_removals(tmp_path):
+    cfg = Config(recipes=str(tmp_path))
+    log = logging.getLogger("test")
+    recipes = [
+        recipe_mod.Recipe(
+            f"pkg{i}", None, tmp_path / "cfg", "host", "user", None, 22, log, cfg
+        )
+        for i in range(6)
+    ]
+    rs = RecipeSet(cfg, log)
+    rs.update(recipes)
+    rs.remove(recipes[1])
+    rs.discard(recipes[3])
+    rs -= {recipes[4]}
+    rs &= set(recipes[:3] + recipes[5:])
+    assert list(rs) == [recipes[0], recipes[2], recipes[5]]
+    rs.add(recipes[1])
+    assert list(rs) == [recipes[0], recipes[2], recipes[5], recipes[1]]
+    assert rs.pop() in recipes
+    assert len(list(rs)) == len(rs) == 3
+    rs.clear()
+    assert not list(rs) and len(rs) == 0
@@ -0,0 +1,98 @@
+from threading import Lock
+import logging
+import time
+from zdeploy.scheduler import Scheduler, Status, batch_limit, chain_lengths
+
+
+def test_scheduler_respects_requirements_and_failures():
+    requires = {"a": [], "b": ["a"], "c": [], "d": ["c"], "e": ["d"]}
+    finished = []
+    lock = Lock()
+
+    def work(task):
+        if task == "c":
+            raise RuntimeError("boom")
+        with lock:
+            finished.append(task)
+
+    scheduler = Scheduler(4, 1, logging.getLogger("test_scheduler"))
+    statuses = scheduler.run(list(requires), requires.__getitem__, lambda t: t, work)
+    assert finished.index("a") < finished.index("b")
+    assert statuses == {
+        "a": Status.SUCCEEDED,
+        "b": Status.SUCCEEDED,
+        "c": Status.FAILED,
+        "d": Status.SKIPPED,
+        "e": Status.SKIPPED,
+    }
+
+
+def test_scheduler_limits_host_concurrency():
+    active = {"n": 0, "max": 0}
+    lock = Lock()
+
+    def work(_task):
+        with lock:
+            active["n"] += 1
+            active["max"] = max(active["max"], active["n"])
+        time.sleep(0.02)
+        with lock:
+            active["n"] -= 1
+
+    scheduler = Scheduler(4, 1, logging.getLogger("test_scheduler"))
+    tasks = ["a", "b", "c"]
+    statuses = scheduler.run(tasks, lambda t: [], lambda t: "same-host", work)
+    assert set(statuses.values()) == {Status.SUCCEEDED}
+    assert active["max"] == 1
+
+
+def test_batch_limit():
+    assert batch_limit("0", 50) == 50
+    assert batch_limit("5", 50) == 5
+    assert batch_limit("10%", 50) == 5
+    assert batch_limit("1%", 50) == 1
+
+
+def test_rollout_batches_and_max_failures():
+    active = {"n": 0, "max": 0}
+    lock = Lock()
+    hosts = [f"h{i}" for i in range(10)]
+    requires = {host: [] for host in hosts}
+    # Each host's dependent recipe requires the rollout on that host.
+    requires.update({f"{host}-app": [host] for host in hosts})
+
+    def work(task):
+        with lock:
+            active["n"] += 1
+            active["max"] = max(active["max"], active["n"])
+        time.sleep(0.01)
+        with lock:
+            active["n"] -= 1
+        if task in ("h0", "h1"):
+            raise RuntimeError("boom")
+
+    scheduler = Scheduler(10, 10, logging.getLogger("test_scheduler"), "20%", 0)
+    statuses = scheduler.run(
+        list(requires),
+        requires.__getitem__,
+        lambda t: t.split("-")[0],
+        work,
+        group=lambda t: "app" if t.endswith("-app") else "agent",
+    )
+    assert active["max"] <= 2
+    assert statuses["h0"] == statuses["h1"] == Status.FAILED
+    assert all(statuses[h] == Status.SKIPPED for h in hosts[2:])
+    assert all(statuses[f"{h}-app"] == Status.SKIPPED for h in hosts)
+
+
+def test_critical_path_starts_first():
+    # "long" heads the chain long -> tail; "a" and "b" are short and independent.
+    requires = {"a": [], "b": [], "long": [], "tail": ["long"]}
+    costs = {"a": 1, "b": 1, "long": 5, "tail": 5}
+    lengths = chain_lengths(list(requires), requires.__getitem__, costs.__getitem__)
+    assert lengths == {"a": 1, "b": 1, "long": 10, "tail": 5}
+
+    order = []
+    scheduler = Scheduler(1, 1, logging.getLogger("test_scheduler"))
+    scheduler.run(list(requires), requires.__getitem__, lambda t: t, order.append, cost=costs.__getitem__)
+    assert order == ["long", "tail", "a", "b"]
@@ -1,6 +1,16 @@
+import subprocess
+import time
+import pytest
 from zdeploy.shell import execute
 
 def test_execute_echo():
     output, rc = execute('echo hello')
     assert output.strip() == 'hello'
     assert rc == 0
+
+
+def test_execute_timeout():
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        execute('sleep 5', timeout=0.2)
+    assert time.monotonic() - start < 2
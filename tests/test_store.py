@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+from zdeploy.store import DeploymentStore, Record
+
+
+def _record(recipe, deep_hash="h1", status="succeeded", deployment="d1", finished=None):
+    finished = time.time() if finished is None else finished
+    return Record("c1", deployment, "host", recipe, deep_hash, status, finished - 2, finished)
+
+
+def test_record_and_lookup(tmp_path):
+    with DeploymentStore(tmp_path / "cache" / "deployments.db") as store:
+        store.record(_record("redis"))
+        store.record(_record("docker", status="failed"))
+        assert store.is_deployed("host", "redis", "h1")
+        assert not store.is_deployed("host", "redis", "h2")
+        assert not store.is_deployed("other", "redis", "h1")
+        assert not store.is_deployed("host", "docker", "h1")
+        assert store.latest("host", "docker") == ("h1", "failed")
+        assert store.latest("host", "nginx") is None
+        records = store.query(recipe="redis")
+        assert len(records) == 1 and records[0].duration == 2
+
+
+def test_lookup_survives_recipe_set_changes(tmp_path):
+    with DeploymentStore(tmp_path / "deployments.db") as store:
+        store.record(_record("redis", deployment="d1", finished=time.time() - 20))
+        assert store.is_deployed("host", "redis", "h1")
+        # A newer attempt with another hash supersedes the older success.
+        store.record(_record("redis", deep_hash="h2", deployment="d2", finished=time.time() - 10))
+        assert not store.is_deployed("host", "redis", "h1")
+        assert store.is_deployed("host", "redis", "h2")
+
+
+def test_collect_garbage_and_prune(tmp_path):
+    old = time.time() - 10 * 86400
+    with DeploymentStore(tmp_path / "deployments.db") as store:
+        for i in range(3):
+            store.record(_record("redis", deep_hash=f"h{i}", finished=old + i))
+        store.record(_record("docker", finished=old))
+        assert store.collect_garbage(None, None) == 0
+        assert store.collect_garbage(None, 2) == 1
+        # The latest record of each (host, recipe) is never collected.
+        assert store.collect_garbage(86400, None) == 1
+        assert sorted(r.deep_hash for r in store.query()) == ["h1", "h2"]
+        assert store.is_deployed("host", "docker", "h1")
+        assert store.prune(older_than=86400) == 2
+        assert not store.query()
+
+
+def test_concurrent_writes(tmp_path):
+    with DeploymentStore(tmp_path / "deployments.db") as store:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda i: store.record(_record(f"r{i}")), range(100)))
+        assert len(store.query(limit=1000)) == 100
+
+
+def test_durations(tmp_path):
+    with DeploymentStore(tmp_path / "deployments.db") as store:
+        store.record(Record("c1", "d1", "host", "redis", "h1", "succeeded", 0, 10))
+        store.record(Record("c1", "d1", "host", "redis", "h2", "succeeded", 20, 40))
+        store.record(Record("c1", "d1", "host", "redis", "h3", "failed", 50, 150))
+        store.record(Record("c1", "d1", "other", "redis", "h1", "succeeded", 0, 4))
+        assert store.durations() == {("host", "redis"): 15, ("other", "redis"): 4}
+        assert store.durations(samples=1)[("host", "redis")] == 20
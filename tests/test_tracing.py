@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+from zdeploy.tracing import Tracer, propagate, span
+
+
+def test_spans_are_only_recorded_while_active():
+    tracer = Tracer()
+    with span("untraced"):
+        pass
+    with tracer.activate():
+        with span("upload", host="h1", recipe="r1"):
+            pass
+    with span("after"):
+        pass
+    assert [s.name for s in tracer.spans] == ["upload"]
+    assert tracer.spans[0].attributes == {"host": "h1", "recipe": "r1"}
+
+
+def test_propagate_traces_work_in_other_threads():
+    tracer = Tracer()
+
+    def work(i):
+        with span("hash_file", index=i):
+            return i
+
+    with tracer.activate(), ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(propagate(work), range(8))) == list(range(8))
+    assert sorted(s.attributes["index"] for s in tracer.spans) == list(range(8))
+
+
+def test_write_chrome_trace_and_summary(tmp_path):
+    tracer = Tracer()
+    with tracer.activate():
+        with span("run", host="h1", recipe="slow"):
+            with span("connect", host="h1"):
+                pass
+    trace_path, summary_path = tracer.write(tmp_path / "logs" / "deployment")
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    assert {e["name"] for e in events} == {"run", "connect"}
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+    run = next(e for e in events if e["name"] == "run")
+    assert run["args"] == {"host": "h1", "recipe": "slow"}
+    summary = summary_path.read_text()
+    assert "Slowest spans:" in summary
+    assert "run  host=h1 recipe=slow" in summary
@@ -0,0 +1,202 @@
+from argparse import Namespace
+import io
+import logging
+import tarfile
+import pytest
+from benchmarks.generate import Scale
+from zdeploy.app import deploy
+from zdeploy.transfer import upload_tar
+
+
+class FakeStream(io.BytesIO):
+    def close(self):
+        self.data = self.getvalue()
+        super().close()
+
+
+class FakeChannel:
+    closed = False
+
+    def __init__(self):
+        self.command = None
+        self.stream = FakeStream()
+
+    def exec_command(self, command):
+        self.command = command
+
+    def makefile(self, mode):
+        return self.stream
+
+    def shutdown_write(self):
+        pass
+
+    def exit_status_ready(self):
+        return False
+
+    def recv_exit_status(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class FakeSSH:
+    def __init__(self):
+        self.channel = FakeChannel()
+
+    def get_transport(self):
+        return self
+
+    def open_session(self):
+        return self.channel
+
+
+def test_upload_tar_streams_directory_and_config(tmp_path):
+    src = tmp_path / "redis"
+    src.mkdir()
+    (src / "run").write_text("echo hi\n")
+    (src / "run").chmod(0o755)
+    config = tmp_path / "config"
+    config.write_text("A=1\n")
+
+    ssh = FakeSSH()
+    upload_tar(ssh, src, config, "/opt/redis", "gz")
+
+    assert "tar -xzf - --no-same-owner -C /opt/redis" in ssh.channel.command
+    with tarfile.open(fileobj=io.BytesIO(ssh.channel.stream.data), mode="r:gz") as archive:
+        members = {m.name: m for m in archive.getmembers()}
+    assert members["./run"].mode & 0o777 == 0o755
+    assert "config" in members
+
+
+class ClosedStream(io.RawIOBase):
+    """Channel file of a command that exited before reading its input."""
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        raise OSError("Socket is closed")
+
+    def close(self):
+        raise ValueError("I/O operation on closed file")
+
+
+class ExitedChannel(FakeChannel):
+    closed = True
+
+    def makefile(self, mode):
+        return ClosedStream()
+
+    def makefile_stderr(self, mode):
+        return io.BytesIO(b"sh: tar: command not found\n")
+
+    def recv_exit_status(self):
+        return 127
+
+
+def test_upload_tar_reports_early_remote_exit(tmp_path):
+    src = tmp_path / "redis"
+    src.mkdir()
+    (src / "run").write_text("echo hi\n")
+    config = tmp_path / "config"
+    config.write_text("A=1\n")
+
+    ssh = FakeSSH()
+    ssh.channel = ExitedChannel()
+    with pytest.raises(RuntimeError, match="tar: command not found"):
+        upload_tar(ssh, src, config, "/opt/redis", "gz")
+
+
+
+def test_upload_tar_raises_unreadable_local_files(tmp_path):
+    src = tmp_path / "redis"
+    src.mkdir()
+    (src / "run").write_text("echo hi\n")
+
+    ssh = FakeSSH()
+    # The remote tar is still waiting: the error must not be taken for its exit.
+    with pytest.raises(FileNotFoundError):
+        upload_tar(ssh, src, tmp_path / "missing", "/opt/redis", "gz")
+
+
+class FakeRemote:
+    """Fake transport that keeps a manifest and records what is sent."""
+
+    def __init__(self):
+        self.manifest = None
+        self.removed = []
+        self.extracted = []
+
+    def get_transport(self):
+        return self
+
+    def open_session(self):
+        return FakeRemoteChannel(self)
+
+
+class FakeRemoteChannel(FakeChannel):
+    def __init__(self, remote):
+        super().__init__()
+        self.remote = remote
+
+    def sendall(self, data):
+        self.stream.write(data)
+
+    def makefile(self, mode):
+        if mode == "rb":
+            if self.command.startswith("test -d") and self.remote.manifest is not None:
+                return io.BytesIO(self.remote.manifest)
+            return io.BytesIO()
+        return self.stream
+
+    def makefile_stderr(self, mode):
+        return io.BytesIO()
+
+    def recv_exit_status(self):
+        if self.command.startswith("test -d"):
+            return 0 if self.remote.manifest is not None else 1
+        data = self.stream.data if self.stream.closed else self.stream.getvalue()
+        if "xargs" in self.command:
+            self.remote.removed += [n.decode() for n in data.split(b"\0") if n]
+        elif "tar -x" in self.command:
+            with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as archive:
+                self.remote.extracted += archive.getnames()
+        elif "cat >" in self.command:
+            self.remote.manifest = data
+        return 0
+
+
+def test_upload_delta_sends_only_changes(tmp_path):
+    from zdeploy.hashing import HashCache
+    from zdeploy.transfer import upload_delta
+
+    src = tmp_path / "app"
+    src.mkdir()
+    (src / "run").write_text("echo hi\n")
+    (src / "big").write_text("payload\n")
+    config = tmp_path / "config"
+    config.write_text("A=1\n")
+    remote = FakeRemote()
+
+    upload_delta(remote, src, config, "/opt/app", HashCache())
+    assert sorted(remote.extracted) == ["big", "config", "run"]
+
+    remote.extracted = []
+    (src / "run").write_text("echo changed\n")
+    (src / "big").unlink()
+    upload_delta(remote, src, config, "/opt/app", HashCache())
+    assert remote.extracted == ["run"]
+    assert remote.removed == ["big"]
+
+
+@pytest.mark.parametrize("fake_site", [Scale(1, 1, 1, 1, 1, 1, 8 << 20)], indirect=True)
+def test_failed_streamed_upload_falls_back_to_scp(fake_site):
+    server = fake_site.server
+    cfg = fake_site.config(upload="tar", compression="none")
+    # tar exits at once, closing the channel while the archive, larger
+    # than the channel window, is still being sent.
+    server.failing.add("tar -x")
+    deploy("large-files", logging.getLogger("test-transfer"), Namespace(force=False, jobs=1), cfg)
+    assert any(command.startswith("scp") for command in server.commands)
+    assert server.files_received > 0
@@ -1,4 +1,6 @@
 import zdeploy.utils as utils
+from zdeploy import _config_names
+from zdeploy.config import Config
 
 def test_reformat_time():
     assert utils.reformat_time('1:02:03') == '1h, 2m, and 3s'
@@ -10,3 +12,23 @@ def test_str2bool():
     assert utils.str2bool('enable') is True
     assert utils.str2bool('no') is False
     assert utils.str2bool('maybe') is False
+
+
+def test_expand_patterns():
+    names = ['staging-us', 'staging-eu', 'prod-us']
+    assert utils.expand_patterns(['staging-*'], names) == ['staging-eu', 'staging-us']
+    assert utils.expand_patterns(['prod-us', 'prod-*'], names) == ['prod-us']
+    try:
+        utils.expand_patterns(['dev-*'], names)
+    except ValueError as exc:
+        assert 'dev-*' in str(exc)
+    else:
+        raise AssertionError('expected ValueError')
+
+
+def test_config_patterns_only_match_files(tmp_path):
+    (tmp_path / "staging").write_text("RECIPES=()\n")
+    (tmp_path / "hosts").mkdir()
+    cfg = Config(configs=str(tmp_path))
+    assert _config_names(["*"], cfg) == ["staging"]
+    assert _config_names(["hosts"], cfg) == []
@@ -0,0 +1,30 @@
+from argparse import Namespace
+from zdeploy import deploy_config
+from zdeploy.watch import Watcher, snapshot
+
+
+def test_snapshot_tracks_files(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "a" / "run").write_text("1\n")
+    before = snapshot([tmp_path, tmp_path / "missing"])
+    assert list(before) == [str(tmp_path / "a" / "run")]
+    (tmp_path / "a" / "run").write_text("12\n")
+    assert snapshot([tmp_path]) != before
+
+
+def test_watch_redeploys_changed_recipes_and_dependents(fake_site):
+    server = fake_site.server
+    args = Namespace(force=False, jobs=2, parallel_configs=1)
+    with Watcher(["chain"], args, fake_site.config(), deploy_config) as watcher:
+        assert watcher.cycle()
+        assert any("chain2" in command for command in server.commands)
+        assert not watcher.cycle()
+        commands = len(server.commands)
+        (fake_site.workspace.recipes / "chain1" / "run").write_text("#!/bin/sh\necho changed\n")
+        assert watcher.cycle()
+        new = server.commands[commands:]
+        assert any("/opt/chain1" in command for command in new)
+        assert any("/opt/chain0" in command for command in new)
+        assert not any("/opt/chain2" in command for command in new)
+        # Connections stay open between deployments.
+        assert len(watcher.pools["chain"]._clients) == 1
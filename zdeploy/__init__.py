@@ -1,62 +1,207 @@
-"""Command line interface for zdeploy."""
+"""Command line interface for zdeploy.
+
+Deployment modules are imported by the commands that need them, so that
+``--help``, argument errors and ``zdeploy cache`` start quickly.
+"""
+# pylint: disable=import-outside-toplevel
 
 from argparse import ArgumentParser, Namespace
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import logging
-from os import listdir
 from pathlib import Path
+import sys
 from sys import stdout
+from typing import Any, Dict, List, Tuple
 
-from zdeploy.utils import str2bool
+from zdeploy.utils import expand_patterns, reformat_time, str2bool
 
-from zdeploy.app import deploy
 from zdeploy.config import load as load_config, Config
 
 
-def deploy_config(config_name: str, args: Namespace, cfg: Config) -> None:
-    """Deploy a single configuration."""
-    log_dir_path = Path(cfg.logs) / config_name
-    cache_dir_path = Path(cfg.cache) / config_name
-    if not log_dir_path.is_dir():
-        log_dir_path.mkdir(parents=True)
-    if not cache_dir_path.is_dir():
-        cache_dir_path.mkdir(parents=True)
-    log_file_path = log_dir_path / f"{datetime.now():%Y-%m-%d %H:%M:%S}.log"
+def deploy_config(config_name: str, args: Namespace, cfg: Config, **kwargs: Any) -> None:
+    """Deploy a single configuration.
+
+    Its log records go through a queue to the terminal and the log files
+    under ``<logs>/<config>`` (see ``DeploymentLog``); the handlers are
+    removed again afterwards. ``kwargs`` are passed on to ``deploy``.
+    """
+    from zdeploy.app import deploy
+    from zdeploy.logs import DeploymentLog
 
     logger = logging.getLogger(config_name)
     logger.setLevel(logging.INFO)
-    formatter = logging.Formatter("%(message)s")
-    stream_handler = logging.StreamHandler(stdout)
-    stream_handler.setFormatter(formatter)
-    file_handler = logging.FileHandler(log_file_path, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-    logger.addHandler(stream_handler)
-    logger.addHandler(file_handler)
+    with DeploymentLog(logger, cfg, Path(cfg.logs) / config_name, args.parallel_configs > 1):
+        try:
+            deploy(config_name, logger, args, cfg, **kwargs)
+        except Exception as exc:
+            logger.error("Deployment of %s failed: %s", config_name, exc)
+            raise
+
 
+def _deploy_config_safely(config_name: str, args: Namespace, cfg: Config) -> Tuple[bool, str]:
+    """Deploy ``config_name``; return whether it succeeded and a summary note."""
+
+    started = datetime.now()
     try:
-        deploy(config_name, cache_dir_path, logger, args, cfg)
-    finally:
-        logger.removeHandler(file_handler)
-        file_handler.close()
+        deploy_config(config_name, args, cfg)
+    except Exception as exc:  # pylint: disable=broad-except
+        return False, f"failed after {reformat_time(datetime.now() - started)}: {exc}"
+    return True, f"succeeded in {reformat_time(datetime.now() - started)}"
 
 
 def deploy_configs(args: Namespace, cfg: Config) -> None:
-    """Deploy each config provided on the command line."""
+    """Deploy each config provided on the command line.
+
+    Configs are deployed one after another, stopping at the first failure,
+    unless ``--parallel-configs`` allows several to run at once. Every
+    config is parsed into its own mapping, so configs never see each
+    other's variables. A summary of all configs is printed at the end.
+    """
+
+    results: Dict[str, Tuple[bool, str]] = {}
+    if args.parallel_configs > 1:
+        with ThreadPoolExecutor(max_workers=args.parallel_configs) as executor:
+            futures = {
+                name: executor.submit(_deploy_config_safely, name, args, cfg)
+                for name in args.configs
+            }
+        results = {name: future.result() for name, future in futures.items()}
+    else:
+        for config_name in args.configs:
+            results[config_name] = _deploy_config_safely(config_name, args, cfg)
+            if not results[config_name][0]:
+                break
+
+    print("Summary:")
     for config_name in args.configs:
-        deploy_config(config_name, args, cfg)
+        _, note = results.get(config_name, (False, "not started"))
+        print(f"  {config_name}: {note}")
+    if not all(results.get(name, (False, ""))[0] for name in args.configs):
+        raise SystemExit(1)
+
+
+def plan_configs(args: Namespace, cfg: Config) -> None:
+    """Show the deployment plan of each config without connecting to any host."""
+    from zdeploy.app import show_plan
+
+    for config_name in args.configs:
+        logger = logging.getLogger(config_name)
+        logger.setLevel(logging.INFO)
+        handler = logging.StreamHandler(stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        try:
+            show_plan(config_name, logger, args, cfg)
+        finally:
+            logger.removeHandler(handler)
+
+
+def cache_main(argv: List[str], cfg: Config) -> None:
+    """Entry point of ``zdeploy cache``: query or prune the deployment store."""
+    from zdeploy.store import STORE_NAME, DeploymentStore
+
+    parser = ArgumentParser(prog="zdeploy cache")
+    actions = parser.add_subparsers(dest="action", required=True)
+    list_parser = actions.add_parser("list", help="Show recorded deployments, newest first")
+    list_parser.add_argument("-c", "--config", help="Only show this config")
+    list_parser.add_argument("--host", help="Only show this host")
+    list_parser.add_argument("--recipe", help="Only show this recipe")
+    list_parser.add_argument("-n", "--limit", help="Maximum number of rows", type=int, default=50)
+    prune_parser = actions.add_parser("prune", help="Delete recorded deployments")
+    prune_parser.add_argument("-c", "--config", help="Only prune this config")
+    prune_parser.add_argument(
+        "--older-than", help="Only prune records older than this many days", type=float
+    )
+    prune_parser.add_argument("--all", help="Prune every matching record", action="store_true")
+    args = parser.parse_args(argv)
+
+    with DeploymentStore(Path(cfg.cache) / STORE_NAME) as store:
+        if args.action == "list":
+            for record in store.query(args.config, args.host, args.recipe, args.limit):
+                print(
+                    f"{datetime.fromtimestamp(record.finished):%Y-%m-%d %H:%M:%S}  "
+                    f"{record.config}  {record.host}  {record.recipe}  {record.status}  "
+                    f"{reformat_time(timedelta(seconds=record.duration))}  {record.deep_hash}"
+                )
+            return
+        if args.older_than is None and not args.all:
+            parser.error("prune needs --older-than DAYS or --all")
+        older_than = args.older_than * 86400 if args.older_than is not None else None
+        print(f"Pruned {store.prune(older_than, args.config)} record(s)")
+
+
+def watch_main(argv: List[str], cfg: Config) -> None:
+    """Entry point of ``zdeploy watch``: redeploy configs as their recipes change."""
+    from zdeploy.watch import Watcher
+
+    parser = ArgumentParser(prog="zdeploy watch")
+    parser.add_argument(
+        "-c",
+        "--configs",
+        help="Deployment destination(s); shell-style patterns such as 'staging-*' are expanded",
+        nargs="+",
+        required=True,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of recipes to deploy concurrently",
+        default=cfg.jobs,
+        type=int,
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        help="Seconds between checks for changes",
+        default=2.0,
+        type=float,
+    )
+    args = parser.parse_args(argv)
+    try:
+        configs = expand_patterns(args.configs, _config_names(args.configs, cfg))
+    except ValueError as exc:
+        parser.error(str(exc))
+    deploy_args = Namespace(force=False, jobs=args.jobs, parallel_configs=1)
+    with Watcher(configs, deploy_args, cfg, deploy_config) as watcher:
+        try:
+            watcher.run(args.interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def _config_names(patterns: List[str], cfg: Config) -> List[str]:
+    """Return the config names ``patterns`` may match.
+
+    The configs directory is only listed when a pattern holds wildcards;
+    plain names are checked one by one. Only files are configs, so the
+    directories next to them (such as hosts files) are never matched.
+    """
+
+    configs = Path(cfg.configs)
+    if any(char in pattern for pattern in patterns for char in "*?["):
+        if not configs.is_dir():
+            return []
+        return [path.name for path in configs.iterdir() if path.is_file()]
+    return [pattern for pattern in patterns if (configs / pattern).is_file()]
 
 
 def main() -> None:
     """CLI entry point."""
     cfg = load_config()
+    if sys.argv[1:2] == ["cache"]:
+        cache_main(sys.argv[2:], cfg)
+        return
+    if sys.argv[1:2] == ["watch"]:
+        watch_main(sys.argv[2:], cfg)
+        return
     parser = ArgumentParser()
     parser.add_argument(
         "-c",
         "--configs",
-        help="Deployment destination(s)",
+        help="Deployment destination(s); shell-style patterns such as 'staging-*' are expanded",
         nargs="+",
         required=True,
-        choices=listdir(cfg.configs) if Path(cfg.configs).is_dir() else (),
     )
     parser.add_argument(
         "-f",
@@ -68,4 +213,43 @@ def main() -> None:
         const=True,
         type=str2bool,
     )
-    deploy_configs(parser.parse_args(), cfg)
+    parser.add_argument(
+        "-r",
+        "--resume",
+        help="Only deploy recipes that failed, were skipped or were never deployed, "
+        "trusting past successes even if forced",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of recipes to deploy concurrently",
+        required=False,
+        default=cfg.jobs,
+        type=int,
+    )
+    parser.add_argument(
+        "-p",
+        "--parallel-configs",
+        help="Number of configs to deploy concurrently",
+        required=False,
+        default=cfg.parallel_configs,
+        type=int,
+    )
+    parser.add_argument(
+        "--plan",
+        help="Show what would be deployed and how long it should take, then exit",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    try:
+        args.configs = expand_patterns(args.configs, _config_names(args.configs, cfg))
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.resume:
+        # Successes recorded with the current deep hash are trusted.
+        args.force = False
+    if args.plan:
+        plan_configs(args, cfg)
+        return
+    deploy_configs(args, cfg)
@@ -1,135 +1,606 @@
 """Deployment core logic."""
 
-from os import environ
 from pathlib import Path
-from shutil import rmtree
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from argparse import Namespace
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Tuple
 import logging
 
-from dotenv import load_dotenv
+from zdeploy.plan import PackageBatch, Plan, Task
 from zdeploy.recipe import Recipe
 from zdeploy.recipeset import RecipeSet
+from zdeploy.scheduler import Scheduler, Status, chain_lengths
+from zdeploy.store import STORE_NAME, DeploymentStore, Record
 from zdeploy.utils import reformat_time
 from zdeploy.config import Config
+from zdeploy.envfile import EnvFile
+from zdeploy.graph import DependencyGraph
+from zdeploy.hashing import HashCache
+from zdeploy.logs import log_context
+from zdeploy.tracing import Tracer, propagate, span
 
+if TYPE_CHECKING:
+    from zdeploy.clients import SSH, ConnectionPool
 
-def _load_recipes(config_path: Path, log: logging.Logger, cfg: Config) -> RecipeSet:
-    """Return a ``RecipeSet`` loaded from environment variables."""
-
-    # Ensure variables from previous configs do not linger
-    # when deploying multiple configs sequentially.
-    load_dotenv(str(config_path), override=True)
-
-    recipes = RecipeSet(cfg, log)
-    recipe_names = environ.get("RECIPES", "")
-    if recipe_names.startswith("(") and recipe_names.endswith(")"):
-        recipe_names = recipe_names[1:-1]
-    for recipe_name in recipe_names.split(" "):
-        recipe_name = recipe_name.strip()
-        host_ip = environ.get(recipe_name)
-        if host_ip is None:
-            log.error(f"{recipe_name} is undefined in {config_path}")
-            raise RuntimeError("undefined host")
-        host_user = environ.get(f"{recipe_name}_USER", cfg.user)
-        host_password = environ.get(f"{recipe_name}_PASSWORD", cfg.password)
-        host_port_str = environ.get(f"{recipe_name}_PORT")
-        host_port = int(host_port_str) if host_port_str is not None else cfg.port
-
-        recipe = Recipe(
-            recipe_name,
-            None,
-            config_path,
-            host_ip,
-            host_user,
-            host_password,
-            host_port,
-            log,
-            cfg,
-        )
 
-        for env in environ:
-            if env.startswith(recipe_name) and env != recipe_name:
-                recipe.set_property(env, environ.get(env))
+def _parse_hosts(
+    items: Iterable[str], base: Path, including: Tuple[Path, ...] = ()
+) -> List[str]:
+    """Return the hosts listed in ``items``, in order and without duplicates.
+
+    Items may hold comma-separated hosts, and ``@path`` reads one host per
+    line from a hosts file (relative to ``base``; ``#`` starts a comment).
+    ``including`` holds the hosts files being read, so a file including
+    itself, directly or not, raises ``ValueError``.
+    """
+
+    hosts: List[str] = []
+    for item in items:
+        for host in item.split(","):
+            host = host.strip()
+            if host.startswith("@"):
+                path = (base / host[1:]).resolve()
+                if path in including:
+                    chain = " -> ".join(str(p) for p in (*including, path))
+                    raise ValueError(f"hosts files include each other: {chain}")
+                with open(path, "r", encoding="utf-8") as fp:
+                    lines = [line.split("#", 1)[0] for line in fp.read().splitlines()]
+                candidates = _parse_hosts(lines, base, (*including, path))
+            else:
+                candidates = [host] if host else []
+            hosts.extend(c for c in candidates if c not in hosts)
+    # Included hosts files may be empty, as long as some host is listed.
+    if not hosts and not including:
+        raise RuntimeError("undefined host")
+    return hosts
+
+
+def _load_recipes(
+    config_path: Path,
+    log: logging.Logger,
+    cfg: Config,
+    hash_cache: HashCache | None = None,
+) -> RecipeSet:
+    """Return a ``RecipeSet`` loaded from the variables in ``config_path``.
 
-        recipes.update(recipe.load_requirements())
-        recipes.add(recipe)
+    The config is parsed into its own mapping rather than the process
+    environment, so concurrently deployed configs cannot see each other's
+    variables. A recipe variable may list several hosts (see
+    ``_parse_hosts``); the recipe is then deployed to each of them.
+    """
 
+    with span("load_config", config=config_path.name):
+        env = EnvFile.load(config_path, log)
+        recipe_names = env.array("RECIPES")
+        properties = env.prefix_index(recipe_names)
+
+    with span("resolve", config=config_path.name):
+        graph = DependencyGraph(log)
+        for recipe_name in recipe_names:
+            if recipe_name not in env:
+                log.error(f"{recipe_name} is undefined in {config_path}")
+                raise RuntimeError("undefined host")
+
+            # Each host gets its own recipe node, and with it its own cache entry.
+            for host_ip in _parse_hosts(env.array(recipe_name), config_path.parent):
+                recipe = Recipe(
+                    recipe_name,
+                    None,
+                    config_path,
+                    host_ip,
+                    env.get(f"{recipe_name}_USER", cfg.user),
+                    env.get(f"{recipe_name}_PASSWORD", cfg.password),
+                    int(env.get(f"{recipe_name}_PORT", cfg.port)),
+                    log,
+                    cfg,
+                    hash_cache=hash_cache,
+                    graph=graph,
+                )
+
+                for key, value in properties[recipe_name].items():
+                    recipe.set_property(key, value)
+
+                graph.add(recipe)
+
+        # Every require file has been parsed exactly once by now; register the
+        # recipes with their requirements ahead of the recipes that need them.
+        recipes = RecipeSet(cfg, log, graph)
+        recipes.update(graph.topological_order())
     return recipes
 
 
-def _clean_cache(cache_dir_path: Path, deployment_cache_path: Path, log: logging.Logger) -> None:
-    """Remove stale cache directories inside ``cache_dir_path``."""
+def _run_hash_scripts(recipes: RecipeSet, cfg: Config) -> None:
+    """Run the ``hash`` script of every recipe in ``recipes`` up front.
 
-    if not deployment_cache_path.is_dir():
-        deployment_cache_path.mkdir(parents=True)
-    for directory in cache_dir_path.iterdir():
-        if directory != deployment_cache_path:
-            log.info(f"Removing stale cache directory {directory}")
-            rmtree(directory)
+    Scripts run concurrently, at most ``cfg.hash_jobs`` at a time, and each
+    runs once per recipe and config; the first failure is raised once all
+    of them finished.
+    """
 
+    with ThreadPoolExecutor(max_workers=max(1, cfg.hash_jobs)) as executor:
+        futures = [executor.submit(propagate(recipe.hash_script_output)) for recipe in recipes]
+    for future in futures:
+        future.result()
 
-def _deploy_recipe(
-    recipe: Recipe,
-    deployment_cache_path: Path,
-    force: bool,
-    started_all: datetime,
-    log: logging.Logger,
+
+def _recipes_of(task: Task) -> List[Recipe]:
+    """Return the recipes deployed by ``task``."""
+
+    return task.packages if isinstance(task, PackageBatch) else [task]
+
+
+def _pending_recipes(task: Task, store: DeploymentStore, force: bool) -> List[Recipe]:
+    """Return the recipes of ``task`` that are not deployed with their current hash."""
+
+    return [
+        recipe
+        for recipe in _recipes_of(task)
+        if force or not store.is_deployed(recipe.hostname, recipe.name, recipe.deep_hash())
+    ]
+
+
+def _estimate(plan: Plan, store: DeploymentStore, force: bool) -> Dict[Task, float | None]:
+    """Predict how long each task of ``plan`` takes from past deployments.
+
+    Tasks whose recipes are all deployed take no time; tasks with a recipe
+    never deployed to its host before are predicted as ``None``.
+    """
+
+    durations = store.durations()
+    estimates: Dict[Task, float | None] = {}
+    for task in plan.tasks:
+        pending = _pending_recipes(task, store, force)
+        keys = [(recipe.hostname, recipe.name) for recipe in pending]
+        if any(key not in durations for key in keys):
+            estimates[task] = None
+        else:
+            # Packages of a batch are installed together, in one command.
+            estimates[task] = max((durations[key] for key in keys), default=0.0)
+    return estimates
+
+
+def _cost(estimates: Dict[Task, float | None]) -> Callable[[Task], float]:
+    """Return a task cost function, defaulting to the mean known estimate."""
+
+    known = [estimate for estimate in estimates.values() if estimate]
+    default = sum(known) / len(known) if known else 1.0
+
+    def cost(task: Task) -> float:
+        estimate = estimates.get(task)
+        return default if estimate is None else estimate
+
+    return cost
+
+
+@dataclass
+class _Deployment:  # pylint: disable=too-many-instance-attributes
+    """State shared by every task of one config deployment."""
+
+    config_name: str
+    deployment: str
+    store: DeploymentStore
+    force: bool
+    started_all: datetime
+    log: logging.Logger
+    # Remote marker directory; empty when markers are disabled.
+    remote_markers: str = ""
+    # Connection pool kept open across deployments, if any.
+    pool: "ConnectionPool | None" = None
+
+
+def _connect(task: Task, pool: "ConnectionPool") -> "SSH":
+    """Return the pooled connection to the host of ``task``."""
+
+    return pool.get(
+        recipe=task.name,
+        hostname=task.hostname,
+        username=task.username,
+        password=task.password,
+        port=task.port,
+    )
+
+
+def _read_markers(tasks: List[Task], pool: "ConnectionPool", run: _Deployment) -> None:
+    """Record the pending recipes of ``tasks`` whose remote marker matches as deployed.
+
+    ``tasks`` must all target the same host, whose markers are read in one
+    round trip. A host whose markers cannot be read is deployed as usual.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from zdeploy.markers import read_markers
+
+    pending = [recipe for task in tasks for recipe in _pending_recipes(task, run.store, False)]
+    host = tasks[0].hostname
+    try:
+        with span("read_markers", host=host), log_context(host=host):
+            markers = read_markers(
+                _connect(tasks[0], pool), run.remote_markers, [r.name for r in pending]
+            )
+    except Exception as exc:  # pylint: disable=broad-except
+        run.log.warning("Failed to read deployment markers on %s: %s", host, exc)
+        return
+    now = datetime.now().timestamp()
+    for recipe in pending:
+        if markers.get(recipe.name) != recipe.deep_hash():
+            continue
+        run.log.info(f"{recipe.name} is already deployed on {host} according to its marker")
+        # A zero-length record: it marks the recipe deployed without
+        # skewing predicted durations.
+        run.store.record(
+            Record(
+                config=run.config_name,
+                deployment=run.deployment,
+                host=recipe.hostname,
+                recipe=recipe.name,
+                deep_hash=recipe.deep_hash(),
+                status=Status.SUCCEEDED,
+                started=now,
+                finished=now,
+            )
+        )
+
+
+def _write_markers(
+    task: Task, recipes: List[Recipe], pool: "ConnectionPool", run: _Deployment
+) -> None:
+    """Leave a remote marker for each of ``recipes`` deployed by ``task``.
+
+    Markers only save work, so failing to write them is not an error.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from zdeploy.markers import write_markers
+
+    try:
+        with span("write_markers", host=task.hostname, recipe=task.name):
+            write_markers(
+                _connect(task, pool),
+                run.remote_markers,
+                {recipe.name: recipe.deep_hash() for recipe in recipes},
+            )
+    except Exception as exc:  # pylint: disable=broad-except
+        run.log.warning("Failed to write deployment markers on %s: %s", task.hostname, exc)
+
+
+def _remove_markers(
+    task: Task, recipes: List[Recipe], pool: "ConnectionPool", run: _Deployment
 ) -> None:
-    """Deploy a single ``recipe`` and update its cache entry."""
+    """Remove the remote markers of ``recipes`` before ``task`` deploys them.
+
+    Unlike writing them, removing markers must succeed: a marker left in
+    place while a new version fails halfway would vouch for the old one.
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from zdeploy.markers import remove_markers
+
+    with span("remove_markers", host=task.hostname, recipe=task.name):
+        remove_markers(
+            _connect(task, pool), run.remote_markers, [recipe.name for recipe in recipes]
+        )
+
+
+def _deploy_task(task: Task, pool: "ConnectionPool", run: _Deployment) -> None:
+    """Deploy a single ``task`` and record the outcome of each of its recipes."""
 
-    recipe_cache_path = deployment_cache_path / recipe.name
-    if recipe_cache_path.is_file():
-        with recipe_cache_path.open("r", encoding="utf-8") as fp:
-            cache_contents = fp.read()
-        if recipe.deep_hash() in cache_contents and not force:
+    log = run.log
+    pending = _pending_recipes(task, run.store, run.force)
+    for recipe in _recipes_of(task):
+        if recipe not in pending:
             log.warning(
                 f"Skipping {recipe.name} because it is already deployed"
             )
-            return
+    if not pending:
+        return
 
     started_recipe = datetime.now()
     log.info(
-        f"Starting recipe '{recipe.name}' at "
-        f"{started_recipe:%H:%M:%S} on {started_all:%Y-%m-%d}"
+        f"Starting recipe '{task.name}' at "
+        f"{started_recipe:%H:%M:%S} on {run.started_all:%Y-%m-%d}"
     )
-    recipe.deploy()
-    ended_recipe = datetime.now()
+    status = Status.FAILED
+    try:
+        if run.remote_markers:
+            _remove_markers(task, pending, pool, run)
+        with span("deploy", host=task.hostname, recipe=task.name):
+            if isinstance(task, PackageBatch):
+                task.deploy(pending, pool)
+            else:
+                task.deploy(pool)
+        status = Status.SUCCEEDED
+    finally:
+        ended_recipe = datetime.now()
+        with span("record", host=task.hostname, recipe=task.name):
+            for recipe in pending:
+                run.store.record(
+                    Record(
+                        config=run.config_name,
+                        deployment=run.deployment,
+                        host=recipe.hostname,
+                        recipe=recipe.name,
+                        deep_hash=recipe.deep_hash(),
+                        status=status,
+                        started=started_recipe.timestamp(),
+                        finished=ended_recipe.timestamp(),
+                    )
+                )
+    if run.remote_markers:
+        _write_markers(task, pending, pool, run)
     log.info(
-        f"Finished recipe '{recipe.name}' at "
-        f"{ended_recipe:%H:%M:%S} on {started_all:%Y-%m-%d}"
+        f"Finished recipe '{task.name}' at "
+        f"{ended_recipe:%H:%M:%S} on {run.started_all:%Y-%m-%d}"
     )
 
     total_recipe_time = ended_recipe - started_recipe
-    log.info(f"{recipe.name} finished in {reformat_time(total_recipe_time)}")
-    with recipe_cache_path.open("w", encoding="utf-8") as fp:
-        fp.write(recipe.deep_hash())
+    log.info(f"{task.name} finished in {reformat_time(total_recipe_time)}")
 
 
+def _record_skipped(statuses: Dict[Task, str], run: _Deployment) -> None:
+    """Record the pending recipes of skipped tasks, so they are retried next time."""
+
+    now = datetime.now().timestamp()
+    for task, status in statuses.items():
+        if status != Status.SKIPPED:
+            continue
+        for recipe in _pending_recipes(task, run.store, run.force):
+            run.store.record(
+                Record(
+                    config=run.config_name,
+                    deployment=run.deployment,
+                    host=recipe.hostname,
+                    recipe=recipe.name,
+                    deep_hash=recipe.deep_hash(),
+                    status=Status.SKIPPED,
+                    started=now,
+                    finished=now,
+                )
+            )
+
+
+def _log_retries(plan: Plan, run: _Deployment) -> None:
+    """Log how many pending recipes failed or were skipped on their last attempt."""
+
+    retried = 0
+    for task in plan.tasks:
+        for recipe in _pending_recipes(task, run.store, run.force):
+            latest = run.store.latest(recipe.hostname, recipe.name)
+            if latest is not None and latest[1] != Status.SUCCEEDED:
+                retried += 1
+    if retried:
+        run.log.info(f"Retrying {retried} recipe(s) that failed or were skipped last time")
+
+
+def _check_statuses(statuses: Dict[Task, str], log: logging.Logger) -> None:
+    """Raise ``RuntimeError`` if any recipe in ``statuses`` failed."""
+
+    failed = [r.name for r, status in statuses.items() if status == Status.FAILED]
+    skipped = [r.name for r, status in statuses.items() if status == Status.SKIPPED]
+    if failed:
+        log.error("Failed recipes: %s", ", ".join(failed))
+        if skipped:
+            log.error("Skipped recipes: %s", ", ".join(skipped))
+        raise RuntimeError(f"{len(failed)} recipe(s) failed to deploy")
+
+
+def _run_plan(plan: Plan, run: _Deployment, args: Namespace, cfg: Config) -> Dict[Task, str]:
+    """Deploy the tasks of ``plan`` concurrently and return their statuses.
+
+    When every recipe is already deployed, no connection is opened and the
+    SSH stack is not even imported.
+    """
+
+    # Past durations put the longest chains of recipes first. Estimating
+    # also computes the deep hash of every recipe.
+    with span("hash_recipes"):
+        cost = _cost(_estimate(plan, run.store, run.force))
+    if not any(_pending_recipes(task, run.store, run.force) for task in plan.tasks):
+        for task in plan.tasks:
+            for recipe in _recipes_of(task):
+                run.log.warning(f"Skipping {recipe.name} because it is already deployed")
+        return {task: Status.SUCCEEDED for task in plan.tasks}
+
+    if not run.force:
+        _log_retries(plan, run)
+
+    # pylint: disable=import-outside-toplevel
+    from zdeploy.clients import ConnectionPool
+
+    scheduler: Scheduler[Task] = Scheduler(
+        args.jobs, cfg.host_jobs, run.log, cfg.batch_size, cfg.max_failures
+    )
+
+    def work(task: Task) -> None:
+        with log_context(host=task.hostname, recipe=task.name):
+            _deploy_task(task, pool, run)
+
+    with nullcontext(run.pool) if run.pool else ConnectionPool.for_config(run.log, cfg) as pool:
+        if run.remote_markers and not run.force:
+            # Recipes deployed from another machine are skipped too.
+            _check_markers(plan, pool, run, args.jobs)
+            cost = _cost(_estimate(plan, run.store, run.force))
+        statuses = scheduler.run(
+            plan.tasks,
+            plan.requirements,
+            lambda task: task.hostname,
+            propagate(work),
+            name=lambda task: f"{task.name} on {task.hostname}",
+            # A recipe deployed to several hosts is rolled out as one group.
+            group=lambda task: task.name,
+            cost=cost,
+        )
+    _record_skipped(statuses, run)
+    return statuses
+
+
+def _check_markers(plan: Plan, pool: "ConnectionPool", run: _Deployment, jobs: int) -> None:
+    """Read the remote markers of every host with pending tasks, ``jobs`` hosts at a time."""
+
+    hosts: Dict[Tuple[str, int, str], List[Task]] = {}
+    for task in plan.tasks:
+        if _pending_recipes(task, run.store, False):
+            hosts.setdefault((task.hostname, task.port, task.username), []).append(task)
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [
+            executor.submit(propagate(_read_markers), tasks, pool, run)
+            for tasks in hosts.values()
+        ]
+    for future in futures:
+        future.result()
+
+
+def _hash_cache(cfg: Config) -> HashCache:
+    """Return the hash cache of ``cfg``.
+
+    File digests persist across runs; recipe deep hashes are computed once
+    per deployment and shared by every recipe that requires them.
+    """
+
+    return HashCache(Path(cfg.cache) / "hashes.json", cfg.hash_algorithm, cfg.hash_threads)
+
+
+def show_plan(config_name: str, log: logging.Logger, args: Namespace, cfg: Config) -> None:
+    """Log what deploying ``config_name`` would do, without connecting to any host.
+
+    Every task is listed as cached or to be deployed, with its duration
+    predicted from past deployments, followed by the predicted sequential
+    and critical-path times.
+    """
+
+    config_path = Path(cfg.configs) / config_name
+    hash_cache = _hash_cache(cfg)
+    recipes = _load_recipes(config_path, log, cfg, hash_cache)
+    _run_hash_scripts(recipes, cfg)
+    deployment_plan = Plan(recipes)
+    with DeploymentStore(Path(cfg.cache) / STORE_NAME) as store:
+        estimates = _estimate(deployment_plan, store, args.force)
+    hash_cache.save()
+
+    log.info("Plan for %s:", config_path)
+    for task, estimate in estimates.items():
+        if estimate == 0:
+            log.info(f"  cached  {task.name} on {task.hostname}")
+        else:
+            predicted = "no history" if estimate is None else _format_seconds(estimate)
+            log.info(f"  deploy  {task.name} on {task.hostname} ({predicted})")
+    _log_predictions(deployment_plan, estimates, log)
+
+
+def _log_predictions(
+    deployment_plan: Plan, estimates: Dict[Task, float | None], log: logging.Logger
+) -> None:
+    """Log the task counts and predicted times of ``deployment_plan``."""
+
+    cost = _cost(estimates)
+    lengths = chain_lengths(deployment_plan.tasks, deployment_plan.requirements, cost)
+    to_deploy = [task for task, estimate in estimates.items() if estimate != 0]
+    log.info(f"{len(to_deploy)} task(s) to deploy, {len(estimates) - len(to_deploy)} cached")
+    log.info(f"Predicted sequential time: {_format_seconds(sum(map(cost, to_deploy)))}")
+    log.info(f"Predicted critical path: {_format_seconds(max(lengths.values(), default=0))}")
+
+
+def _format_seconds(seconds: float) -> str:
+    """Return ``seconds`` formatted by ``reformat_time``."""
+
+    return reformat_time(timedelta(seconds=round(seconds)))
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
 def deploy(
     config_name: str,
-    cache_dir_path: Path,
     log: logging.Logger,
     args: Namespace,
     cfg: Config,
+    hash_cache: HashCache | None = None,
+    pool: "ConnectionPool | None" = None,
+) -> None:
+    """Deploy recipes defined in ``config_name``.
+
+    ``hash_cache`` and ``pool`` may be kept across deployments to keep file
+    digests and connections warm; by default they last one deployment.
+
+    Every phase of the deployment is traced; the trace is written to the
+    config's log directory in Chrome trace-event format (load it in
+    ``chrome://tracing`` or Perfetto), along with a summary of where the
+    time went, whether or not the deployment succeeded.
+    """
+
+    tracer = Tracer()
+    started = datetime.now()
+    try:
+        with tracer.activate():
+            _deploy(config_name, log, args, cfg, hash_cache or _hash_cache(cfg), pool)
+    finally:
+        _write_trace(tracer, Path(cfg.logs) / config_name / f"{started:%Y-%m-%d %H:%M:%S}", log)
+
+
+def _write_trace(tracer: Tracer, path: Path, log: logging.Logger) -> None:
+    """Write the trace of a deployment next to its log and log its summary."""
+
+    try:
+        trace_path, _ = tracer.write(path)
+    except OSError as exc:
+        log.warning("Failed to write the deployment trace: %s", exc)
+        return
+    log.info("Time spent per phase:")
+    for line in tracer.summary(top=5):
+        log.info(f"  {line}" if line else line)
+    log.info(f"Trace written to {trace_path}")
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def _deploy(
+    config_name: str,
+    log: logging.Logger,
+    args: Namespace,
+    cfg: Config,
+    hash_cache: HashCache,
+    pool: "ConnectionPool | None",
 ) -> None:
-    """Deploy recipes defined in ``config_name``."""
+    """Deploy recipes defined in ``config_name`` in the active trace."""
 
     config_path = Path(cfg.configs) / config_name
     log.info("Config: %s", config_path)
 
-    recipes = _load_recipes(config_path, log, cfg)
+    recipes = _load_recipes(config_path, log, cfg, hash_cache)
+    _run_hash_scripts(recipes, cfg)
 
     started_all = datetime.now()
     log.info(
         f"Starting deployment of {config_path} at {started_all:%H:%M:%S} on {started_all:%Y-%m-%d}"
     )
 
-    deployment_cache_path = cache_dir_path / recipes.get_hash()
-    _clean_cache(cache_dir_path, deployment_cache_path, log)
+    with DeploymentStore(Path(cfg.cache) / STORE_NAME) as store:
+        run = _Deployment(
+            config_name,
+            recipes.get_hash(),
+            store,
+            args.force,
+            started_all,
+            log,
+            cfg.remote_markers,
+            pool,
+        )
+        # Records are kept per (host, recipe), so changing the recipe set
+        # never invalidates recipes whose deep hash is unchanged; only
+        # superseded history is garbage-collected.
+        removed = store.collect_garbage(
+            cfg.cache_max_age * 86400 if cfg.cache_max_age else None,
+            cfg.cache_max_records or None,
+        )
+        if removed:
+            log.info(f"Removed {removed} stale cache record(s)")
 
-    for recipe in recipes:
-        _deploy_recipe(recipe, deployment_cache_path, args.force, started_all, log)
+        # Virtual recipes on the same host are merged into package batches so
+        # the installer runs once per batch rather than once per package.
+        try:
+            statuses = _run_plan(Plan(recipes), run, args, cfg)
+        finally:
+            with span("save_hashes"):
+                hash_cache.save()
 
     ended_all = datetime.now()
     total_deployment_time = ended_all - started_all
@@ -138,3 +609,4 @@ def deploy(
     )
     log.info(f"{config_path} finished in {reformat_time(total_deployment_time)}")
     log.info(f"Deployment hash is {recipes.get_hash()}")
+    _check_statuses(statuses, log)
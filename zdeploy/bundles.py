@@ -0,0 +1,142 @@
+"""Local cache of compressed recipe archives, keyed by content."""
+
+from json import dumps
+from os import replace, utime
+from pathlib import Path
+from tempfile import mkstemp
+from threading import Lock
+from typing import BinaryIO, Dict, List, Tuple
+import tarfile
+
+from zdeploy.config import Config
+from zdeploy.hashing import HashCache
+from zdeploy.tracing import span
+
+# File name suffix of the archives of each supported compression.
+SUFFIXES = {"none": ".tar", "gz": ".tar.gz", "bz2": ".tar.bz2", "xz": ".tar.xz"}
+
+
+class BundleCache:
+    """Recipe directories packed once into archives shared by every host.
+
+    An archive holds a recipe directory, without the deployment config, and
+    is named after a digest of its contents, so it is reused by every host,
+    config and run until a file changes. Archives are written atomically,
+    so concurrent deployments can share the cache directory. Once the
+    archives take more than ``max_bytes``, the least recently used ones are
+    removed; archives are handed out already open, so removing one never
+    affects an upload reading it. Use ``for_config`` to share one cache per
+    directory.
+    """
+
+    VERSION = 2
+
+    _instances: Dict[Tuple[str, int], "BundleCache"] = {}
+    _instances_lock = Lock()
+
+    def __init__(self, directory: Path | str, max_bytes: int) -> None:
+        """Create a cache of at most ``max_bytes`` of archives in ``directory``."""
+
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._key_locks: Dict[str, Lock] = {}
+
+    @classmethod
+    def for_config(cls, cfg: Config) -> "BundleCache | None":
+        """Return the shared cache of ``cfg``, or ``None`` if bundles are disabled."""
+
+        if cfg.bundle_cache_size <= 0:
+            return None
+        directory = str((Path(cfg.cache) / "bundles").absolute())
+        key = (directory, cfg.bundle_cache_size)
+        with cls._instances_lock:
+            cache = cls._instances.get(key)
+            if cache is None:
+                cache = cls._instances[key] = cls(directory, cfg.bundle_cache_size << 20)
+            return cache
+
+    def get(self, src: Path, compression: str, hash_cache: HashCache) -> BinaryIO:
+        """Return the archive of ``src`` open for reading, packing it if needed.
+
+        The contents are identified once per ``hash_cache`` lifetime, so the
+        recipe directory is walked once per deployment however many hosts
+        receive it. The caller closes the archive.
+        """
+
+        if compression not in SUFFIXES:
+            raise ValueError(f"unsupported compression: {compression}")
+        key = hash_cache.memo(
+            ("bundle", str(src), compression),
+            lambda: self._key(src, compression, hash_cache),
+        )
+        path = self.directory / f"{key}{SUFFIXES[compression]}"
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, Lock())
+        with key_lock:
+            try:
+                archive = path.open("rb")
+            except FileNotFoundError:
+                with span("pack", recipe=src.name):
+                    self._pack(src, compression, path)
+                archive = path.open("rb")
+                self._evict(path)
+            else:
+                # The modification time orders archives by last use.
+                utime(path)
+        return archive
+
+    @staticmethod
+    def _key(src: Path, compression: str, hash_cache: HashCache) -> str:
+        """Return a digest of everything ``src`` would be packed with."""
+
+        entries: List[Tuple[str, str, int]] = []
+        pending = [(src, ".")]
+        while pending:
+            directory, rel_dir = pending.pop()
+            for name, is_file, is_dir in hash_cache.scandir(directory):
+                path, rel_path = directory / name, f"{rel_dir}/{name}"
+                if is_dir:
+                    pending.append((path, rel_path))
+                    entries.append((rel_path, "", path.stat().st_mode))
+                elif is_file:
+                    entries.append((rel_path, hash_cache.file_hash(path), path.stat().st_mode))
+        entries.sort()
+        description = {"version": BundleCache.VERSION, "compression": compression}
+        return hash_cache.digest(dumps([description, entries]).encode())
+
+    def _pack(self, src: Path, compression: str, path: Path) -> None:
+        """Write the archive of ``src`` to ``path`` atomically."""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = mkstemp(dir=self.directory, prefix=".pack-")
+        try:
+            mode = "w" if compression == "none" else f"w:{compression}"
+            with open(fd, "wb") as fp:
+                with tarfile.open(fileobj=fp, mode=mode) as archive:  # type: ignore[call-overload]
+                    archive.add(str(src), arcname=".")
+            replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    def _evict(self, keep: Path) -> None:
+        """Remove the least recently used archives but ``keep`` past ``max_bytes``."""
+
+        archives = []
+        for path in self.directory.iterdir():
+            if path.name.startswith("."):
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            archives.append((st.st_mtime_ns, st.st_size, path))
+        total = sum(size for _, size, _ in archives)
+        for _, size, path in sorted(archives, key=lambda archive: archive[0]):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            total -= size
@@ -1,9 +1,16 @@
 """Remote client helpers for recipes."""
 
+from threading import Lock
+from typing import Dict, Tuple
 import logging
 from paramiko import SSHClient, AutoAddPolicy, Transport
+from paramiko.ssh_exception import SSHException
 from scp import SCPClient
 
+from zdeploy.config import Config
+from zdeploy.pump import STDERR, OutputPump
+from zdeploy.tracing import span
+
 
 class SSH(SSHClient):
     """SSH helper that exposes a simple execute function."""
@@ -26,11 +33,21 @@ class SSH(SSHClient):
         self.connect(hostname=hostname, port=port, username=username, password=password)
         self.recipe = recipe
         self.log = log
-
-    def __del__(self) -> None:
-        """Ensure the SSH connection is closed."""
-
-        self.close()
+        # Default timeouts, in seconds, of commands run with execute.
+        self.idle_timeout: float | None = None
+        self.timeout: float | None = None
+
+    def is_alive(self) -> bool:
+        """Return ``True`` if the underlying transport is still usable."""
+
+        transport = self.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except (SSHException, OSError, EOFError):
+            return False
+        return True
 
     def execute(
         self,
@@ -39,16 +56,45 @@ class SSH(SSHClient):
         show_command: bool = True,
         show_output: bool = True,
         show_error: bool = True,
+        recipe: str | None = None,
+        idle_timeout: float | None = None,
+        timeout: float | None = None,
     ) -> int:
-        """Run ``args`` over SSH and return the exit code."""
+        """Run ``args`` over SSH and return the exit code.
+
+        Output lines are prefixed with ``recipe`` (defaults to the recipe
+        the connection was opened for); stderr lines are marked as such.
+        The command is aborted with ``CommandTimeout`` if it prints nothing
+        for ``idle_timeout`` seconds or runs longer than ``timeout`` seconds
+        (both default to the connection's own timeouts).
+        """
         cmd = " ".join(args)
         if show_command:
             self.log.info("Running %s", cmd)
-        _, stdout, _ = self.exec_command(f"{cmd} 2>&1")
-        if show_output:
-            for line in stdout:
-                self.log.info(f"{self.recipe}: {line.rstrip()}")
-        rc = stdout.channel.recv_exit_status()
+        transport = self.get_transport()
+        if transport is None:
+            raise SSHException("SSH session not active")
+        channel = transport.open_session()
+        channel.exec_command(cmd)
+        prefix = recipe if recipe is not None else self.recipe
+
+        def handle_line(stream: str, line: str) -> None:
+            if not show_output:
+                return
+            if stream == STDERR:
+                self.log.info(f"{prefix} (stderr): {line}")
+            else:
+                self.log.info(f"{prefix}: {line}")
+
+        try:
+            rc = OutputPump.shared().run(
+                channel,
+                handle_line,
+                idle_timeout if idle_timeout is not None else self.idle_timeout,
+                timeout if timeout is not None else self.timeout,
+            )
+        finally:
+            channel.close()
         if rc != 0:
             if show_error:
                 self.log.error("Failed to run '%s'. Exit code: %s", cmd, rc)
@@ -65,12 +111,106 @@ class SCP(SCPClient):
 
         super().__init__(transport)
 
-    def __del__(self) -> None:
-        """Ensure the SCP connection is closed."""
-
-        self.close()
-
     def upload(self, src: str, dest: str) -> None:
         """Upload ``src`` to ``dest`` on the remote host."""
 
         self.put(src, remote_path=dest)
+
+
+class ConnectionPool:
+    """Share one authenticated SSH connection per host for a deployment.
+
+    Connections are keyed by ``(hostname, port, username)``, kept alive
+    with SSH keepalive packets and re-established when a health check
+    fails. Call ``close`` (or use the pool as a context manager) once the
+    deployment is done.
+    """
+
+    def __init__(
+        self,
+        log: logging.Logger,
+        keepalive: int = 30,
+        idle_timeout: float | None = None,
+        timeout: float | None = None,
+    ) -> None:
+        """Create an empty pool sending keepalives every ``keepalive`` seconds.
+
+        Commands run on pooled connections default to ``idle_timeout`` and
+        ``timeout`` (see ``SSH.execute``).
+        """
+
+        self.log = log
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._lock = Lock()
+        self._host_locks: Dict[Tuple[str, int, str], Lock] = {}
+        self._clients: Dict[Tuple[str, int, str], SSH] = {}
+
+    @classmethod
+    def for_config(cls, log: logging.Logger, cfg: Config) -> "ConnectionPool":
+        """Return a pool using the keepalive and command timeouts of ``cfg``."""
+
+        return cls(
+            log,
+            cfg.keepalive,
+            cfg.command_idle_timeout or None,
+            cfg.command_timeout or None,
+        )
+
+    def __enter__(self) -> "ConnectionPool":
+        """Return the pool itself."""
+
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Close every pooled connection."""
+
+        self.close()
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def get(
+        self,
+        recipe: str,
+        hostname: str,
+        username: str,
+        password: str | None,
+        port: int,
+    ) -> SSH:
+        """Return a healthy connection to ``username@hostname:port``."""
+
+        key = (hostname, port, username)
+        with self._lock:
+            host_lock = self._host_locks.setdefault(key, Lock())
+        with host_lock:
+            ssh = self._clients.get(key)
+            if ssh is not None:
+                if ssh.is_alive():
+                    return ssh
+                self.log.warning("Connection to %s:%s was lost; reconnecting", hostname, port)
+                ssh.close()
+            with span("connect", host=hostname):
+                ssh = SSH(
+                    recipe=recipe,
+                    log=self.log,
+                    hostname=hostname,
+                    username=username,
+                    password=password,
+                    port=port,
+                )
+            ssh.idle_timeout = self.idle_timeout
+            ssh.timeout = self.timeout
+            transport = ssh.get_transport()
+            if transport is not None and self.keepalive > 0:
+                transport.set_keepalive(self.keepalive)
+            self._clients[key] = ssh
+            return ssh
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for ssh in clients:
+            ssh.close()
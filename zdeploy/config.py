@@ -2,6 +2,7 @@
 # pylint: disable=too-many-instance-attributes
 
 from dataclasses import dataclass
+from hashlib import algorithms_guaranteed
 from json import loads
 from os.path import isfile
 from typing import Any, Dict, cast
@@ -22,6 +23,34 @@ class Config:
     user: str = "root"
     password: str | None = None
     port: int = 22
+    jobs: int = 1
+    host_jobs: int = 1
+    keepalive: int = 30
+    parallel_configs: int = 1
+    upload: str = "scp"
+    compression: str = "gz"
+    cache_max_age: int = 90
+    cache_max_records: int = 20
+    hash_jobs: int = 4
+    hash_timeout: int = 300
+    hash_algorithm: str = "md5"
+    hash_threads: int = 4
+    command_idle_timeout: int = 0
+    command_timeout: int = 0
+    batch_size: str = "0"
+    max_failures: int | None = None
+    remote_markers: str = ""
+    bundle_cache_size: int = 1024
+    log_json: bool = False
+    log_split: str = "none"
+    log_compress: bool = True
+    log_retention: int = 0
+
+
+def _bool(value: Any) -> bool:
+    """Return ``value`` as a boolean, parsing strings with ``str2bool``."""
+
+    return str2bool(value) if isinstance(value, str) else bool(value)
 
 
 def load(cfg_path: str = "config.json") -> Config:
@@ -49,10 +78,7 @@ def load(cfg_path: str = "config.json") -> Config:
     # Force is disabled by default. This sets the behavior to
     # only deploy undeployed recipes and/or pick up where a
     # previous deployment was halted or had crashed.
-    force_value = cfg.get("force", Config.force)
-    if isinstance(force_value, str):
-        force_value = str2bool(force_value)
-    cfg["force"] = force_value
+    cfg["force"] = _bool(cfg.get("force", Config.force))
 
     # Default username is root
     cfg["user"] = cfg.get("user", Config.user)
@@ -62,5 +88,88 @@ def load(cfg_path: str = "config.json") -> Config:
 
     cfg["port"] = cfg.get("port", Config.port)
 
+    # Recipes are deployed one at a time unless more jobs are requested.
+    # Independent recipes may then run concurrently, but no more than
+    # host_jobs of them at once on the same host.
+    cfg["jobs"] = int(cfg.get("jobs", Config.jobs))
+    cfg["host_jobs"] = int(cfg.get("host_jobs", Config.host_jobs))
+
+    # A recipe deployed to several hosts is rolled out to at most
+    # batch_size of them at once (a count or a percentage such as "25%";
+    # "0" means all of them). Its rollout is aborted once more than
+    # max_failures hosts failed (null never aborts).
+    cfg["batch_size"] = str(cfg.get("batch_size", Config.batch_size))
+    max_failures = cfg.get("max_failures", Config.max_failures)
+    cfg["max_failures"] = None if max_failures is None else int(max_failures)
+
+    # One connection per host is shared by all of its recipes; keepalive
+    # packets are sent every this many seconds (0 disables them).
+    cfg["keepalive"] = int(cfg.get("keepalive", Config.keepalive))
+
+    # Remote commands are aborted after printing nothing for
+    # command_idle_timeout seconds or running for command_timeout seconds
+    # (0 disables either timeout).
+    cfg["command_idle_timeout"] = int(
+        cfg.get("command_idle_timeout", Config.command_idle_timeout)
+    )
+    cfg["command_timeout"] = int(cfg.get("command_timeout", Config.command_timeout))
+
+    # Every deployment is logged to <logs>/<config>/<timestamp>.log, and
+    # optionally as JSON lines to <timestamp>.jsonl and to one file per
+    # host ("host") or per recipe and host ("recipe") in <timestamp>/.
+    # Logs of previous deployments are gzipped unless log_compress is off,
+    # and removed after log_retention days (0 keeps them).
+    cfg["log_json"] = _bool(cfg.get("log_json", Config.log_json))
+    cfg["log_split"] = cfg.get("log_split", Config.log_split)
+    if cfg["log_split"] not in ("none", "host", "recipe"):
+        raise ValueError(f"invalid log split: {cfg['log_split']}")
+    cfg["log_compress"] = _bool(cfg.get("log_compress", Config.log_compress))
+    cfg["log_retention"] = int(cfg.get("log_retention", Config.log_retention))
+
+    # Configs given on the command line are deployed one at a time by default.
+    cfg["parallel_configs"] = int(cfg.get("parallel_configs", Config.parallel_configs))
+
+    # Recipe directories are uploaded with SCP by default. "tar" streams
+    # them as one (optionally compressed) archive instead, and "delta"
+    # keeps them on the host between runs and only transfers changed
+    # files. Both fall back to SCP if the remote host cannot extract them.
+    cfg["upload"] = cfg.get("upload", Config.upload)
+    if cfg["upload"] not in ("scp", "tar", "delta"):
+        raise ValueError(f"invalid upload mode: {cfg['upload']}")
+    cfg["compression"] = cfg.get("compression", Config.compression)
+
+    # Archives streamed by the "tar" upload mode are packed once per recipe
+    # content into <cache>/bundles and reused for every host, config and
+    # run; the least recently used ones are removed past bundle_cache_size
+    # megabytes (0 packs every upload on the fly instead).
+    cfg["bundle_cache_size"] = int(cfg.get("bundle_cache_size", Config.bundle_cache_size))
+
+    # Deployment records are kept per host and recipe. The latest one is
+    # always kept; older ones are removed after cache_max_age days or past
+    # the cache_max_records most recent ones (0 disables either limit).
+    cfg["cache_max_age"] = int(cfg.get("cache_max_age", Config.cache_max_age))
+    cfg["cache_max_records"] = int(cfg.get("cache_max_records", Config.cache_max_records))
+
+    # Recipe hash scripts run before deploying, up to hash_jobs at once,
+    # and fail after hash_timeout seconds (0 disables the timeout).
+    cfg["hash_jobs"] = int(cfg.get("hash_jobs", Config.hash_jobs))
+    cfg["hash_timeout"] = int(cfg.get("hash_timeout", Config.hash_timeout))
+
+    # Recipe files are hashed with MD5 by default, hash_threads files at a
+    # time. Any fixed-length hashlib algorithm, e.g. sha256 or blake2b, can
+    # be used instead; changing it re-hashes every file once.
+    cfg["hash_algorithm"] = cfg.get("hash_algorithm", Config.hash_algorithm)
+    if cfg["hash_algorithm"] not in algorithms_guaranteed or cfg["hash_algorithm"].startswith(
+        "shake_"
+    ):
+        raise ValueError(f"invalid hash algorithm: {cfg['hash_algorithm']}")
+    cfg["hash_threads"] = int(cfg.get("hash_threads", Config.hash_threads))
+
+    # Hosts keep a marker with the deep hash of every recipe deployed to
+    # them in this remote directory (e.g. /var/lib/zdeploy), so recipes
+    # deployed from another machine are recognized as such. Markers are
+    # neither read nor written when it is empty.
+    cfg["remote_markers"] = cfg.get("remote_markers", Config.remote_markers)
+
     # Convert the dictionary into a Config instance to allow attribute access
     return Config(**cast(Dict[str, Any], cfg))
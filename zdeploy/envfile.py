@@ -0,0 +1,195 @@
+"""Parser for the shell-style variable files used as deployment configs."""
+
+from os import environ
+from pathlib import Path
+from re import Match, compile as re_compile
+from shlex import split as shlex_split
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Mapping, Tuple
+import logging
+
+_ASSIGNMENT = re_compile(r"^(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(.*)$")
+_REFERENCE = re_compile(
+    r"\$(?:\{([A-Za-z_][A-Za-z0-9_]*)(?::-([^}]*))?\}|([A-Za-z_][A-Za-z0-9_]*))"
+)
+
+
+class EnvFile(Mapping[str, str]):
+    """Immutable mapping of the variables defined in a config file.
+
+    Supports ``KEY=value`` and ``export KEY=value`` lines, single and double
+    quotes, ``#`` comments, ``$VAR``/``${VAR}``/``${VAR:-default}``
+    references to earlier variables (falling back to the process
+    environment, which is never modified) and bash arrays such as
+    ``RECIPES=(A B)``, optionally spread over several lines. Array values
+    read as their space-joined items. Lines that cannot be parsed are
+    skipped with a warning, as python-dotenv did.
+    """
+
+    def __init__(self, values: Dict[str, str], arrays: Dict[str, Tuple[str, ...]]) -> None:
+        """Wrap already parsed ``values`` and ``arrays``."""
+
+        self._values = MappingProxyType(dict(values))
+        self._arrays = MappingProxyType(dict(arrays))
+
+    @classmethod
+    def load(cls, path: Path, log: logging.Logger | None = None) -> "EnvFile":
+        """Parse the file at ``path``, warning about unparseable lines on ``log``."""
+
+        with open(path, "r", encoding="utf-8") as fp:
+            return cls.parse(fp.read(), str(path), log)
+
+    @classmethod
+    def parse(
+        cls, text: str, source: str = "<string>", log: logging.Logger | None = None
+    ) -> "EnvFile":
+        """Parse ``text``; ``source`` names it in the warnings logged to ``log``."""
+
+        log = log or logging.getLogger(__name__)
+        values: Dict[str, str] = {}
+        arrays: Dict[str, Tuple[str, ...]] = {}
+        lines = text.splitlines()
+        lineno = 0
+        while lineno < len(lines):
+            line = lines[lineno].strip()
+            lineno += 1
+            if not line or line.startswith("#"):
+                continue
+            match = _ASSIGNMENT.match(line)
+            if match is None:
+                log.warning("%s:%d: skipping %r, expected KEY=VALUE", source, lineno, line)
+                continue
+            key, raw = match.groups()
+            try:
+                if raw.startswith("("):
+                    body = raw[1:]
+                    while ")" not in _strip_comment(body) and lineno < len(lines):
+                        body += "\n" + lines[lineno]
+                        lineno += 1
+                    body = _strip_comment(body)
+                    if ")" not in body:
+                        raise ValueError(f"{source}:{lineno}: unterminated array {key}")
+                    body = body[: body.rindex(")")]
+                    items = tuple(
+                        _expand(item, values) for item in shlex_split(body, comments=True)
+                    )
+                    arrays[key] = items
+                    values[key] = " ".join(items)
+                else:
+                    values[key] = _parse_value(raw, values, f"{source}:{lineno}")
+            except ValueError as exc:
+                log.warning("%s; skipping %s", exc, key)
+        return cls(values, arrays)
+
+    def __getitem__(self, key: str) -> str:
+        """Return the value of ``key``."""
+
+        return self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over variable names in file order."""
+
+        return iter(self._values)
+
+    def __len__(self) -> int:
+        """Return the number of variables."""
+
+        return len(self._values)
+
+    def array(self, key: str) -> Tuple[str, ...]:
+        """Return the items of ``key``, splitting plain values on whitespace."""
+
+        if key in self._arrays:
+            return self._arrays[key]
+        value = self._values.get(key, "").strip()
+        if value.startswith("(") and value.endswith(")"):
+            value = value[1:-1]
+        return tuple(value.split())
+
+    def prefix_index(self, names: Iterable[str]) -> Dict[str, Dict[str, str]]:
+        """Map each of ``names`` to its ``<NAME>_*`` variables in one pass.
+
+        A variable belongs to the longest name it is prefixed by, so with
+        recipes ``NODE`` and ``NODE_EXPORTER``, ``NODE_EXPORTER_PORT`` is a
+        property of ``NODE_EXPORTER`` only. Variables that are themselves
+        recipe names are never properties.
+        """
+
+        name_set = set(names)
+        index: Dict[str, Dict[str, str]] = {name: {} for name in name_set}
+        for key, value in self._values.items():
+            if key in name_set:
+                continue
+            owner = None
+            position = key.find("_")
+            while position != -1:
+                if key[:position] in name_set:
+                    owner = key[:position]
+                position = key.find("_", position + 1)
+            if owner is not None:
+                index[owner][key] = value
+        return index
+
+
+def _strip_comment(text: str) -> str:
+    """Return ``text`` without a trailing unquoted ``#`` comment on each line."""
+
+    lines: List[str] = []
+    for line in text.split("\n"):
+        quote = ""
+        for i, char in enumerate(line):
+            if quote:
+                if char == quote:
+                    quote = ""
+            elif char in "'\"":
+                quote = char
+            elif char == "#" and (i == 0 or line[i - 1].isspace()):
+                line = line[:i]
+                break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _expand(value: str, values: Mapping[str, str]) -> str:
+    """Replace ``$VAR``, ``${VAR}`` and ``${VAR:-default}`` in ``value``.
+
+    As in the shell, the default replaces unset and empty variables.
+    """
+
+    def lookup(match: Match[str]) -> str:
+        name = match.group(1) or match.group(3)
+        value = values.get(name, environ.get(name, ""))
+        default = match.group(2)
+        return default if default is not None and not value else value
+
+    return _REFERENCE.sub(lookup, value)
+
+
+def _parse_value(raw: str, values: Mapping[str, str], where: str) -> str:
+    """Return the value of the right-hand side ``raw`` of an assignment."""
+
+    if raw.startswith("'"):
+        end = raw.find("'", 1)
+        if end == -1:
+            raise ValueError(f"{where}: unterminated single quote")
+        return raw[1:end]
+    if raw.startswith('"'):
+        # Escaped characters are kept literally; everything else is expanded.
+        parts: List[str] = []
+        segment = ""
+        i = 1
+        while i < len(raw):
+            char = raw[i]
+            if char == "\\" and i + 1 < len(raw):
+                nxt = raw[i + 1]
+                parts.append(_expand(segment, values))
+                parts.append({"n": "\n", "t": "\t"}.get(nxt, nxt if nxt in '"\\$' else char + nxt))
+                segment = ""
+                i += 2
+                continue
+            if char == '"':
+                return "".join(parts) + _expand(segment, values)
+            segment += char
+            i += 1
+        raise ValueError(f"{where}: unterminated double quote")
+    return _expand(_strip_comment(raw).strip(), values)
@@ -0,0 +1,164 @@
+"""Recipe dependency graph."""
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Set, Tuple
+import logging
+
+if TYPE_CHECKING:
+    from zdeploy.recipe import Recipe
+
+
+class CycleError(ValueError):
+    """Raised when recipe requirements form a cycle."""
+
+
+def parse_requirements(req_file: Path) -> List[str]:
+    """Return the requirement names listed in ``req_file``."""
+
+    requirements: List[str] = []
+    if req_file.is_file():
+        with req_file.open("r", encoding="utf-8") as req_fp:
+            for requirement in req_fp.read().split("\n"):
+                requirement = requirement.strip()
+                if requirement == "" or requirement.startswith("#"):
+                    continue
+                requirements.append(requirement)
+    return requirements
+
+
+class DependencyGraph:
+    """Directed acyclic graph of recipes and their requirements.
+
+    Each ``require`` file is parsed once per graph and every recipe is
+    stored as a single node, no matter how many parents require it.
+    Nodes are kept in the order they finish a depth-first traversal,
+    which is a stable topological order (requirements first).
+    """
+
+    def __init__(self, log: logging.Logger) -> None:
+        """Create an empty graph logging to ``log``."""
+
+        self.log = log
+        self._require_files: Dict[Path, Tuple[str, ...]] = {}
+        self._nodes: Dict["Recipe", "Recipe"] = {}
+        self._requirements: Dict["Recipe", List["Recipe"]] = {}
+        self._dependents: Dict["Recipe", List["Recipe"]] = {}
+
+    def __iter__(self) -> Iterator["Recipe"]:
+        """Iterate over recipes in topological order."""
+
+        return iter(self._nodes)
+
+    def __len__(self) -> int:
+        """Return the number of recipes in the graph."""
+
+        return len(self._nodes)
+
+    def __contains__(self, recipe: object) -> bool:
+        """Return ``True`` if ``recipe`` is a node of the graph."""
+
+        return recipe in self._nodes
+
+    def read_requirements(self, req_file: Path) -> Tuple[str, ...]:
+        """Return the requirement names in ``req_file``, parsing it only once."""
+
+        names = self._require_files.get(req_file)
+        if names is None:
+            names = tuple(parse_requirements(req_file))
+            self._require_files[req_file] = names
+        return names
+
+    def add(self, recipe: "Recipe") -> "Recipe":
+        """Add ``recipe`` and everything it requires; return the stored node.
+
+        Raises ``CycleError`` with the offending path if the requirements
+        of ``recipe`` lead back to a recipe that is still being resolved.
+        """
+
+        existing = self._nodes.get(recipe)
+        if existing is not None:
+            return existing
+
+        path: List["Recipe"] = [recipe]
+        on_path: Set["Recipe"] = {recipe}
+        pending: Dict["Recipe", List["Recipe"]] = {recipe: []}
+        stack = [(recipe, iter(self._requirement_names(recipe)))]
+        while stack:
+            node, names = stack[-1]
+            name = next(names, None)
+            if name is None:
+                stack.pop()
+                path.pop()
+                on_path.discard(node)
+                self._finish(node, pending.pop(node))
+                continue
+
+            child = node.requirement(name)
+            if child in on_path:
+                cycle = path[path.index(child):] + [child]
+                description = " -> ".join(r.name for r in cycle)
+                self.log.error("Invalid recipe: requirement cycle %s", description)
+                raise CycleError(f"requirement cycle: {description}")
+            canonical = self._nodes.get(child)
+            if canonical is not None:
+                if canonical not in pending[node]:
+                    pending[node].append(canonical)
+                continue
+            if child not in pending[node]:
+                pending[node].append(child)
+            path.append(child)
+            on_path.add(child)
+            pending[child] = []
+            stack.append((child, iter(self._requirement_names(child))))
+        return self._nodes[recipe]
+
+    def _requirement_names(self, recipe: "Recipe") -> Tuple[str, ...]:
+        """Return the requirement names declared by ``recipe``."""
+
+        if recipe.entry is None or not recipe.entry.has_require:
+            return ()
+        return self.read_requirements(recipe.entry.path / "require")
+
+    def _finish(self, recipe: "Recipe", requirements: List["Recipe"]) -> None:
+        """Record ``recipe`` as a node whose ``requirements`` are all present."""
+
+        self._nodes[recipe] = recipe
+        self._requirements[recipe] = requirements
+        self._dependents[recipe] = []
+        for requirement in requirements:
+            self._dependents[requirement].append(recipe)
+
+    def requirements(self, recipe: "Recipe") -> List["Recipe"]:
+        """Return the direct requirements of ``recipe``."""
+
+        return list(self._requirements[self.add(recipe)])
+
+    def dependents(self, recipe: "Recipe") -> List["Recipe"]:
+        """Return the recipes that directly require ``recipe``."""
+
+        return list(self._dependents[self.add(recipe)])
+
+    def closure(self, recipe: "Recipe") -> List["Recipe"]:
+        """Return every transitive requirement of ``recipe`` in topological order."""
+
+        seen: Set["Recipe"] = set()
+        order: List["Recipe"] = []
+        stack = [(self.add(recipe), False)]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            if node in seen:
+                continue
+            seen.add(node)
+            stack.append((node, True))
+            for requirement in reversed(self._requirements[node]):
+                if requirement not in seen:
+                    stack.append((requirement, False))
+        return order[:-1]
+
+    def topological_order(self) -> List["Recipe"]:
+        """Return all recipes with requirements ahead of their dependents."""
+
+        return list(self._nodes)
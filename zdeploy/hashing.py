@@ -0,0 +1,186 @@
+"""Content hash cache keyed by file metadata."""
+# pylint: disable=too-many-instance-attributes
+
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import new as new_hash
+from json import dumps, loads
+from os import replace, scandir, stat
+from pathlib import Path
+from tempfile import mkstemp
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Tuple
+
+from zdeploy.tracing import propagate, span
+
+
+class HashCache:
+    """Cache file digests by path and ``(size, mtime_ns, inode)``.
+
+    Files are hashed in fixed-size chunks with ``algorithm`` (any hashlib
+    algorithm, MD5 by default), up to ``workers`` files at a time; hashlib
+    releases the GIL, so large files are hashed on several cores with flat
+    memory use. File digests are persisted to ``path`` (when given) so that
+    unchanged files are never re-read across runs. Directory listings, recipe
+    deep hashes and other values memoized with ``memo`` (such as hash script
+    outputs) are only kept in memory until the cache is ``reset``.
+    """
+
+    VERSION = 1
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, path: Path | None = None, algorithm: str = "md5", workers: int = 1) -> None:
+        """Create a cache, loading persisted entries from ``path``."""
+
+        new_hash(algorithm)  # Raises ValueError for unknown algorithms.
+        self.path = path
+        self.algorithm = algorithm
+        self.workers = max(1, workers)
+        self._lock = Lock()
+        self._files: Dict[str, Tuple[int, int, int, str]] = {}
+        self._listings: Dict[str, List[Tuple[str, bool, bool]]] = {}
+        self._recipes: Dict[str, str] = {}
+        self._memo: Dict[Hashable, str] = {}
+        self._memo_locks: Dict[Hashable, Lock] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        """Read persisted file digests, ignoring unreadable caches."""
+
+        if self.path is None or not self.path.is_file():
+            return
+        try:
+            data = loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("version") != self.VERSION:
+            return
+        # Caches written before the algorithm was configurable hold MD5 digests.
+        if data.get("algorithm", "md5") != self.algorithm:
+            return
+        for file_path, entry in data.get("files", {}).items():
+            size, mtime_ns, inode, digest = entry
+            self._files[file_path] = (size, mtime_ns, inode, digest)
+
+    def save(self) -> None:
+        """Persist file digests atomically if anything changed."""
+
+        if self.path is None or not self._dirty:
+            return
+        with self._lock:
+            data = {"version": self.VERSION, "algorithm": self.algorithm, "files": self._files}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Concurrent deployments may save at the same time; each writes
+            # its own temporary file and the last rename wins.
+            fd, tmp_path = mkstemp(dir=self.path.parent, prefix=f"{self.path.name}.")
+            with open(fd, "w", encoding="utf-8") as fp:
+                fp.write(dumps(data))
+            replace(tmp_path, self.path)
+            self._dirty = False
+
+    def reset(self) -> None:
+        """Forget everything but file digests, so changes are picked up.
+
+        Directory listings, recipe deep hashes and memoized values are
+        computed again; unchanged files are still not re-read.
+        """
+
+        with self._lock:
+            self._listings.clear()
+            self._recipes.clear()
+            self._memo.clear()
+            self._memo_locks.clear()
+
+    def digest(self, data: bytes) -> str:
+        """Return the hex digest of ``data``."""
+
+        return new_hash(self.algorithm, data).hexdigest()
+
+    def file_hash(self, file_path: Path) -> str:
+        """Return the digest of ``file_path``, reading it only if changed."""
+
+        key = str(file_path)
+        st = stat(key)
+        signature = (st.st_size, st.st_mtime_ns, st.st_ino)
+        with self._lock:
+            entry = self._files.get(key)
+        if entry is not None and entry[:3] == signature:
+            return entry[3]
+        with span("hash_file", path=key, size=st.st_size):
+            hasher = new_hash(self.algorithm)
+            buffer = bytearray(self.CHUNK_SIZE)
+            view = memoryview(buffer)
+            with open(key, "rb", buffering=0) as fp:
+                while True:
+                    size = fp.readinto(buffer)
+                    if not size:
+                        break
+                    hasher.update(view[:size])
+            digest = hasher.hexdigest()
+        with self._lock:
+            self._files[key] = (*signature, digest)
+            self._dirty = True
+        return digest
+
+    def file_hashes(self, file_paths: List[Path]) -> List[str]:
+        """Return the digests of ``file_paths``, hashing changed files in parallel."""
+
+        if self.workers == 1 or len(file_paths) < 2:
+            return [self.file_hash(file_path) for file_path in file_paths]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(file_paths))) as executor:
+            return list(executor.map(propagate(self.file_hash), file_paths))
+
+    def scandir(self, dir_path: Path) -> List[Tuple[str, bool, bool]]:
+        """Return ``(name, is_file, is_dir)`` for the entries of ``dir_path``, by name.
+
+        Each directory is scanned once per cache, and the entry types come
+        from the scan itself rather than an extra ``stat`` per entry. Entries
+        are sorted, since the order of a scan depends on the filesystem.
+        """
+
+        key = str(dir_path)
+        with self._lock:
+            entries = self._listings.get(key)
+        if entries is None:
+            with scandir(key) as scanned:
+                entries = sorted(
+                    (entry.name, entry.is_file(), entry.is_dir()) for entry in scanned
+                )
+            with self._lock:
+                self._listings[key] = entries
+        return entries
+
+    def get_recipe_hash(self, key: str) -> str | None:
+        """Return a memoized recipe deep hash for ``key``."""
+
+        with self._lock:
+            return self._recipes.get(key)
+
+    def set_recipe_hash(self, key: str, digest: str) -> None:
+        """Memoize the recipe deep hash ``digest`` under ``key``."""
+
+        with self._lock:
+            self._recipes[key] = digest
+
+    def memo(self, key: Hashable, compute: Callable[[], str]) -> str:
+        """Return the value memoized under ``key``, calling ``compute`` only once.
+
+        Concurrent callers asking for the same ``key`` wait for the first
+        one instead of computing it again.
+        """
+
+        with self._lock:
+            key_lock = self._memo_locks.setdefault(key, Lock())
+        with key_lock:
+            with self._lock:
+                value = self._memo.get(key)
+            if value is None:
+                value = compute()
+                with self._lock:
+                    self._memo[key] = value
+        return value
+
+    def script_output(self, key: Tuple[str, str], run: Callable[[], str]) -> str:
+        """Return the output of the hash script ``key``, calling ``run`` only once."""
+
+        return self.memo(("script", *key), run)
@@ -0,0 +1,217 @@
+"""Deployment logging through a queue, with per-host files and retention."""
+# pylint: disable=too-many-instance-attributes,too-few-public-methods
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from gzip import open as gzip_open
+from json import dumps
+from logging.handlers import QueueHandler, QueueListener
+from os import utime
+from pathlib import Path
+from queue import SimpleQueue
+from shutil import copyfileobj
+from sys import stdout
+from typing import Any, Dict, Iterator, List, Mapping
+import logging
+import time
+
+from zdeploy.config import Config
+
+# Attributes added to the log records emitted in the current context.
+_fields: ContextVar[Mapping[str, str]] = ContextVar("zdeploy_log_fields", default={})
+
+# Record attributes copied into JSON-lines entries.
+FIELDS = ("host", "recipe")
+
+
+@contextmanager
+def log_context(**fields: str) -> Iterator[None]:
+    """Tag the records logged by the enclosed block with ``fields``."""
+
+    token = _fields.set({**_fields.get(), **fields})
+    try:
+        yield
+    finally:
+        _fields.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    """Copy the fields of ``log_context`` onto each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in _fields.get().items():
+            setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "config": record.name,
+        }
+        for key in FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        entry["message"] = record.getMessage()
+        return dumps(entry)
+
+
+class SplitFileHandler(logging.Handler):
+    """Write the records of each host, or of each recipe on each host, to its own file.
+
+    Files are opened in ``directory`` on first use; records logged outside
+    of any host are left out.
+    """
+
+    def __init__(self, directory: Path, split: str) -> None:
+        """Split records by ``split``, either ``"host"`` or ``"recipe"``."""
+
+        super().__init__()
+        self.directory = directory
+        self.split = split
+        self._handlers: Dict[str, logging.FileHandler] = {}
+
+    def _file_name(self, record: logging.LogRecord) -> str | None:
+        """Return the file name ``record`` belongs to, if any."""
+
+        host = getattr(record, "host", None)
+        if host is None:
+            return None
+        recipe = getattr(record, "recipe", None)
+        name = f"{recipe}@{host}" if self.split == "recipe" and recipe else host
+        return name.replace("/", "_")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        name = self._file_name(record)
+        if name is None:
+            return
+        handler = self._handlers.get(name)
+        if handler is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            handler = logging.FileHandler(self.directory / f"{name}.log", encoding="utf-8")
+            handler.setFormatter(self.formatter or logging.Formatter("%(message)s"))
+            self._handlers[name] = handler
+        handler.emit(record)
+
+    def close(self) -> None:
+        for handler in self._handlers.values():
+            handler.close()
+        self._handlers.clear()
+        super().close()
+
+
+class DeploymentLog:
+    """Route the records of one config deployment through a queue.
+
+    Logging only enqueues records; a listener thread writes them to the
+    terminal, to ``<stamp>.log`` in ``directory`` and, as configured, to
+    ``<stamp>.jsonl`` and to per-host or per-recipe files in ``<stamp>/``.
+    Remote output is therefore never held up by disk or terminal I/O.
+    Once the deployment is done, the handlers are removed again and older
+    logs are compressed and expired (see ``apply_retention``).
+    """
+
+    def __init__(
+        self, logger: logging.Logger, cfg: Config, directory: Path, prefix: bool = False
+    ) -> None:
+        """Log ``logger`` to ``directory``, prefixing terminal lines with its name if asked."""
+
+        self.logger = logger
+        self.cfg = cfg
+        self.directory = directory
+        self.started = time.time()
+        self.stamp = f"{datetime.fromtimestamp(self.started):%Y-%m-%d %H:%M:%S}"
+        self.prefix = prefix
+        self.handlers: List[logging.Handler] = []
+        self._queue_handler = QueueHandler(SimpleQueue())
+        self._queue_handler.addFilter(_ContextFilter())
+        self._listener: QueueListener | None = None
+
+    @property
+    def path(self) -> Path:
+        """Return the path of the human-readable log."""
+
+        return self.directory / f"{self.stamp}.log"
+
+    def _handlers(self) -> List[logging.Handler]:
+        """Return the handlers the listener writes records to."""
+
+        formatter = logging.Formatter("%(message)s")
+        stream = logging.StreamHandler(stdout)
+        if self.prefix:
+            # Output of concurrent configs interleaves on the terminal.
+            stream.setFormatter(logging.Formatter("[%(name)s] %(message)s"))
+        else:
+            stream.setFormatter(formatter)
+        human = logging.FileHandler(self.path, encoding="utf-8")
+        human.setFormatter(formatter)
+        handlers: List[logging.Handler] = [stream, human]
+        if self.cfg.log_json:
+            path = self.directory / f"{self.stamp}.jsonl"
+            machine = logging.FileHandler(path, encoding="utf-8")
+            machine.setFormatter(JsonFormatter())
+            handlers.append(machine)
+        if self.cfg.log_split != "none":
+            split = SplitFileHandler(self.directory / self.stamp, self.cfg.log_split)
+            split.setFormatter(formatter)
+            handlers.append(split)
+        return handlers
+
+    def __enter__(self) -> "DeploymentLog":
+        """Start the listener and attach the queue to the logger."""
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.handlers = self._handlers()
+        self._listener = QueueListener(self._queue_handler.queue, *self.handlers)
+        self._listener.start()
+        self.logger.addHandler(self._queue_handler)
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Flush every record, detach the queue and apply the retention policy."""
+
+        self.logger.removeHandler(self._queue_handler)
+        if self._listener is not None:
+            self._listener.stop()
+        for handler in self.handlers:
+            handler.close()
+        # File times come from a coarser clock than time.time(); leave a
+        # margin so files of this deployment never look older than it.
+        apply_retention(
+            self.directory, self.cfg.log_compress, self.cfg.log_retention, self.started - 1
+        )
+
+
+def apply_retention(directory: Path, compress: bool, max_age: int, before: float) -> None:
+    """Compress and expire the logs in ``directory`` last written before ``before``.
+
+    Log files are gzipped when ``compress`` is set, and files older than
+    ``max_age`` days are removed (0 keeps them forever). Files written
+    since ``before``, such as those of the running deployment, are left
+    alone.
+    """
+
+    expired = time.time() - max_age * 86400 if max_age else None
+    for path in sorted(directory.rglob("*"), reverse=True):
+        if path.is_dir():
+            if not any(path.iterdir()):
+                path.rmdir()
+            continue
+        mtime = path.stat().st_mtime
+        if mtime >= before:
+            continue
+        if expired is not None and mtime < expired:
+            path.unlink()
+        elif compress and path.suffix != ".gz":
+            compressed = Path(f"{path}.gz")
+            with path.open("rb") as src, gzip_open(compressed, "wb") as dest:
+                copyfileobj(src, dest)
+            # Keep the original age so the file still expires on time.
+            utime(compressed, (mtime, mtime))
+            path.unlink()
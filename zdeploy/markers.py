@@ -0,0 +1,72 @@
+"""Deployment markers kept on remote hosts.
+
+A marker is a file named ``<recipe>.hash`` in the configured remote
+directory, holding the deep hash of the recipe last deployed to the host.
+Unlike the local deployment store, markers are shared by everyone
+deploying to the host, whichever machine they deploy from.
+"""
+
+from shlex import quote
+from typing import Dict, Iterable
+
+from zdeploy.clients import SSH
+from zdeploy.transfer import run_command
+
+
+def marker_path(marker_dir: str, recipe: str) -> str:
+    """Return the remote path of the marker of ``recipe``."""
+
+    return f"{marker_dir.rstrip('/')}/{recipe}.hash"
+
+
+def read_markers(ssh: SSH, marker_dir: str, recipes: Iterable[str]) -> Dict[str, str]:
+    """Return ``{recipe: deep hash}`` for the markers of ``recipes`` found on the host.
+
+    Every marker is read by one command, so the whole host costs a single
+    round trip. Missing or unreadable markers are simply left out.
+    """
+
+    names = [f"{recipe}.hash" for recipe in recipes]
+    if not names:
+        return {}
+    # grep prints "<file>:<line>" for every file it can read; -s keeps
+    # quiet about missing ones.
+    _, out, _ = run_command(
+        ssh,
+        f"cd {quote(marker_dir)} 2>/dev/null && grep -sH '' -- {' '.join(map(quote, names))}",
+    )
+    markers: Dict[str, str] = {}
+    for line in out.decode(errors="replace").splitlines():
+        name, sep, digest = line.rpartition(":")
+        if sep and name.endswith(".hash") and digest.strip():
+            markers[name[: -len(".hash")]] = digest.strip()
+    return markers
+
+
+def remove_markers(ssh: SSH, marker_dir: str, recipes: Iterable[str]) -> None:
+    """Remove the markers of ``recipes``, in one command.
+
+    Markers are removed before a recipe is deployed again, so a deployment
+    that fails halfway never leaves the marker of the previous version.
+    """
+
+    paths = [quote(marker_path(marker_dir, recipe)) for recipe in recipes]
+    if not paths:
+        return
+    rc, _, err = run_command(ssh, f"rm -f {' '.join(paths)}")
+    if rc != 0:
+        raise RuntimeError(f"failed to remove markers: {err.decode().strip()}")
+
+
+def write_markers(ssh: SSH, marker_dir: str, hashes: Dict[str, str]) -> None:
+    """Record that the recipes of ``hashes`` are deployed with their deep hash."""
+
+    for recipe, digest in hashes.items():
+        path = marker_path(marker_dir, recipe)
+        rc, _, err = run_command(
+            ssh,
+            f"mkdir -p {quote(marker_dir)} && cat > {quote(path)}",
+            f"{digest}\n".encode(),
+        )
+        if rc != 0:
+            raise RuntimeError(f"failed to write {path}: {err.decode().strip()}")
@@ -0,0 +1,140 @@
+"""Deployment planning: turning a ``RecipeSet`` into schedulable tasks."""
+# pylint: disable=too-few-public-methods
+
+from typing import TYPE_CHECKING, Dict, List, Set, Tuple, Union
+
+from zdeploy.recipe import Recipe
+from zdeploy.recipeset import RecipeSet
+from zdeploy.tracing import span
+
+if TYPE_CHECKING:
+    from zdeploy.clients import ConnectionPool
+
+
+class PackageBatch:
+    """Virtual recipes installed on one host with a single installer run."""
+
+    def __init__(self, packages: List[Recipe]) -> None:
+        """Group ``packages``, which must all target the same host."""
+
+        self.packages = packages
+        first = packages[0]
+        self.cfg = first.cfg
+        self.log = first.log
+        self.hostname = first.hostname
+        self.username = first.username
+        self.password = first.password
+        self.port = first.port
+
+    def __str__(self) -> str:
+        """Return a string representation of this batch."""
+
+        return f"{self.name} -> {self.username}@{self.hostname}:{self.port}"
+
+    @property
+    def name(self) -> str:
+        """Return a display name listing the batched packages."""
+
+        return f"packages[{', '.join(p.name for p in self.packages)}]"
+
+    def deploy(self, packages: List[Recipe], pool: "ConnectionPool") -> None:
+        """Install ``packages`` (a subset of this batch) in one installer run.
+
+        Raises if the installer fails, since it is then unknown which of the
+        packages were installed.
+        """
+
+        names = " ".join(p.name for p in packages)
+        self.log.info(f"Installing {names} on {self.hostname}")
+        ssh = pool.get(
+            recipe=self.name,
+            hostname=self.hostname,
+            username=self.username,
+            password=self.password,
+            port=self.port,
+        )
+        try:
+            with span("install", host=self.hostname, recipe=self.name):
+                ssh.execute(f"{self.cfg.installer} {names}", recipe=self.name)
+        except Exception:
+            self.log.error("Failed to install %s", names)
+            raise
+        self.log.info("Done with %s", names)
+
+
+Task = Union[Recipe, PackageBatch]
+
+
+class Plan:
+    """Tasks to deploy, in topological order, with their requirements.
+
+    Virtual recipes that target the same host and sit at the same
+    dependency level are merged into a single ``PackageBatch``. A virtual
+    recipe's level is one below the lowest level of the recipes requiring
+    it (a defined recipe's level is the length of its longest requirement
+    chain), so packages are installed together as late as possible.
+    """
+
+    def __init__(self, recipes: RecipeSet) -> None:
+        """Plan the deployment of ``recipes``."""
+
+        self.recipes = recipes
+        order = list(recipes)
+
+        self._task_of: Dict[Recipe, Task] = {}
+        for packages in self._group_packages(order).values():
+            if len(packages) > 1:
+                batch = PackageBatch(packages)
+                for package in packages:
+                    self._task_of[package] = batch
+
+        # A batch takes the place of its first package, which is ahead of
+        # every recipe requiring any of its packages.
+        self.tasks: List[Task] = []
+        batched: Set[int] = set()
+        for recipe in order:
+            task = self._task_of.setdefault(recipe, recipe)
+            if isinstance(task, PackageBatch):
+                if id(task) in batched:
+                    continue
+                batched.add(id(task))
+            self.tasks.append(task)
+
+    def _group_packages(self, order: List[Recipe]) -> Dict[Tuple[object, ...], List[Recipe]]:
+        """Group the virtual recipes in ``order`` by host and dependency level."""
+
+        graph = self.recipes.graph
+        heights: Dict[Recipe, int] = {}
+        for recipe in order:
+            reqs = [heights[r] for r in graph.requirements(recipe) if r in heights]
+            heights[recipe] = 1 + max(reqs) if reqs else 0
+
+        groups: Dict[Tuple[object, ...], List[Recipe]] = {}
+        for recipe in order:
+            if not recipe.is_virtual():
+                continue
+            dependents = [heights[d] for d in graph.dependents(recipe) if d in heights]
+            level = min(dependents) - 1 if dependents else heights[recipe]
+            key = (recipe.hostname, recipe.port, recipe.username, recipe.password, level)
+            groups.setdefault(key, []).append(recipe)
+        return groups
+
+    def task_of(self, recipe: Recipe) -> Task:
+        """Return the task that deploys ``recipe``."""
+
+        return self._task_of[recipe]
+
+    def requirements(self, task: Task) -> List[Task]:
+        """Return the tasks that must succeed before ``task`` runs."""
+
+        if isinstance(task, PackageBatch):
+            recipes = task.packages
+        else:
+            recipes = [task]
+        requirements: List[Task] = []
+        for recipe in recipes:
+            for requirement in self.recipes.graph.requirements(recipe):
+                req_task = self._task_of.get(requirement)
+                if req_task is not None and req_task is not task and req_task not in requirements:
+                    requirements.append(req_task)
+        return requirements
@@ -0,0 +1,250 @@
+"""Single-threaded output pump multiplexing remote command channels."""
+# pylint: disable=too-many-instance-attributes,too-few-public-methods
+
+from queue import Full, Queue
+from selectors import EVENT_READ, DefaultSelector
+from threading import Lock, Thread
+from typing import Any, Callable, List, Tuple
+import os
+import time
+
+# Bytes read from a channel stream per call.
+CHUNK_SIZE = 1 << 16
+
+# Line batches buffered per command before its channel stops being read.
+QUEUE_SIZE = 64
+
+STDOUT = "stdout"
+STDERR = "stderr"
+
+# A batch of complete lines read from one stream, or None once done.
+Batch = Tuple[str, List[str]] | None
+
+
+class CommandTimeout(RuntimeError):
+    """Raised when a remote command exceeds its idle or total timeout."""
+
+
+class _Command:
+    """A channel being pumped and the state of its streams."""
+
+    def __init__(self, channel: Any, idle_timeout: float | None, timeout: float | None) -> None:
+        now = time.monotonic()
+        self.channel = channel
+        self.idle_timeout = idle_timeout
+        self.deadline = now + timeout if timeout else None
+        self.last_activity = now
+        self.queue: "Queue[Batch]" = Queue(maxsize=QUEUE_SIZE)
+        self.pending: List[Batch] = []
+        self.partial = {STDOUT: b"", STDERR: b""}
+        self.error: Exception | None = None
+        self.done = False
+
+    def expiry(self) -> float | None:
+        """Return when this command times out, if ever."""
+
+        expiries = [self.deadline] if self.deadline is not None else []
+        if self.idle_timeout:
+            expiries.append(self.last_activity + self.idle_timeout)
+        return min(expiries, default=None)
+
+
+class OutputPump:
+    """Read the output of many remote commands from one thread.
+
+    Channels are polled with a selector and drained in large chunks; the
+    data is split into lines in bulk and handed in batches to a bounded
+    queue per command, which the thread waiting for the command consumes.
+    A command whose consumer falls behind is paused until its queue has
+    room again, without slowing down the other channels. stdout and stderr
+    are kept apart, and each command may have an idle and a total timeout.
+    Use ``shared`` to get the process-wide pump.
+    """
+
+    _shared: "OutputPump | None" = None
+    _shared_lock = Lock()
+
+    def __init__(self) -> None:
+        """Create a pump; its thread starts with the first command."""
+
+        self._lock = Lock()
+        self._selector = DefaultSelector()
+        self._commands: List[_Command] = []
+        self._paused: List[_Command] = []
+        self._added: List[_Command] = []
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(self._wakeup_read, EVENT_READ)
+        self._thread: Thread | None = None
+
+    @classmethod
+    def shared(cls) -> "OutputPump":
+        """Return the pump shared by every connection of the process."""
+
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def run(
+        self,
+        channel: Any,
+        handle_line: Callable[[str, str], None],
+        idle_timeout: float | None = None,
+        timeout: float | None = None,
+    ) -> int:
+        """Pump ``channel`` until its command exits and return the exit code.
+
+        ``handle_line(stream, line)`` is called from the calling thread for
+        every line, with ``stream`` being ``STDOUT`` or ``STDERR``. Raises
+        ``CommandTimeout`` (after closing the channel) if no output arrives
+        for ``idle_timeout`` seconds or the command runs longer than
+        ``timeout`` seconds.
+        """
+
+        command = _Command(channel, idle_timeout, timeout)
+        with self._lock:
+            self._added.append(command)
+            if self._thread is None:
+                self._thread = Thread(target=self._loop, name="zdeploy-pump", daemon=True)
+                self._thread.start()
+        self._wakeup()
+
+        while True:
+            batch = command.queue.get()
+            # A paused command gets room in its queue again.
+            self._wakeup()
+            if batch is None:
+                break
+            stream, lines = batch
+            for line in lines:
+                handle_line(stream, line)
+
+        if command.error is not None:
+            raise command.error
+        # The exit status may arrive shortly after the end of the output.
+        remaining = command.expiry()
+        if remaining is not None:
+            remaining = max(0.0, remaining - time.monotonic())
+        if not channel.status_event.wait(remaining):
+            channel.close()
+            raise CommandTimeout("command did not report an exit status in time")
+        return channel.recv_exit_status()
+
+    def _wakeup(self) -> None:
+        """Interrupt the pump thread's wait."""
+
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:
+            pass  # A wakeup is already pending.
+
+    def _loop(self) -> None:
+        """Pump every registered channel, forever."""
+
+        while True:
+            with self._lock:
+                added, self._added = self._added, []
+            for command in added:
+                self._commands.append(command)
+                self._selector.register(command.channel, EVENT_READ, command)
+
+            expiries = [e for e in (c.expiry() for c in self._commands) if e is not None]
+            wait = max(0.0, min(expiries) - time.monotonic()) if expiries else None
+            for key, _ in self._selector.select(wait):
+                if key.data is None:
+                    os.read(self._wakeup_read, 4096)
+                    continue
+                try:
+                    self._read(key.data)
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Fail this command only; the pump keeps serving the others.
+                    key.data.error = exc
+                    self._finish(key.data)
+
+            now = time.monotonic()
+            for command in list(self._paused):
+                # Waiting on a slow consumer does not make a command idle.
+                command.last_activity = now
+                self._flush(command)
+            for command in list(self._commands):
+                expiry = command.expiry()
+                if not command.done and expiry is not None and now >= expiry:
+                    self._expire(command, now)
+
+    def _read(self, command: _Command) -> None:
+        """Drain the buffered output of ``command`` and queue complete lines."""
+
+        channel = command.channel
+        read = False
+        while channel.recv_ready():
+            self._split(command, STDOUT, channel.recv(CHUNK_SIZE))
+            read = True
+        while channel.recv_stderr_ready():
+            self._split(command, STDERR, channel.recv_stderr(CHUNK_SIZE))
+            read = True
+        if read:
+            command.last_activity = time.monotonic()
+        if channel.eof_received or channel.closed:
+            if not channel.recv_ready() and not channel.recv_stderr_ready():
+                self._finish(command)
+                return
+        self._flush(command)
+
+    def _split(self, command: _Command, stream: str, data: bytes) -> None:
+        """Append ``data`` to ``stream`` and queue every line it completes."""
+
+        data = command.partial[stream] + data
+        end = data.rfind(b"\n")
+        if end == -1 and len(data) > CHUNK_SIZE:
+            # Pass on overlong lines rather than buffering them indefinitely.
+            end = len(data)
+        if end == -1:
+            command.partial[stream] = data
+            return
+        command.partial[stream] = data[end + 1 :]
+        text = data[:end].decode("utf-8", errors="replace")
+        command.pending.append((stream, [line.rstrip("\r") for line in text.split("\n")]))
+
+    def _flush(self, command: _Command) -> None:
+        """Move pending batches to the command's queue, pausing it when full."""
+
+        while command.pending:
+            try:
+                command.queue.put_nowait(command.pending[0])
+            except Full:
+                if command not in self._paused:
+                    self._paused.append(command)
+                    if not command.done:
+                        self._selector.unregister(command.channel)
+                return
+            command.pending.pop(0)
+        if command in self._paused:
+            self._paused.remove(command)
+            if not command.done:
+                self._selector.register(command.channel, EVENT_READ, command)
+
+    def _finish(self, command: _Command) -> None:
+        """Stop pumping ``command`` and queue its last lines."""
+
+        for stream, rest in command.partial.items():
+            if rest:
+                command.pending.append((stream, [rest.decode("utf-8", errors="replace")]))
+        command.pending.append(None)
+        command.done = True
+        if command not in self._paused:
+            self._selector.unregister(command.channel)
+        self._commands.remove(command)
+        self._flush(command)
+
+    def _expire(self, command: _Command, now: float) -> None:
+        """Abort ``command`` after it exceeded a timeout."""
+
+        if command.deadline is not None and now >= command.deadline:
+            command.error = CommandTimeout("command exceeded its total timeout")
+        else:
+            command.error = CommandTimeout(
+                f"command produced no output for {command.idle_timeout} seconds"
+            )
+        self._finish(command)
+        command.channel.close()
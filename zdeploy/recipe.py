@@ -1,15 +1,20 @@
 """Recipe abstraction for deploying and tracking dependencies."""
 # pylint: disable=too-many-instance-attributes,too-few-public-methods,too-many-arguments,too-many-positional-arguments
 
-from os import listdir
 from pathlib import Path
-from hashlib import md5
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
+from subprocess import TimeoutExpired
 import logging
 
-from zdeploy.clients import SSH, SCP
 from zdeploy.shell import execute as shell_execute
 from zdeploy.config import Config
+from zdeploy.graph import DependencyGraph
+from zdeploy.hashing import HashCache
+from zdeploy.recipeindex import RecipeEntry, RecipeIndex
+from zdeploy.tracing import span
+
+if TYPE_CHECKING:
+    from zdeploy.clients import ConnectionPool
 
 
 class Recipe:
@@ -32,6 +37,9 @@ class Recipe:
         port: int,
         log: logging.Logger,
         cfg: Config,
+        hash_cache: HashCache | None = None,
+        graph: DependencyGraph | None = None,
+        index: RecipeIndex | None = None,
     ) -> None:
         """Initialize a recipe instance."""
 
@@ -53,12 +61,20 @@ class Recipe:
 
         self.cfg = cfg
         self.parent_recipe = parent_recipe
+        self.index = index if index is not None else RecipeIndex.for_path(cfg.recipes)
+        self.entry: RecipeEntry | None = None
         self._resolve_name_and_type(recipe)
         self.config = config
         self.hostname = hostname
         self.username = username
         self.password = password
         self.properties: Dict[str, str | None] = {}
+        self.hash_cache = (
+            hash_cache
+            if hash_cache is not None
+            else HashCache(algorithm=cfg.hash_algorithm, workers=cfg.hash_threads)
+        )
+        self.graph = graph if graph is not None else DependencyGraph(log)
 
     def set_property(self, key: str, value: str | None) -> None:
         """Store an arbitrary ``key``/``value`` pair."""
@@ -68,15 +84,11 @@ class Recipe:
     def _resolve_name_and_type(self, recipe: str) -> None:
         """Resolve ``recipe`` name and determine if it is defined or virtual."""
 
-        for r in listdir(self.cfg.recipes):
-            if recipe.lower() == r.lower():
-                self.recipe = r
-                if self.parent_recipe == r:
-                    # Recipe references itself
-                    self.log.error("Invalid recipe: %s references itself", r)
-                    raise ValueError("recipe references itself")
-                self._type = self.Type.DEFINED
-                return
+        self.entry = self.index.lookup(recipe)
+        if self.entry is not None:
+            self.recipe = self.entry.name
+            self._type = self.Type.DEFINED
+            return
         self.recipe = recipe
         self._type = self.Type.VIRTUAL
 
@@ -106,118 +118,194 @@ class Recipe:
 
         return self._type == self.Type.VIRTUAL
 
-    def deep_hash(self, dir_path: Path | None = None) -> str:
-        """Return an MD5 hash representing the recipe and its requirements."""
+    def deep_hash(self) -> str:
+        """Return a hash representing the recipe and its requirements."""
 
-        hashes = ""
+        key = f"{self.config} :: {self}"
+        cached = self.hash_cache.get_recipe_hash(key)
+        if cached is not None:
+            return cached
+
+        digest = self.hash_cache.digest
         if self._type == self.Type.VIRTUAL:
-            hashes = md5(self.recipe.encode()).hexdigest()
-        elif self._type == self.Type.DEFINED:
-            if dir_path is None:
-                dir_path = Path(self.cfg.recipes) / self.recipe
-
-                # Execute the hash script and copy its output into our hashes variable.
-                # NOTE: We perform this check specifically inside this block because when
-                # dir_path is None, we know we're at the main recipe directory path.
-                hash_path = dir_path / "hash"
-                if hash_path.is_file():
-                    cmd_out, cmd_rc = shell_execute(
-                        f"chmod +x {hash_path} && bash {self.config} && ./{hash_path}"
-                    )
-                    if cmd_rc != 0:
-                        raise RuntimeError(cmd_out)
-                    hashes += cmd_out
-
-            for recipe in self.load_requirements():
-                hashes += recipe.deep_hash()
-            hashes += md5(str(self).encode()).hexdigest()
-            for node in listdir(dir_path):
-                rel_path = dir_path / node
-                if rel_path.is_file():
-                    with rel_path.open("rb") as fp:
-                        file_hash = md5(fp.read()).hexdigest()
-                    hashes += file_hash
-                elif rel_path.is_dir():
-                    hashes += self.deep_hash(rel_path)
-        return md5(hashes.encode()).hexdigest()
+            result = digest(digest(self.recipe.encode()).encode())
+        else:
+            dir_path = Path(self.cfg.recipes) / self.recipe
+            # The hash script output is part of the hash.
+            hashes = self.hash_script_output()
+
+            # Requirement hashes and this recipe's identity prefix every
+            # directory level of the tree hash.
+            prefix = "".join(recipe.deep_hash() for recipe in self.graph.requirements(self))
+            prefix += digest(str(self).encode())
+            # Hash every changed file of the tree in parallel up front.
+            self.hash_cache.file_hashes(self._tree_files(dir_path))
+            result = digest((hashes + self._tree_content(dir_path, prefix)).encode())
+
+        self.hash_cache.set_recipe_hash(key, result)
+        return result
+
+    def hash_script_output(self) -> str:
+        """Return the output of this recipe's ``hash`` script ("" without one).
+
+        The script runs at most once per recipe and config for the lifetime
+        of the hash cache, no matter how many hosts or parents share it.
+        """
+
+        if self.entry is None or not self.entry.has_hash:
+            return ""
+        return self.hash_cache.script_output(
+            (self.recipe, str(self.config)), self._run_hash_script
+        )
+
+    def _run_hash_script(self) -> str:
+        """Run this recipe's ``hash`` script and return its output."""
+
+        hash_path = Path(self.cfg.recipes) / self.recipe / "hash"
+        timeout = self.cfg.hash_timeout or None
+        try:
+            with span("hash_script", recipe=self.recipe):
+                # hash_path always contains a slash, so it also runs when absolute.
+                cmd_out, cmd_rc = shell_execute(
+                    f"chmod +x {hash_path} && bash {self.config} && {hash_path}",
+                    timeout=timeout,
+                )
+        except TimeoutExpired as exc:
+            self.log.error("Hash script of '%s' timed out after %s seconds", self.recipe, timeout)
+            raise RuntimeError(
+                f"hash script of {self.recipe} timed out after {timeout} seconds"
+            ) from exc
+        if cmd_rc != 0:
+            self.log.error("Hash script of '%s' failed:\n%s", self.recipe, cmd_out)
+            raise RuntimeError(f"hash script of {self.recipe} exited with status {cmd_rc}")
+        return cmd_out
+
+    def _tree_files(self, dir_path: Path) -> List[Path]:
+        """Return every file in ``dir_path``, recursively."""
+
+        files: List[Path] = []
+        for name, is_file, is_dir in self.hash_cache.scandir(dir_path):
+            if is_file:
+                files.append(dir_path / name)
+            elif is_dir:
+                files.extend(self._tree_files(dir_path / name))
+        return files
+
+    def _tree_content(self, dir_path: Path, prefix: str) -> str:
+        """Return ``prefix`` followed by the names and hashes of every node in ``dir_path``.
+
+        Names are part of the content, so renaming a file changes the hash.
+        """
+
+        hashes = prefix
+        for name, is_file, is_dir in self.hash_cache.scandir(dir_path):
+            rel_path = dir_path / name
+            if is_file:
+                hashes += f"{name}:{self.hash_cache.file_hash(rel_path)};"
+            elif is_dir:
+                content = self._tree_content(rel_path, prefix).encode()
+                hashes += f"{name}/:{self.hash_cache.digest(content)};"
+        return hashes
+
+    def requirement(self, recipe: str) -> "Recipe":
+        """Return a requirement named ``recipe`` targeting this recipe's host."""
+
+        return Recipe(
+            recipe=recipe,
+            parent_recipe=self.recipe,
+            config=self.config,
+            hostname=self.hostname,
+            username=self.username,
+            password=self.password,
+            port=self.port,
+            log=self.log,
+            cfg=self.cfg,
+            hash_cache=self.hash_cache,
+            graph=self.graph,
+            index=self.index,
+        )
 
     def load_requirements(self) -> List["Recipe"]:
-        """Return a list of Recipe objects this recipe depends on."""
-
-        req_file = Path(self.cfg.recipes) / self.recipe / "require"
-        requirements: List["Recipe"] = []
-        if req_file.is_file():
-            with req_file.open("r", encoding="utf-8") as req_fp:
-                for requirement in req_fp.read().split("\n"):
-                    requirement = requirement.strip()
-                    if requirement == "" or requirement.startswith("#"):
-                        continue
-                    recipe = Recipe(
-                        recipe=requirement,
-                        parent_recipe=self.recipe,
-                        config=self.config,
-                        hostname=self.hostname,
-                        username=self.username,
-                        password=self.password,
-                        port=self.port,
-                        log=self.log,
-                        cfg=self.cfg,
-                    )
-                    for req in recipe.load_requirements():
-                        requirements.append(req)
-                    requirements.append(recipe)
-        return requirements
+        """Return every Recipe this recipe depends on, requirements first."""
 
-    def deploy(self) -> None:
-        """Deploy this recipe using SSH/SCP."""
+        return self.graph.closure(self)
+
+    def deploy(self, pool: "ConnectionPool | None" = None) -> None:
+        """Deploy this recipe using SSH/SCP.
+
+        The connection is taken from ``pool`` so recipes targeting the same
+        host share it; without a pool a private connection is opened and
+        closed again once the recipe is done. Failures are raised once the
+        remote recipe directory is cleaned up, so the recipe is never
+        recorded as deployed.
+        """
+
+        # The SSH stack is slow to import; only load it to actually deploy.
+        # pylint: disable=import-outside-toplevel
+        from zdeploy.clients import ConnectionPool
+        from zdeploy.transfer import upload
+
+        if pool is None:
+            with ConnectionPool.for_config(self.log, self.cfg) as private_pool:
+                self.deploy(private_pool)
+            return
 
         self.log.info(f"Deploying '{self.recipe}' to {self.hostname}")
-        ssh = SSH(
+        ssh = pool.get(
             recipe=self.recipe,
-            log=self.log,
             hostname=self.hostname,
             username=self.username,
             password=self.password,
             port=self.port,
         )
 
+        # Delta-synced recipe directories persist on the host between runs.
+        persistent = self.cfg.upload == "delta"
+        attributes = {"host": self.hostname, "recipe": self.recipe}
         if self._type == self.Type.DEFINED:
-            ssh.execute(f"rm -rf /opt/{self.recipe}", show_command=False)
-
-            transport = ssh.get_transport()
-            assert transport is not None
-            scp = SCP(transport)
-            scp.put(
-                str(Path(self.cfg.recipes) / self.recipe),
-                remote_path=f"/opt/{self.recipe}",
-                recursive=True,
-            )
-            scp.put(str(self.config), remote_path=f"/opt/{self.recipe}/config")
+            if not persistent:
+                with span("cleanup", **attributes):
+                    ssh.execute(
+                        f"rm -rf /opt/{self.recipe}", show_command=False, recipe=self.recipe
+                    )
+
+            with span("upload", **attributes):
+                upload(
+                    ssh,
+                    Path(self.cfg.recipes) / self.recipe,
+                    self.config,
+                    self.cfg,
+                    self.log,
+                    self.hash_cache,
+                )
 
         try:
             if self._type == self.Type.VIRTUAL:
-                ssh.execute(f"{self.cfg.installer} {self.recipe}")
+                with span("install", **attributes):
+                    ssh.execute(f"{self.cfg.installer} {self.recipe}", recipe=self.recipe)
             elif self._type == self.Type.DEFINED:
-                if not (Path(self.cfg.recipes) / self.recipe / "run").is_file():
+                if self.entry is None or not self.entry.has_run:
                     # Recipes with no run file are acceptable since they (may) have a require file
                     # and don't necessarily require the execution of anything of their own.
                     self.log.warning(
                         "Recipe '%s' has no run file; continuing", self.recipe
                     )
                 else:
-                    ssh.execute(
-                        f"cd /opt/{self.recipe} && chmod +x ./run && ./run",
-                        show_command=False,
-                    )
-            passed = True
-        except Exception as exc:  # pylint: disable=broad-except
-            self.log.error(str(exc))
-            passed = False
+                    with span("run", **attributes):
+                        ssh.execute(
+                            f"cd /opt/{self.recipe} && chmod +x ./run && ./run",
+                            show_command=False,
+                            recipe=self.recipe,
+                        )
+        except Exception:
+            self.log.error("Failed to deploy %s", self.recipe)
+            raise
         finally:
-            if self._type == self.Type.DEFINED:
+            if self._type == self.Type.DEFINED and not persistent:
                 self.log.info(f"Removing /opt/{self.recipe} from remote host")
-                ssh.execute(f"rm -rf /opt/{self.recipe}", show_command=False)
+                with span("cleanup", **attributes):
+                    ssh.execute(
+                        f"rm -rf /opt/{self.recipe}", show_command=False, recipe=self.recipe
+                    )
 
-        if not passed:
-            self.log.error("Failed to deploy %s", self.recipe)
         self.log.info("Done with %s", self.recipe)
@@ -0,0 +1,98 @@
+"""Cached, case-insensitive index of the recipes directory."""
+
+from dataclasses import dataclass
+from os import scandir, stat
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Tuple
+
+
+@dataclass(frozen=True)
+class RecipeEntry:
+    """A recipe directory and the special files it contains."""
+
+    name: str
+    path: Path
+    has_require: bool
+    has_run: bool
+    has_hash: bool
+
+
+class RecipeIndex:
+    """Case-insensitive lookup of recipe directories.
+
+    The directory is listed once and listed again only when its mtime
+    changes; the presence of ``require``, ``run`` and ``hash`` files is
+    cached per recipe and invalidated by the recipe directory's mtime.
+    Use ``for_path`` to share one index per recipes directory.
+    """
+
+    _instances: Dict[str, "RecipeIndex"] = {}
+    _instances_lock = Lock()
+
+    def __init__(self, path: Path | str) -> None:
+        """Create an index of the recipes directory at ``path``."""
+
+        self.path = Path(path)
+        self._lock = Lock()
+        self._mtime_ns: int | None = None
+        self._names: Dict[str, str] = {}
+        self._entries: Dict[str, Tuple[int, RecipeEntry]] = {}
+
+    @classmethod
+    def for_path(cls, path: Path | str) -> "RecipeIndex":
+        """Return the shared index of the recipes directory at ``path``."""
+
+        key = str(Path(path).absolute())
+        with cls._instances_lock:
+            index = cls._instances.get(key)
+            if index is None:
+                index = cls._instances[key] = cls(path)
+            return index
+
+    def _refresh(self) -> None:
+        """Re-list the recipes directory if it changed since the last listing."""
+
+        try:
+            mtime_ns = stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = -1
+        if mtime_ns == self._mtime_ns:
+            return
+        names: Dict[str, str] = {}
+        if mtime_ns != -1:
+            with scandir(self.path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        names.setdefault(entry.name.lower(), entry.name)
+        self._names = names
+        self._entries = {}
+        self._mtime_ns = mtime_ns
+
+    def lookup(self, name: str) -> RecipeEntry | None:
+        """Return the recipe directory matching ``name`` case-insensitively."""
+
+        with self._lock:
+            self._refresh()
+            actual = self._names.get(name.lower())
+            if actual is None:
+                return None
+            path = self.path / actual
+            try:
+                mtime_ns = stat(path).st_mtime_ns
+            except FileNotFoundError:
+                return None
+            cached = self._entries.get(actual)
+            if cached is not None and cached[0] == mtime_ns:
+                return cached[1]
+            with scandir(path) as entries:
+                files = {entry.name for entry in entries if entry.is_file()}
+            entry = RecipeEntry(
+                name=actual,
+                path=path,
+                has_require="require" in files,
+                has_run="run" in files,
+                has_hash="hash" in files,
+            )
+            self._entries[actual] = (mtime_ns, entry)
+            return entry
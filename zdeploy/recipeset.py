@@ -1,37 +1,74 @@
 """Helper for managing sets of ``Recipe`` objects."""
 
+from collections.abc import MutableSet
 from hashlib import md5
-from typing import Iterable
+from typing import Any, Dict, Iterable, Iterator, Set
 import logging
 
 from zdeploy.config import Config
+from zdeploy.graph import DependencyGraph
 from zdeploy.recipe import Recipe
 
 
-class RecipeSet(set[Recipe]):
-    """Container for ``Recipe`` objects with convenience helpers."""
+class RecipeSet(MutableSet[Recipe]):
+    """Container for ``Recipe`` objects with convenience helpers.
 
-    def __init__(self, cfg: Config, log: logging.Logger) -> None:
+    Iteration follows insertion order rather than set-hash order, so a set
+    filled from a ``DependencyGraph`` yields requirements before dependents.
+    Recipes are kept as the keys of a dict, which keeps that order through
+    every set operation, removals included.
+    """
+
+    def __init__(
+        self, cfg: Config, log: logging.Logger, graph: DependencyGraph | None = None
+    ) -> None:
         """Create an empty ``RecipeSet`` using ``cfg`` and ``log``."""
 
-        super().__init__()
         self.cfg = cfg
         self.log = log
+        self.graph = graph if graph is not None else DependencyGraph(log)
+        self._recipes: Dict[Recipe, None] = {}
+
+    @classmethod
+    def _from_iterable(cls, it: Iterable[Any]) -> Set[Any]:
+        """Return the result of a binary set operation as a plain set."""
+
+        return set(it)
+
+    def __contains__(self, recipe: object) -> bool:
+        """Return whether ``recipe`` is in the set."""
+
+        return recipe in self._recipes
+
+    def __iter__(self) -> Iterator[Recipe]:
+        """Iterate over recipes in the order they were added."""
 
-    def update(self, recipes: Iterable[Recipe]) -> None:  # type: ignore[override]
+        return iter(self._recipes)
+
+    def __len__(self) -> int:
+        """Return the number of recipes."""
+
+        return len(self._recipes)
+
+    def update(self, recipes: Iterable[Recipe]) -> None:
         """Add a sequence of ``recipes`` to the set."""
 
         for recipe in recipes:
             self.add(recipe)
 
-    def add(self, recipe: Recipe) -> None:  # type: ignore[override]
+    def discard(self, recipe: Recipe) -> None:  # pylint: disable=arguments-renamed
+        """Remove ``recipe`` if present."""
+
+        self._recipes.pop(recipe, None)
+
+    def add(self, recipe: Recipe) -> None:  # pylint: disable=arguments-renamed
         """Add a single ``recipe`` if not already present."""
 
         if recipe in self:
             self.log.warning("Recipe '%s' is already added; skipping", recipe.name)
             return
         self.log.info("Registering recipe '%s'", recipe.name)
-        super().add(recipe)
+        self._recipes[recipe] = None
         if recipe.is_virtual():
             self.log.warning(
                 (
@@ -54,4 +91,4 @@ class RecipeSet(set[Recipe]):
     def get_hash(self) -> str:
         """Return an MD5 hash of all recipes combined."""
 
-        return md5(" ".join(str(recipe) for recipe in self).encode()).hexdigest()
+        return md5(" ".join(sorted(str(recipe) for recipe in self)).encode()).hexdigest()
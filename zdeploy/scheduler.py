@@ -0,0 +1,215 @@
+"""Concurrent, dependency-aware task scheduler."""
+# pylint: disable=too-few-public-methods
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from math import ceil
+from typing import Callable, Dict, Generic, Hashable, Iterable, List, Set, Tuple, TypeVar
+import logging
+
+T = TypeVar("T", bound=Hashable)
+
+
+class Status:
+    """Outcome of a scheduled task."""
+
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+def batch_limit(batch_size: str, size: int) -> int:
+    """Return how many of ``size`` tasks may run at once under ``batch_size``.
+
+    ``batch_size`` is either a number of tasks or a percentage such as
+    ``"25%"`` of ``size`` (rounded up); ``"0"`` means no limit.
+    """
+
+    batch_size = str(batch_size).strip()
+    if batch_size.endswith("%"):
+        percent = float(batch_size[:-1])
+        if not 0 <= percent <= 100:
+            raise ValueError(f"invalid batch size: {batch_size}")
+        limit = ceil(size * percent / 100) if percent else 0
+    else:
+        limit = int(batch_size)
+        if limit < 0:
+            raise ValueError(f"invalid batch size: {batch_size}")
+    return max(1, limit) if limit else size
+
+
+def chain_lengths(
+    tasks: List[T], requirements: Callable[[T], Iterable[T]], cost: Callable[[T], float]
+) -> Dict[T, float]:
+    """Return the cost of the longest chain of dependents starting at each task.
+
+    ``tasks`` must be in topological order; the largest value is the length
+    of the critical path, the least time the tasks need however many run
+    at once.
+    """
+
+    dependents: Dict[T, List[T]] = {task: [] for task in tasks}
+    for task in tasks:
+        for req in requirements(task):
+            if req in dependents:
+                dependents[req].append(task)
+    lengths: Dict[T, float] = {}
+    for task in reversed(tasks):
+        lengths[task] = cost(task) + max((lengths[d] for d in dependents[task]), default=0.0)
+    return lengths
+
+
+class Scheduler(Generic[T]):
+    """Run tasks concurrently while respecting their requirements.
+
+    At most ``jobs`` tasks run at once and at most ``host_jobs`` of them
+    target the same host. A task only starts once all of its requirements
+    have succeeded; when a task fails, every task depending on it
+    (directly or transitively) is skipped.
+
+    Tasks may also be grouped, e.g. one recipe rolled out to many hosts:
+    at most ``batch_size`` tasks of a group (see ``batch_limit``) run at
+    once, and once more than ``max_failures`` of them failed the rollout
+    of that group is aborted and its remaining tasks are skipped.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        jobs: int,
+        host_jobs: int,
+        log: logging.Logger,
+        batch_size: str = "0",
+        max_failures: int | None = None,
+    ) -> None:
+        """Create a scheduler limited to ``jobs`` workers."""
+
+        if jobs < 1:
+            raise ValueError("jobs must be at least 1")
+        if host_jobs < 1:
+            raise ValueError("host_jobs must be at least 1")
+        batch_limit(batch_size, 1)  # Validate early.
+        self.jobs = jobs
+        self.host_jobs = host_jobs
+        self.log = log
+        self.batch_size = batch_size
+        self.max_failures = max_failures
+
+    # pylint: disable=too-many-locals,too-many-statements,too-many-branches
+    def run(
+        self,
+        tasks: List[T],
+        requirements: Callable[[T], Iterable[T]],
+        host: Callable[[T], str],
+        work: Callable[[T], None],
+        name: Callable[[T], str] = str,
+        group: Callable[[T], Hashable] | None = None,
+        cost: Callable[[T], float] | None = None,
+    ) -> Dict[T, str]:
+        """Run ``work`` for every task in ``tasks`` and return their statuses.
+
+        ``tasks`` must be in topological order; ready tasks are started in
+        that order unless ``cost`` estimates how long each task takes, in
+        which case the tasks heading the longest chains start first.
+        ``group`` maps tasks to their rollout group (by default every task
+        is its own group).
+        """
+
+        position = {task: i for i, task in enumerate(tasks)}
+        lengths = chain_lengths(tasks, requirements, cost) if cost is not None else {}
+
+        def priority(task: T) -> Tuple[float, int]:
+            return (-lengths.get(task, 0.0), position[task])
+
+        waiting: Dict[T, int] = {}
+        dependents: Dict[T, List[T]] = {task: [] for task in tasks}
+        for task in tasks:
+            reqs = [req for req in requirements(task) if req in position]
+            waiting[task] = len(reqs)
+            for req in reqs:
+                dependents[req].append(task)
+
+        group_of: Callable[[T], Hashable] = group if group is not None else (lambda task: task)
+        members: Dict[Hashable, List[T]] = {}
+        for task in tasks:
+            members.setdefault(group_of(task), []).append(task)
+        group_limit = {
+            key: batch_limit(self.batch_size, len(group_tasks))
+            for key, group_tasks in members.items()
+        }
+        group_load: Dict[Hashable, int] = {}
+        group_failures: Dict[Hashable, int] = {}
+
+        statuses: Dict[T, str] = {}
+        ready: List[T] = sorted((task for task in tasks if waiting[task] == 0), key=priority)
+        running: Dict[Future[None], T] = {}
+        host_load: Dict[str, int] = {}
+
+        def skip_dependents(task: T) -> None:
+            stack = list(dependents[task])
+            while stack:
+                dependent = stack.pop()
+                if dependent in statuses:
+                    continue
+                statuses[dependent] = Status.SKIPPED
+                self.log.warning(
+                    "Skipping %s because %s did not succeed", name(dependent), name(task)
+                )
+                stack.extend(dependents[dependent])
+
+        def abort_rollout(key: Hashable, task: T) -> None:
+            failures = group_failures[key] = group_failures.get(key, 0) + 1
+            if self.max_failures is None or failures <= self.max_failures:
+                return
+            pending = [t for t in members[key] if t not in statuses and t not in running.values()]
+            if pending:
+                self.log.error(
+                    "Aborting rollout of %s after %d failure(s)", name(task), failures
+                )
+            for member in pending:
+                statuses[member] = Status.SKIPPED
+                skip_dependents(member)
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            try:
+                while ready or running:
+                    started: Set[T] = set()
+                    for task in ready:
+                        if len(running) >= self.jobs:
+                            break
+                        task_host = host(task)
+                        if host_load.get(task_host, 0) >= self.host_jobs:
+                            continue
+                        key = group_of(task)
+                        if group_load.get(key, 0) >= group_limit[key]:
+                            continue
+                        host_load[task_host] = host_load.get(task_host, 0) + 1
+                        group_load[key] = group_load.get(key, 0) + 1
+                        running[executor.submit(work, task)] = task
+                        started.add(task)
+                    ready = [task for task in ready if task not in started]
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task = running.pop(future)
+                        host_load[host(task)] -= 1
+                        group_load[group_of(task)] -= 1
+                        exc = future.exception()
+                        if exc is not None:
+                            self.log.error("Failed to deploy %s: %s", name(task), exc)
+                            statuses[task] = Status.FAILED
+                            skip_dependents(task)
+                            abort_rollout(group_of(task), task)
+                            continue
+                        statuses[task] = Status.SUCCEEDED
+                        for dependent in dependents[task]:
+                            waiting[dependent] -= 1
+                            if waiting[dependent] == 0 and dependent not in statuses:
+                                ready.append(dependent)
+                    # Tasks of an aborted rollout may have been skipped meanwhile.
+                    ready = [task for task in ready if task not in statuses]
+                    ready.sort(key=priority)
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+        return statuses
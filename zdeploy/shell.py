@@ -1,11 +1,18 @@
 """Simple shell helpers."""
 
+import os
+import signal
 import subprocess
 from typing import Tuple
 
 
-def execute(cmd: str) -> Tuple[str, int]:
-    """Execute ``cmd`` in a shell and return output and return code."""
+def execute(cmd: str, timeout: float | None = None) -> Tuple[str, int]:
+    """Execute ``cmd`` in a shell and return output and return code.
+
+    If ``cmd`` runs longer than ``timeout`` seconds, it is killed together
+    with every process it started and ``subprocess.TimeoutExpired`` is
+    raised.
+    """
 
     with subprocess.Popen(
         f"{cmd} 2>&1",
@@ -13,7 +20,13 @@ def execute(cmd: str) -> Tuple[str, int]:
         stderr=subprocess.PIPE,
         shell=True,
         universal_newlines=True,
+        start_new_session=True,
     ) as proc:
-        std_out, _ = proc.communicate()
+        try:
+            std_out, _ = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.communicate()
+            raise
         rc = proc.returncode
     return std_out, rc
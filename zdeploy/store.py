@@ -0,0 +1,238 @@
+"""SQLite-backed store of deployment records."""
+# pylint: disable=too-many-instance-attributes
+
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+import sqlite3
+import time
+
+from zdeploy.scheduler import Status
+
+# File name of the store inside the cache directory.
+STORE_NAME = "deployments.db"
+
+
+@dataclass(frozen=True)
+class Record:
+    """A single recipe deployment attempt."""
+
+    config: str
+    deployment: str
+    host: str
+    recipe: str
+    deep_hash: str
+    status: str
+    started: float
+    finished: float
+
+    @property
+    def duration(self) -> float:
+        """Return how long the deployment took, in seconds."""
+
+        return self.finished - self.started
+
+
+class DeploymentStore:
+    """Transactional record of which recipes were deployed where.
+
+    All writes are single atomic transactions against one SQLite database
+    in WAL mode, so concurrent workers and concurrent zdeploy processes can
+    share it safely. Lookups are served by an index.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS deployments (
+            id INTEGER PRIMARY KEY,
+            config TEXT NOT NULL,
+            deployment TEXT NOT NULL,
+            host TEXT NOT NULL,
+            recipe TEXT NOT NULL,
+            deep_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            started REAL NOT NULL,
+            finished REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS deployments_lookup
+            ON deployments (host, recipe, finished);
+        CREATE INDEX IF NOT EXISTS deployments_finished
+            ON deployments (finished);
+    """
+
+    COLUMNS = "config, deployment, host, recipe, deep_hash, status, started, finished"
+
+    def __init__(self, path: Path | str) -> None:
+        """Open (creating if needed) the store at ``path``."""
+
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(
+            str(self.path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def __enter__(self) -> "DeploymentStore":
+        """Return the store itself."""
+
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Close the store."""
+
+        self.close()
+
+    def close(self) -> None:
+        """Close the database connection."""
+
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, sql: str, params: Tuple[Any, ...] = ()) -> int:
+        """Run ``sql`` in its own transaction and return the affected row count."""
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(sql, params)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return cursor.rowcount
+
+    def _read(self, sql: str, params: Tuple[Any, ...] = ()) -> List[Tuple[Any, ...]]:
+        """Return the rows selected by ``sql``."""
+
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def is_deployed(self, host: str, recipe: str, deep_hash: str) -> bool:
+        """Return ``True`` if the latest attempt of ``recipe`` on ``host`` succeeded
+        with ``deep_hash``.
+
+        Only the most recent attempt counts: deploying another version in
+        between means the host no longer runs ``deep_hash``.
+        """
+
+        return self.latest(host, recipe) == (deep_hash, Status.SUCCEEDED)
+
+    def latest(self, host: str, recipe: str) -> Tuple[str, str] | None:
+        """Return the deep hash and status of the latest attempt of ``recipe`` on ``host``.
+
+        Return ``None`` if ``recipe`` was never attempted on ``host``.
+        """
+
+        rows = self._read(
+            "SELECT deep_hash, status FROM deployments WHERE host = ? AND recipe = ?"
+            " ORDER BY finished DESC, id DESC LIMIT 1",
+            (host, recipe),
+        )
+        return (rows[0][0], rows[0][1]) if rows else None
+
+    def record(self, record: Record) -> None:
+        """Store ``record``."""
+
+        self._write(
+            f"INSERT INTO deployments ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record.config,
+                record.deployment,
+                record.host,
+                record.recipe,
+                record.deep_hash,
+                record.status,
+                record.started,
+                record.finished,
+            ),
+        )
+
+    def durations(self, samples: int = 5) -> Dict[Tuple[str, str], float]:
+        """Return the mean duration, in seconds, of the latest ``samples``
+        successful deployments of each (host, recipe).
+
+        Zero-length records, which only note that a recipe was found
+        deployed, are left out.
+        """
+
+        rows = self._read(
+            "SELECT host, recipe, AVG(finished - started) FROM ("
+            " SELECT host, recipe, started, finished, ROW_NUMBER() OVER ("
+            "  PARTITION BY host, recipe ORDER BY finished DESC, id DESC"
+            " ) AS position FROM deployments WHERE status = ? AND finished > started"
+            ") WHERE position <= ? GROUP BY host, recipe",
+            (Status.SUCCEEDED, samples),
+        )
+        return {(host, recipe): duration for host, recipe, duration in rows}
+
+    def collect_garbage(self, max_age: float | None, max_records: int | None) -> int:
+        """Delete superseded records older than ``max_age`` seconds or beyond
+        the ``max_records`` most recent ones of each (host, recipe).
+
+        The latest record of every (host, recipe) is always kept, since it
+        decides whether the recipe is deployed.
+        """
+
+        clauses: List[str] = []
+        params: List[Any] = []
+        if max_records is not None:
+            clauses.append("position > ?")
+            params.append(max_records)
+        if max_age is not None:
+            clauses.append("finished < ?")
+            params.append(time.time() - max_age)
+        if not clauses:
+            return 0
+        return self._write(
+            "DELETE FROM deployments WHERE id IN ("
+            " SELECT id FROM ("
+            "  SELECT id, finished, ROW_NUMBER() OVER ("
+            "   PARTITION BY host, recipe ORDER BY finished DESC, id DESC"
+            "  ) AS position FROM deployments"
+            f" ) WHERE position > 1 AND ({' OR '.join(clauses)})"
+            ")",
+            tuple(params),
+        )
+
+    def query(
+        self,
+        config: str | None = None,
+        host: str | None = None,
+        recipe: str | None = None,
+        limit: int | None = None,
+    ) -> List[Record]:
+        """Return matching records, most recent first."""
+
+        clauses: List[str] = []
+        params: List[Any] = []
+        for column, value in (("config", config), ("host", host), ("recipe", recipe)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        sql = f"SELECT {self.COLUMNS} FROM deployments"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY finished DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [Record(*row) for row in self._read(sql, tuple(params))]
+
+    def prune(self, older_than: float | None = None, config: str | None = None) -> int:
+        """Delete records older than ``older_than`` seconds (all if ``None``)."""
+
+        clauses: List[str] = []
+        params: List[Any] = []
+        if older_than is not None:
+            clauses.append("finished < ?")
+            params.append(time.time() - older_than)
+        if config is not None:
+            clauses.append("config = ?")
+            params.append(config)
+        sql = "DELETE FROM deployments"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self._write(sql, tuple(params))
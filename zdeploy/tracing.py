@@ -0,0 +1,166 @@
+"""Span tracing of deployment phases, exported in Chrome trace-event format."""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from json import dumps
+from os import getpid
+from pathlib import Path
+from threading import Lock, get_native_id
+from typing import Any, Callable, Dict, Iterator, List, Tuple, TypeVar
+import time
+
+R = TypeVar("R")
+
+# Tracer of the deployment running in the current context, if any.
+_current: ContextVar["Tracer | None"] = ContextVar("zdeploy_tracer", default=None)
+
+
+@dataclass(frozen=True)
+class Span:
+    """A timed phase of a deployment."""
+
+    name: str
+    start: float
+    end: float
+    thread: int
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        """Return how long the span lasted, in seconds."""
+
+        return self.end - self.start
+
+
+class Tracer:
+    """Collect the spans of one deployment from every thread working on it.
+
+    Spans are opened with the module-level ``span`` function while the
+    tracer is active (see ``activate``); work handed to other threads must
+    be wrapped with ``propagate`` to be traced as well.
+    """
+
+    def __init__(self) -> None:
+        """Create a tracer without spans; its clock starts now."""
+
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = Lock()
+
+    @contextmanager
+    def activate(self) -> Iterator["Tracer"]:
+        """Trace spans opened in the current context into this tracer."""
+
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def add(self, name: str, start: float, end: float, attributes: Dict[str, Any]) -> None:
+        """Record a span of the calling thread."""
+
+        with self._lock:
+            self.spans.append(Span(name, start, end, get_native_id(), attributes))
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Return the spans as a Chrome trace-event document.
+
+        The document loads in ``chrome://tracing`` and Perfetto; times are
+        in microseconds since the tracer was created.
+        """
+
+        pid = getpid()
+        with self._lock:
+            spans = list(self.spans)
+        events = [
+            {
+                "name": item.name,
+                "cat": "zdeploy",
+                "ph": "X",
+                "ts": round((item.start - self.origin) * 1e6, 3),
+                "dur": round(item.duration * 1e6, 3),
+                "pid": pid,
+                "tid": item.thread,
+                "args": item.attributes,
+            }
+            for item in spans
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self, top: int = 10) -> List[str]:
+        """Return text lines listing where the time went.
+
+        Phases are ranked by their total time, summed over every thread,
+        followed by the ``top`` slowest individual spans.
+        """
+
+        with self._lock:
+            spans = list(self.spans)
+        phases: Dict[str, Tuple[int, float, float]] = {}
+        for item in spans:
+            count, total, longest = phases.get(item.name, (0, 0.0, 0.0))
+            phases[item.name] = (count + 1, total + item.duration, max(longest, item.duration))
+
+        lines = [f"{'phase':<16} {'count':>7} {'total':>10} {'max':>10}"]
+        for name, (count, total, longest) in sorted(
+            phases.items(), key=lambda item: item[1][1], reverse=True
+        )[:top]:
+            lines.append(f"{name:<16} {count:>7} {total:>9.3f}s {longest:>9.3f}s")
+        lines.append("")
+        lines.append("Slowest spans:")
+        for item in sorted(spans, key=lambda item: item.duration, reverse=True)[:top]:
+            attributes = " ".join(f"{key}={value}" for key, value in item.attributes.items())
+            lines.append(f"{item.duration:>9.3f}s  {item.name}  {attributes}".rstrip())
+        return lines
+
+    def write(self, path: Path) -> Tuple[Path, Path]:
+        """Write the trace to ``path`` and its summary next to it.
+
+        Return the paths of the trace (``.trace.json``) and summary
+        (``.trace.txt``) files.
+        """
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        trace_path = path.with_name(f"{path.name}.trace.json")
+        summary_path = path.with_name(f"{path.name}.trace.txt")
+        trace_path.write_text(dumps(self.chrome_trace()), encoding="utf-8")
+        summary_path.write_text("\n".join(self.summary()) + "\n", encoding="utf-8")
+        return trace_path, summary_path
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """Time the enclosed block as span ``name`` of the active tracer.
+
+    Without an active tracer the block simply runs untraced.
+    """
+
+    tracer = _current.get()
+    if tracer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.add(name, start, time.perf_counter(), attributes)
+
+
+def propagate(function: Callable[..., R]) -> Callable[..., R]:
+    """Return ``function`` bound to the tracer active in the calling context.
+
+    Threads do not inherit context variables, so work submitted to a thread
+    pool is wrapped with this to keep it traced.
+    """
+
+    tracer = _current.get()
+    if tracer is None:
+        return function
+
+    def run(*args: Any, **kwargs: Any) -> R:
+        with tracer.activate():
+            return function(*args, **kwargs)
+
+    return run
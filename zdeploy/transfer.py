@@ -0,0 +1,299 @@
+"""Helpers for uploading recipe directories to remote hosts."""
+
+from contextlib import contextmanager
+from hashlib import md5
+from json import dumps, loads
+from os import walk
+from pathlib import Path
+from shlex import quote
+from shutil import copyfileobj
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+import logging
+import tarfile
+
+from paramiko.channel import Channel, ChannelFile
+from paramiko.ssh_exception import SSHException
+
+from zdeploy.bundles import BundleCache
+from zdeploy.clients import SSH, SCP
+from zdeploy.config import Config
+from zdeploy.hashing import HashCache
+
+# Remote tar flag for each supported compression.
+COMPRESSION_FLAGS = {"none": "", "gz": "z", "bz2": "j", "xz": "J"}
+
+# Size of the chunks prebuilt archives are sent in.
+CHUNK_SIZE = 1 << 20
+
+# Largest config written by the extraction command itself rather than by a
+# command of its own.
+INLINE_CONFIG_SIZE = 16 << 10
+
+# Remote directory holding the manifests of delta-synced recipes.
+MANIFEST_DIR = "/opt/.zdeploy"
+
+
+def run_command(ssh: SSH, cmd: str, data: bytes = b"") -> Tuple[int, bytes, bytes]:
+    """Run ``cmd`` with ``data`` on stdin; return exit code, stdout and stderr."""
+
+    transport = ssh.get_transport()
+    assert transport is not None
+    channel = transport.open_session()
+    try:
+        channel.exec_command(cmd)
+        if data:
+            channel.sendall(data)
+        channel.shutdown_write()
+        out = channel.makefile("rb").read()
+        err = channel.makefile_stderr("rb").read()
+        return channel.recv_exit_status(), out, err
+    finally:
+        channel.close()
+
+
+def _send_tar(
+    ssh: SSH,
+    dest: str,
+    members: List[Tuple[Path, str]] | BinaryIO,
+    compression: str,
+    then: str = "",
+) -> None:
+    """Stream ``members`` (local path, archive name) into ``dest`` as one archive.
+
+    ``members`` may also be an open archive already compressed with
+    ``compression``, which is then sent as is. ``then`` is a command run
+    once the archive is extracted.
+    """
+
+    if compression not in COMPRESSION_FLAGS:
+        raise ValueError(f"unsupported compression: {compression}")
+    flag = COMPRESSION_FLAGS[compression]
+
+    transport = ssh.get_transport()
+    assert transport is not None
+    channel = transport.open_session()
+    try:
+        channel.exec_command(
+            f"mkdir -p {dest} && tar -x{flag}f - --no-same-owner -C {dest}"
+            + (f" && {then}" if then else "")
+        )
+        try:
+            _write_archive(channel, members, compression)
+        except OSError:
+            if not (channel.closed or channel.exit_status_ready()):
+                # A local file could not be read while the remote tar still
+                # waits for input; closing the channel ends it.
+                raise
+            # The remote command exited early and closed the channel; its
+            # exit status and error output tell why.
+            streamed = False
+        else:
+            channel.shutdown_write()
+            streamed = True
+        rc = channel.recv_exit_status()
+        if rc != 0 or not streamed:
+            error = channel.makefile_stderr("rb").read().decode(errors="replace").strip()
+            raise RuntimeError(
+                f"failed to extract archive into {dest}: {error or f'exit code {rc}'}"
+            )
+    finally:
+        channel.close()
+
+
+def _write_archive(
+    channel: Channel, members: List[Tuple[Path, str]] | BinaryIO, compression: str
+) -> None:
+    """Write ``members``, or the prebuilt archive they are, to ``channel``."""
+
+    mode = "w|" if compression == "none" else f"w|{compression}"
+    with _channel_file(channel) as stream:
+        if not isinstance(members, list):
+            copyfileobj(members, stream, CHUNK_SIZE)
+        else:
+            with tarfile.open(fileobj=stream, mode=mode) as archive:  # type: ignore[call-overload]
+                for path, arcname in members:
+                    archive.add(str(path), arcname=arcname)
+
+
+@contextmanager
+def _channel_file(channel: Channel) -> Iterator[ChannelFile]:
+    """Yield a file writing to ``channel``, closed even if the channel already is."""
+
+    stream = channel.makefile("wb")
+    try:
+        yield stream
+    finally:
+        try:
+            stream.close()
+        except (OSError, ValueError):
+            # Flushing into a channel closed by the remote end fails; the
+            # caller reports the remote error instead.
+            pass
+
+
+def upload_scp(ssh: SSH, src: Path, config: Path, dest: str) -> None:
+    """Upload ``src`` to ``dest`` file by file and ``config`` to ``dest/config``."""
+
+    transport = ssh.get_transport()
+    assert transport is not None
+    with SCP(transport) as scp:
+        scp.put(str(src), remote_path=dest, recursive=True)
+        scp.put(str(config), remote_path=f"{dest}/config")
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def upload_tar(
+    ssh: SSH,
+    src: Path,
+    config: Path,
+    dest: str,
+    compression: str = "gz",
+    bundles: BundleCache | None = None,
+    hash_cache: HashCache | None = None,
+) -> None:
+    """Stream ``src`` and ``config`` to ``dest`` as a single tar archive.
+
+    The archive is written straight into the stdin of ``tar -x`` running on
+    the remote host, so the whole directory costs one channel instead of a
+    round trip per file. File modes are preserved; ownership is not. With
+    ``bundles``, the archive of ``src`` is packed once and reused for every
+    host and config; ``config`` is then written by the extraction command,
+    or by a command of its own when it is too large to be inlined.
+    """
+
+    if bundles is not None:
+        data = config.read_bytes()
+        text = _inline_text(data)
+        with bundles.get(src, compression, hash_cache or HashCache()) as archive:
+            if text is not None:
+                then = f"printf %s {quote(text)} > {dest}/config"
+                _send_tar(ssh, dest, archive, compression, then)
+                return
+            _send_tar(ssh, dest, archive, compression)
+        rc, _, err = run_command(ssh, f"cat > {dest}/config", data)
+        if rc != 0:
+            raise RuntimeError(f"failed to write {dest}/config: {err.decode().strip()}")
+    else:
+        _send_tar(ssh, dest, [(src, "."), (config, "config")], compression)
+
+
+def _inline_text(data: bytes) -> str | None:
+    """Return ``data`` as text fit for a command line, or ``None`` if it is not."""
+
+    if len(data) > INLINE_CONFIG_SIZE or b"\0" in data:
+        return None
+    try:
+        return data.decode()
+    except UnicodeDecodeError:
+        return None
+
+
+def _manifest_path(dest: str) -> str:
+    """Return the remote manifest path of delta-synced directory ``dest``."""
+
+    return f"{MANIFEST_DIR}/{md5(dest.encode()).hexdigest()}.json"
+
+
+def local_manifest(src: Path, config: Path, hash_cache: HashCache) -> Dict[str, str]:
+    """Return ``{relative path: "digest:mode"}`` for every file to sync."""
+
+    manifest: Dict[str, str] = {}
+    files = [(config, "config")]
+    for root, _, names in walk(src):
+        for name in names:
+            path = Path(root) / name
+            files.append((path, path.relative_to(src).as_posix()))
+    for path, rel_path in files:
+        if rel_path == "config" and path != config:
+            # The deployment config always wins over a recipe's own file.
+            continue
+        mode = path.stat().st_mode & 0o7777
+        manifest[rel_path] = f"{hash_cache.file_hash(path)}:{mode:o}"
+    return manifest
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+def upload_delta(
+    ssh: SSH,
+    src: Path,
+    config: Path,
+    dest: str,
+    hash_cache: HashCache,
+    compression: str = "gz",
+) -> None:
+    """Bring ``dest`` in line with ``src`` by transferring only what changed.
+
+    ``dest`` persists between deployments. A manifest of per-file content
+    hashes is kept next to it on the remote host; files whose hash or mode
+    differ are streamed as one tar archive and files that no longer exist
+    locally are removed.
+    """
+
+    manifest_path = _manifest_path(dest)
+    rc, out, _ = run_command(ssh, f"test -d {dest} && cat {manifest_path}")
+    remote: Dict[str, str] = {}
+    if rc == 0:
+        try:
+            remote = loads(out.decode())
+        except ValueError:
+            remote = {}
+
+    local = local_manifest(src, config, hash_cache)
+    stale = sorted(set(remote) - set(local))
+    changed = [rel for rel, entry in local.items() if remote.get(rel) != entry]
+
+    if stale:
+        names = b"".join(rel.encode() + b"\0" for rel in stale)
+        rc, _, err = run_command(ssh, f"cd {dest} && xargs -0 rm -f --", names)
+        if rc != 0:
+            raise RuntimeError(f"failed to remove stale files from {dest}: {err.decode().strip()}")
+    if changed:
+        members = [(config if rel == "config" else src / rel, rel) for rel in changed]
+        _send_tar(ssh, dest, members, compression)
+
+    rc, _, err = run_command(
+        ssh,
+        f"mkdir -p {MANIFEST_DIR} && cat > {quote(manifest_path)}",
+        dumps(local, sort_keys=True).encode(),
+    )
+    if rc != 0:
+        raise RuntimeError(f"failed to write {manifest_path}: {err.decode().strip()}")
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def upload(
+    ssh: SSH,
+    src: Path,
+    config: Path,
+    cfg: Config,
+    log: logging.Logger,
+    hash_cache: HashCache | None = None,
+) -> None:
+    """Upload recipe directory ``src`` and ``config`` to ``/opt/<recipe>``.
+
+    Uses the mode selected by ``cfg.upload``; a failed streamed or delta
+    upload is retried with SCP.
+    """
+
+    dest = f"/opt/{src.name}"
+    if cfg.upload in ("tar", "delta"):
+        try:
+            if cfg.upload == "delta":
+                upload_delta(ssh, src, config, dest, hash_cache or HashCache(), cfg.compression)
+            else:
+                upload_tar(
+                    ssh,
+                    src,
+                    config,
+                    dest,
+                    cfg.compression,
+                    BundleCache.for_config(cfg),
+                    hash_cache,
+                )
+            return
+        except (RuntimeError, SSHException) as exc:
+            log.warning("Streaming upload of '%s' failed (%s); using SCP", src.name, exc)
+            ssh.execute(
+                f"rm -rf {dest} {_manifest_path(dest)}", show_command=False, recipe=src.name
+            )
+    upload_scp(ssh, src, config, dest)
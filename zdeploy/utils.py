@@ -2,7 +2,8 @@
 
 
 from datetime import timedelta
-from typing import Union
+from fnmatch import fnmatchcase
+from typing import Iterable, List, Union
 import logging
 
 
@@ -24,3 +25,19 @@ def reformat_time(time: Union[str, timedelta]) -> str:
         time = str(time)
     h, m, s = [int(float(x)) for x in time.split(":")]
     return f"{h}h, {m}m, and {s}s"
+
+
+def expand_patterns(patterns: Iterable[str], names: Iterable[str]) -> List[str]:
+    """Return the ``names`` matched by shell-style ``patterns``, in pattern order.
+
+    Raises ``ValueError`` naming the first pattern that matches nothing.
+    """
+
+    available = sorted(names)
+    matched: List[str] = []
+    for pattern in patterns:
+        hits = [name for name in available if fnmatchcase(name, pattern)]
+        if not hits:
+            raise ValueError(f"no config matches '{pattern}'")
+        matched.extend(hit for hit in hits if hit not in matched)
+    return matched
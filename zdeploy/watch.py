@@ -0,0 +1,136 @@
+"""Long-running deployment that follows changes to recipes and configs."""
+
+from argparse import Namespace
+from os import scandir
+from pathlib import Path
+from threading import Event
+from typing import Callable, Dict, List, Tuple
+import logging
+
+from zdeploy.clients import ConnectionPool
+from zdeploy.config import Config
+from zdeploy.hashing import HashCache
+
+# Modification time and size of every file under the watched directories.
+Snapshot = Dict[str, Tuple[int, int]]
+
+
+def snapshot(directories: List[Path]) -> Snapshot:
+    """Return the modification time and size of every file in ``directories``."""
+
+    files: Snapshot = {}
+    pending = [str(directory) for directory in directories]
+    while pending:
+        try:
+            entries = list(scandir(pending.pop()))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    pending.append(entry.path)
+                    continue
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            files[entry.path] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+class Watcher:
+    """Redeploy configs whenever the files of their recipes or configs change.
+
+    The hash cache and one connection pool per config live as long as the
+    watcher, so unchanged files are not hashed again and hosts are not
+    reconnected between deployments. Each deployment otherwise runs as
+    usual: only recipes whose deep hash changed, which includes the
+    recipes requiring them, are deployed again.
+    """
+
+    def __init__(
+        self,
+        configs: List[str],
+        args: Namespace,
+        cfg: Config,
+        deploy: Callable[..., None],
+    ) -> None:
+        """Watch ``configs``, deployed by ``deploy`` with the options of ``args``.
+
+        ``deploy`` is called like ``zdeploy.deploy_config``, which it
+        normally is.
+        """
+
+        self.deploy_config = deploy
+        self.configs = configs
+        self.args = args
+        self.cfg = cfg
+        self.hash_cache = HashCache(
+            Path(cfg.cache) / "hashes.json", cfg.hash_algorithm, cfg.hash_threads
+        )
+        self.pools: Dict[str, ConnectionPool] = {}
+        self._snapshot: Snapshot | None = None
+
+    def __enter__(self) -> "Watcher":
+        """Return the watcher itself."""
+
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Close every pooled connection."""
+
+        self.close()
+
+    def changed(self) -> bool:
+        """Return whether any recipe or config changed since the last call.
+
+        The first call always reports a change.
+        """
+
+        current = snapshot([Path(self.cfg.recipes), Path(self.cfg.configs)])
+        changed = current != self._snapshot
+        self._snapshot = current
+        return changed
+
+    def deploy(self) -> bool:
+        """Deploy every config once; return whether all of them succeeded."""
+
+        # Listings, deep hashes and hash script outputs may all be stale.
+        self.hash_cache.reset()
+        succeeded = True
+        for config_name in self.configs:
+            pool = self.pools.get(config_name)
+            if pool is None:
+                log = logging.getLogger(config_name)
+                pool = self.pools[config_name] = ConnectionPool.for_config(log, self.cfg)
+            try:
+                self.deploy_config(
+                    config_name, self.args, self.cfg, hash_cache=self.hash_cache, pool=pool
+                )
+            except Exception:  # pylint: disable=broad-except
+                # Already logged; the next change is deployed all the same.
+                succeeded = False
+        return succeeded
+
+    def cycle(self) -> bool:
+        """Deploy every config if anything changed; return whether it did."""
+
+        if not self.changed():
+            return False
+        self.deploy()
+        return True
+
+    def run(self, interval: float, stop: Event | None = None) -> None:
+        """Check for changes every ``interval`` seconds until ``stop`` is set."""
+
+        stop = stop or Event()
+        while not stop.is_set():
+            if self.cycle():
+                print(f"Watching {self.cfg.recipes} and {self.cfg.configs} for changes")
+            stop.wait(interval)
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+
+        for pool in self.pools.values():
+            pool.close()
+        self.pools.clear()